@@ -3,6 +3,8 @@ Django settings for CodeQuest project.
 """
 
 import os
+import shlex
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -107,7 +109,130 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    # Judge results keyed by (code, language, tests fingerprint). LocMemCache
+    # evicts least-recently-used entries once MAX_ENTRIES is reached.
+    'judge': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'judge-results',
+        'TIMEOUT': int(os.environ.get('JUDGE_CACHE_TIMEOUT', '86400')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('JUDGE_CACHE_MAX_ENTRIES', '2000')),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    # Judge admission counters (my_app/admission.py), shared by every web
+    # process that uses the same cache: set JUDGE_ADMISSION_REDIS_URL when
+    # running more than one. Local memory only counts this process.
+    'admission': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['JUDGE_ADMISSION_REDIS_URL'],
+    } if os.environ.get('JUDGE_ADMISSION_REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'judge-admission',
+    },
+}
+
+# ── Judge ─────────────────────────────────────────────────────────────────────
+# Student code runs in a pool of pre-forked judge processes, never in the web
+# worker. JUDGE_POOL_SIZE=0 runs it in-process instead (local debugging only).
+JUDGE_POOL_SIZE = int(os.environ.get('JUDGE_POOL_SIZE', '4'))
+# Each judge process is replaced after this many jobs (0 = never).
+JUDGE_MAX_JOBS_PER_WORKER = int(os.environ.get('JUDGE_MAX_JOBS_PER_WORKER', '200'))
+# Seconds of slack per test, on top of the challenge's time limit, a web worker
+# waits for a judge process before giving up on it.
+JUDGE_JOB_TIMEOUT = float(os.environ.get('JUDGE_JOB_TIMEOUT', '5'))
+# Most judge processes a single submission's tests are spread across.
+JUDGE_MAX_PARALLEL_TESTS = int(os.environ.get('JUDGE_MAX_PARALLEL_TESTS', '4'))
+# multiprocessing start method ('fork', 'forkserver', 'spawn'); '' = platform default.
+# 'forkserver' starts judge processes from a server that preloads the judge
+# modules only, so they don't carry a copy of the web process.
+JUDGE_START_METHOD = os.environ.get('JUDGE_START_METHOD', '')
+# Run every Python test in its own fork of the (pre-warmed) judge process, so
+# nothing one test does to the process can affect the next.
+JUDGE_FORK_PER_JOB = os.environ.get('JUDGE_FORK_PER_JOB', 'True') == 'True'
+# "interpreters" runs Python tests in subinterpreters of the judge_worker
+# process instead of the process pool (Python 3.13+, otherwise ignored; web
+# processes always use the pool). Cheaper, but no memory limit per test: the
+# worker's whole address space is capped at JUDGE_INTERPRETER_MEMORY_MB
+# instead, see my_app/subinterpreters.py.
+JUDGE_PYTHON_BACKEND = os.environ.get('JUDGE_PYTHON_BACKEND', 'processes')
+JUDGE_INTERPRETER_MEMORY_MB = int(os.environ.get('JUDGE_INTERPRETER_MEMORY_MB', '4096'))
+# Stop grading a submission at its first failed test (challenges can override).
+JUDGE_FAIL_FAST = os.environ.get('JUDGE_FAIL_FAST', 'True') == 'True'
+# Fail-fast runs the tests that fail most often first; those counts are
+# written to the database after this many graded submissions or seconds.
+JUDGE_TEST_STATS_BATCH = int(os.environ.get('JUDGE_TEST_STATS_BATCH', '20'))
+JUDGE_TEST_STATS_FLUSH_SECONDS = float(os.environ.get('JUDGE_TEST_STATS_FLUSH_SECONDS', '60'))
+# Queue submissions for the `judge_worker` command instead of judging them
+# inside the request; the editor polls for the result.
+JUDGE_ASYNC_SUBMISSIONS = os.environ.get('JUDGE_ASYNC_SUBMISSIONS', 'False') == 'True'
+# Admission control for judging in the request, across all web processes
+# sharing the 'admission' cache (see my_app/admission.py): requests judging
+# at once, requests waiting for a turn and for how long, before the view
+# answers 429 "busy".
+JUDGE_MAX_IN_FLIGHT = int(os.environ.get('JUDGE_MAX_IN_FLIGHT', str(max(1, JUDGE_POOL_SIZE))))
+JUDGE_MAX_QUEUED = int(os.environ.get('JUDGE_MAX_QUEUED', '32'))
+JUDGE_QUEUE_TIMEOUT = float(os.environ.get('JUDGE_QUEUE_TIMEOUT', '10'))
+# Of the waiting places, how many one classroom may fill.
+JUDGE_MAX_QUEUED_PER_CLASSROOM = int(os.environ.get('JUDGE_MAX_QUEUED_PER_CLASSROOM', str(max(1, JUDGE_MAX_QUEUED // 4))))
+# The same for "Run tests", which is admitted apart from submissions.
+JUDGE_INTERACTIVE_MAX_IN_FLIGHT = int(os.environ.get('JUDGE_INTERACTIVE_MAX_IN_FLIGHT', str(max(1, JUDGE_MAX_IN_FLIGHT // 2))))
+JUDGE_INTERACTIVE_MAX_QUEUED = int(os.environ.get('JUDGE_INTERACTIVE_MAX_QUEUED', str(JUDGE_MAX_QUEUED // 2)))
+# Runs or submissions one user may have in progress at once (0 = no limit).
+JUDGE_MAX_PER_USER = int(os.environ.get('JUDGE_MAX_PER_USER', '2'))
+# Seconds an admission slot is held at most; one held by a web process that
+# was killed comes back after this long. Keep it above the longest request.
+JUDGE_ADMISSION_TTL = int(os.environ.get('JUDGE_ADMISSION_TTL', '600'))
+# With JUDGE_ASYNC_SUBMISSIONS: submissions allowed in the queue, in all and
+# from one classroom (0 = no limit), and the Retry-After sent when it is full.
+JUDGE_MAX_PENDING = int(os.environ.get('JUDGE_MAX_PENDING', '1000'))
+JUDGE_MAX_PENDING_PER_CLASSROOM = int(os.environ.get('JUDGE_MAX_PENDING_PER_CLASSROOM', str(JUDGE_MAX_PENDING // 4)))
+JUDGE_QUEUE_RETRY_AFTER = int(os.environ.get('JUDGE_QUEUE_RETRY_AFTER', '5'))
+# Share of the judge pool each lane gets while several are busy (see
+# my_app/scheduler.py): "Run tests", submissions, rejudges.
+JUDGE_LANE_WEIGHTS = {
+    'interactive': int(os.environ.get('JUDGE_LANE_WEIGHT_INTERACTIVE', '8')),
+    'graded': int(os.environ.get('JUDGE_LANE_WEIGHT_GRADED', '4')),
+    'background': int(os.environ.get('JUDGE_LANE_WEIGHT_BACKGROUND', '1')),
 }
+# Highest judge weight a mentor can give their classroom (admins can set any):
+# within a lane, classrooms share the pool in proportion to their weights.
+JUDGE_MAX_CLASSROOM_WEIGHT = int(os.environ.get('JUDGE_MAX_CLASSROOM_WEIGHT', '10'))
+# Rejudges from the admin are queued for `judge_worker` (see my_app/rejudge.py).
+# The `rejudge` command judges in a pool of its own instead, of this many
+# processes, and it and its workers run at this nice level so they only get
+# CPU the web processes leave over.
+JUDGE_REJUDGE_POOL_SIZE = int(os.environ.get('JUDGE_REJUDGE_POOL_SIZE', '1'))
+JUDGE_BACKGROUND_NICE = int(os.environ.get('JUDGE_BACKGROUND_NICE', '10'))
+# Most a program may print per test; past it the test is "output limit exceeded".
+# Output is compared as it is printed, so large limits cost no memory.
+JUDGE_OUTPUT_LIMIT_KB = int(os.environ.get('JUDGE_OUTPUT_LIMIT_KB', '16384'))
+# Hidden test inputs/outputs larger than this are kept as files under
+# TEST_STORE_ROOT instead of in the database (see my_app/test_store.py).
+TEST_STORE_ROOT = os.environ.get('TEST_STORE_ROOT', str(BASE_DIR / 'test_store'))
+TEST_STORE_INLINE_LIMIT_KB = int(os.environ.get('TEST_STORE_INLINE_LIMIT_KB', '64'))
+# Compiled submissions (C, C++, Java, Go, ...) are kept here, keyed by a hash
+# of their source, and reused on reruns; the least recently used are pruned.
+JUDGE_ARTIFACT_DIR = os.environ.get('JUDGE_ARTIFACT_DIR', os.path.join(tempfile.gettempdir(), 'codequest-judge'))
+JUDGE_ARTIFACT_MAX_ENTRIES = int(os.environ.get('JUDGE_ARTIFACT_MAX_ENTRIES', '500'))
+# Languages other than Python run as child processes, and a child process
+# can do anything the judge's user can unless a jail stops it. They are off
+# unless listed here (comma-separated, e.g. "c,cpp,java") AND a jail is set:
+# JUDGE_JAIL_COMMAND is put in front of every compile and run, with "{dir}"
+# replaced by the build or artifact directory. It must run the program as
+# an unprivileged user with no network, a seccomp filter and an otherwise
+# empty, read-only root (toolchains bind-mounted read-only, "{dir}"
+# mounted at the same path), and keep the rlimits it is started with, e.g.
+#   nsjail --config /etc/codequest/judge.cfg --cwd {dir} --bindmount {dir} --
+JUDGE_PROCESS_LANGUAGES = [
+    language.strip() for language in os.environ.get('JUDGE_PROCESS_LANGUAGES', '').split(',') if language.strip()
+]
+JUDGE_JAIL_COMMAND = shlex.split(os.environ.get('JUDGE_JAIL_COMMAND', ''))
+
+# ── Leaderboard ───────────────────────────────────────────────────────────────
+# Users listed on the points leaderboard; anyone further down sees the users
+# just around them underneath.
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', '100'))
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -1,9 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth import get_user_model
+from . import rejudge
 from .models import (
     Classroom, ClassroomMembership, Challenge, Submission, Comment,
-    Badge, UserBadge, Tag, Profile
+    Badge, UserBadge, Tag, Profile, HiddenTest, RejudgeRequest
 )
 
 User = get_user_model()
@@ -48,8 +49,8 @@ admin.site.register(User, CustomUserAdmin)
 class ClassroomAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     list_filter = ['mentor', 'created_at']
-    list_display = ['name', 'mentor', 'created_at']
-    fields = ['name', 'description', 'mentor', 'created_at']
+    list_display = ['name', 'mentor', 'judge_weight', 'created_at']
+    fields = ['name', 'description', 'mentor', 'judge_weight', 'created_at']
     readonly_fields = ['created_at']
 
 admin.site.register(Classroom, ClassroomAdmin)
@@ -64,6 +65,15 @@ class ClassroomMembershipAdmin(admin.ModelAdmin):
 admin.site.register(ClassroomMembership, ClassroomMembershipAdmin)
 
 # ---------- Challenge ----------
+class HiddenTestInline(admin.TabularInline):
+    # inputs/outputs too large for the row are in the test store; their text
+    # fields stay empty, and typing into them replaces the stored file
+    model = HiddenTest
+    extra = 1
+    fields = ['position', 'input_text', 'output_text', 'input_file', 'output_file', 'input_size', 'output_size']
+    readonly_fields = ['input_file', 'output_file', 'input_size', 'output_size']
+
+
 class ChallengeAdmin(admin.ModelAdmin):
     search_fields = ['title', 'description', 'tags']
     list_filter = ['difficulty', 'classroom', 'created_at']
@@ -72,20 +82,41 @@ class ChallengeAdmin(admin.ModelAdmin):
         'title', 'slug', 'classroom', 'description',
         'input_description', 'output_description',
         'sample_input', 'sample_output', 'example_explanation',
-        'constraints', 'starter_code', 'hidden_tests',
+        'constraints', 'starter_code',
+        'time_limit_ms', 'memory_limit_mb', 'line_budget', 'fail_fast',
+        'checker', 'checker_epsilon', 'checker_code',
         'difficulty', 'tags','points', 'created_at'
     ]
     readonly_fields = ['created_at']
+    inlines = [HiddenTestInline]
+    actions = ['rejudge_submissions']
+
+    def rejudge_submissions(self, request, queryset):
+        # queued for `manage.py judge_worker`, never run in the request
+        queued = rejudge.enqueue(queryset, user=request.user)
+        self.message_user(request, f'{len(queued)} rejudge(s) queued; `manage.py judge_worker` runs them.')
+    rejudge_submissions.short_description = "Rejudge submissions against new and changed tests"
 
 admin.site.register(Challenge, ChallengeAdmin)
 
+# ---------- Rejudge requests ----------
+class RejudgeRequestAdmin(admin.ModelAdmin):
+    list_filter = ['status', 'created_at']
+    list_display = ['challenge', 'status', 'full', 'requested_by', 'summary', 'updated_at']
+    readonly_fields = ['summary', 'created_at', 'updated_at']
+
+admin.site.register(RejudgeRequest, RejudgeRequestAdmin)
+
 # ---------- Submission ----------
 class SubmissionAdmin(admin.ModelAdmin):
     search_fields = ['code']
     list_filter = ['status', 'language', 'challenge', 'user', 'created_at']
     list_display = ['user', 'challenge', 'status', 'language', 'created_at']
-    fields = ['user', 'challenge', 'code', 'status', 'language', 'created_at']
-    readonly_fields = ['created_at']
+    fields = [
+        'user', 'challenge', 'code', 'status', 'language', 'results',
+        'cpu_time_ms', 'wall_time_ms', 'lines_executed', 'peak_memory_kb', 'created_at'
+    ]
+    readonly_fields = ['results', 'cpu_time_ms', 'wall_time_ms', 'lines_executed', 'peak_memory_kb', 'created_at']
 
 admin.site.register(Submission, SubmissionAdmin)
 
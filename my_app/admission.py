@@ -0,0 +1,257 @@
+import itertools
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Submission
+
+
+# ---------- ADMISSION CONTROL ----------
+# Judging in the request (submit without JUDGE_ASYNC_SUBMISSIONS, "Run
+# tests") goes through here first. At most JUDGE_MAX_IN_FLIGHT requests
+# judge at once; the next JUDGE_MAX_QUEUED wait for a slot, for up to
+# JUDGE_QUEUE_TIMEOUT seconds; anyone past that, or with JUDGE_MAX_PER_USER
+# requests already in, gets JudgeBusy and the view answers 429 with a
+# Retry-After the editor waits out. Without this a burst of submissions all
+# starts at once, and the judge pool and the host thrash instead of working
+# through it at full speed.
+# The counts are kept in the "admission" cache (SharedCounters), so the
+# limits hold across every web process that shares it; within a process
+# waiting requests of one classroom get in in arrival order. Queued submissions
+# (JUDGE_ASYNC_SUBMISSIONS) never judge in the request; for them
+# check_queue() bounds the database queue instead.
+# Both are per classroom too: one classroom may only fill
+# JUDGE_MAX_QUEUED_PER_CLASSROOM of the waiting places (and
+# JUDGE_MAX_PENDING_PER_CLASSROOM of the database queue), and when a slot
+# frees up it goes to the classroom that has had the fewest turns, in
+# 1/judge_weight steps, not to whoever has waited longest. Otherwise a large
+# class submitting at once leaves a small one nothing but 429s.
+# "Run tests" is admitted separately from submissions, with its own
+# JUDGE_INTERACTIVE_MAX_IN_FLIGHT and JUDGE_INTERACTIVE_MAX_QUEUED, so a
+# student trying code out never waits behind a wave of graded submissions;
+# in the pool its jobs already go first (the "interactive" lane).
+
+# how often a waiting request checks for a slot another process gave back
+_POLL_SECONDS = 0.1
+
+
+class JudgeBusy(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.retry_after = retry_after  # whole seconds
+
+
+class SharedCounters:
+    # Bounded counters in a cache (Redis, Memcached, or local memory for a
+    # single process), kept as leases: taking one adds the first free key of
+    # "<name>:0" .. "<name>:<limit - 1>" (add() is atomic), giving it back
+    # deletes that key. Every lease expires on its own `timeout` seconds after
+    # it was taken, so one a killed process never gave back comes back then
+    # however busy the judge is; a single shared count would be kept alive by
+    # everyone else's traffic.
+    def __init__(self, cache, timeout, prefix="admission"):
+        self._cache = cache
+        self._timeout = timeout
+        self._prefix = prefix
+
+    def _keys(self, name, limit):
+        return [f"{self._prefix}:{name}:{index}" for index in range(limit)]
+
+    def get(self, name, limit):
+        return len(self._cache.get_many(self._keys(name, limit)))
+
+    def take(self, name, limit):
+        # -> the lease, or None if all `limit` are taken
+        for key in self._keys(name, limit):
+            if self._cache.add(key, 1, self._timeout):
+                return key
+        return None
+
+    def give_back(self, lease):
+        if lease is not None:
+            self._cache.delete(lease)
+
+
+class Slot:
+    # an admitted request; release() (or leaving the with block) frees it
+    def __init__(self, controller, leases):
+        self._controller = controller
+        self._leases = leases
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class AdmissionController:
+    # counters: a SharedCounters with "in_flight", "queued", one
+    # "queued:<classroom>" per classroom and one "user:<key>" per user
+    def __init__(self, max_in_flight, max_queued, max_per_user, queue_timeout, counters,
+                 max_queued_per_classroom=None):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queued = max_queued
+        self.max_queued_per_classroom = max_queued if max_queued_per_classroom is None else max_queued_per_classroom
+        self.max_per_user = max_per_user
+        self.queue_timeout = queue_timeout
+        self.counters = counters
+        self._waiting = {}  # classroom -> deque of this process's tickets, in arrival order
+        self._turns = {}  # classroom -> turns taken while others waited, in 1/weight steps
+        self._tickets = itertools.count()
+        self._started = {}  # slot -> when it got in
+        self._average_seconds = 1.0  # how long a request holds its slot, moving average
+        self._condition = threading.Condition()
+
+    def retry_after(self):
+        # time for everyone ahead to get through, at the current pace
+        ahead = self.counters.get("queued", self.max_queued) + 1
+        return max(1, math.ceil(self._average_seconds * ahead / self.max_in_flight))
+
+    def admit(self, user_key, share=(None, 1)):
+        # share: (classroom, weight), see judge.classroom_share
+        counters = self.counters
+        user_lease = None
+        if self.max_per_user:
+            user_lease = counters.take(f"user:{user_key}", self.max_per_user)
+            if user_lease is None:
+                raise JudgeBusy("You already have code running, wait for it to finish.", self.retry_after())
+        try:
+            with self._condition:
+                lease = None if self._waiting else counters.take("in_flight", self.max_in_flight)
+                if lease is None:
+                    lease = self._wait_for_slot(share)
+                slot = Slot(self, [lease, user_lease])
+                self._started[slot] = time.monotonic()
+                return slot
+        except BaseException:
+            counters.give_back(user_lease)
+            raise
+
+    def _wait_for_slot(self, share):
+        # called with the condition held; -> the "in_flight" lease once taken
+        classroom, weight = share
+        queued = self.counters.take("queued", self.max_queued)
+        if queued is None:
+            raise JudgeBusy("The judge is busy, try again shortly.", self.retry_after())
+        classroom_queued = self.counters.take(f"queued:{classroom}", self.max_queued_per_classroom)
+        if classroom_queued is None:
+            self.counters.give_back(queued)
+            raise JudgeBusy("Your class has too much code waiting to run, try again shortly.", self.retry_after())
+        if classroom not in self._waiting:
+            self._waiting[classroom] = deque()
+            self._turns[classroom] = min(self._turns.values(), default=0)
+        ticket = next(self._tickets)
+        self._waiting[classroom].append(ticket)
+        deadline = time.monotonic() + self.queue_timeout
+        lease = None
+        try:
+            while True:
+                if self._next_ticket() == ticket:
+                    lease = self.counters.take("in_flight", self.max_in_flight)
+                    if lease is not None:
+                        return lease
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise JudgeBusy("The judge is busy, try again shortly.", self.retry_after())
+                # a slot given back here wakes us up; one from another process is polled for
+                self._condition.wait(min(remaining, _POLL_SECONDS))
+        finally:
+            self._waiting[classroom].remove(ticket)
+            if lease is not None:
+                self._turns[classroom] += 1 / max(1, weight)
+            if not self._waiting[classroom]:
+                del self._waiting[classroom]  # an idle classroom banks no turns
+                del self._turns[classroom]
+            self.counters.give_back(queued)
+            self.counters.give_back(classroom_queued)
+            self._condition.notify_all()  # the next ticket may be at the front now
+
+    def _next_ticket(self):
+        # the oldest ticket of the classroom with the fewest turns
+        classroom = min(self._waiting, key=lambda classroom: (self._turns[classroom], self._waiting[classroom][0]))
+        return self._waiting[classroom][0]
+
+    def _release(self, slot):
+        for lease in slot._leases:
+            self.counters.give_back(lease)
+        with self._condition:
+            held = time.monotonic() - self._started.pop(slot)
+            self._average_seconds += 0.2 * (held - self._average_seconds)
+            self._condition.notify_all()
+
+
+_controllers = {}  # lane -> AdmissionController
+_controller_lock = threading.Lock()
+
+
+def get_controller(lane="graded"):
+    # lane: "interactive" for "Run tests", "graded" for submissions
+    with _controller_lock:
+        if lane not in _controllers:
+            if lane == "interactive":
+                max_in_flight, max_queued = settings.JUDGE_INTERACTIVE_MAX_IN_FLIGHT, settings.JUDGE_INTERACTIVE_MAX_QUEUED
+            else:
+                max_in_flight, max_queued = settings.JUDGE_MAX_IN_FLIGHT, settings.JUDGE_MAX_QUEUED
+            _controllers[lane] = AdmissionController(
+                max_in_flight,
+                max_queued,
+                settings.JUDGE_MAX_PER_USER,
+                settings.JUDGE_QUEUE_TIMEOUT,
+                SharedCounters(caches["admission"], settings.JUDGE_ADMISSION_TTL, f"admission:{lane}"),
+                min(max_queued, settings.JUDGE_MAX_QUEUED_PER_CLASSROOM),
+            )
+        return _controllers[lane]
+
+
+def admit(request, share=(None, 1), lane="graded"):
+    # -> Slot for the logged-in user; raises JudgeBusy
+    return get_controller(lane).admit(request.user.pk, share)
+
+
+class HoldingIterator:
+    # For streaming responses: keeps the slot until the body has been sent,
+    # or the client went away and Django closed the response. The iterable is
+    # closed first, so whatever it still does on close (a submission judged to
+    # the end and saved) runs inside the slot too.
+    def __init__(self, slot, iterable):
+        self._slot = slot
+        self._iterator = iter(iterable)
+
+    def __iter__(self):
+        try:
+            yield from self._iterator
+        finally:
+            self.close()
+
+    def close(self):
+        try:
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._slot.release()
+
+
+def check_queue(user, classroom_id):
+    # For JUDGE_ASYNC_SUBMISSIONS: the judge_worker queue is bounded too.
+    queued = Submission.objects.filter(status__in=["pending", "judging"])
+    if settings.JUDGE_MAX_PER_USER and queued.filter(user=user).count() >= settings.JUDGE_MAX_PER_USER:
+        raise JudgeBusy("You already have submissions waiting to be judged.", settings.JUDGE_QUEUE_RETRY_AFTER)
+    if (settings.JUDGE_MAX_PENDING_PER_CLASSROOM
+            and queued.filter(challenge__classroom_id=classroom_id).count() >= settings.JUDGE_MAX_PENDING_PER_CLASSROOM):
+        raise JudgeBusy("Your class has too many submissions waiting, try again shortly.",
+                        settings.JUDGE_QUEUE_RETRY_AFTER)
+    if settings.JUDGE_MAX_PENDING and queued.count() >= settings.JUDGE_MAX_PENDING:
+        raise JudgeBusy("The judge is busy, try again shortly.", settings.JUDGE_QUEUE_RETRY_AFTER)
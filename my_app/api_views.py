@@ -1,5 +1,6 @@
 from django.http import JsonResponse
-from .models import Classroom, Challenge, Submission, Comment, Badge, UserBadge, check_user_badges
+from .models import Classroom, Challenge, Submission, Comment, Badge, UserBadge, Profile
+from . import admission, judge
 import json
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -34,7 +35,7 @@ def submit_challenge_api(request, slug):
     if request.method != "POST":
         return JsonResponse({"error": "POST method required."}, status=400)
 
-    challenge = get_object_or_404(Challenge, slug=slug)
+    challenge = get_object_or_404(Challenge.objects.select_related("classroom"), slug=slug)
 
     try:
         data = json.loads(request.body)
@@ -46,36 +47,34 @@ def submit_challenge_api(request, slug):
     if not code:
         return JsonResponse({"error": "Code is required."}, status=400)
 
-    # إنشاء submission
-    submission = Submission.objects.create(
-        user=request.user,
-        challenge=challenge,
-        code=code,
-        language=language,
-        status="pending",
-        points_awarded=0
-    )
-
-    # تقييم الحل (منطق مؤقت للتحقق من الإجابة)
-    is_correct = False
-    if challenge.hidden_tests and "return" in code:
-        is_correct = True
+    if language not in {choice[0] for choice in Submission.LANGUAGE_CHOICES}:
+        language = "python"
 
-    # تحديد النقاط حسب الصعوبة
-    difficulty_points = {"Easy": 10, "Medium": 20, "Hard": 30}
-    points_awarded = difficulty_points.get(challenge.difficulty, 10) if is_correct else 0
-
-    # تحديث حالة الـSubmission
-    submission.status = "passed" if is_correct else "failed"
-    submission.points_awarded = points_awarded
-    submission.save()
-
-    # تحديث نقاط المستخدم والمستوى والبادجات عند النجاح
-    if is_correct:
-        profile = getattr(request.user, "profile", None)
+    # judged like a submission from the editor: points, stats and badges
+    # come from judge.save_judged, so a solve is only ever paid once
+    try:
+        slot = admission.admit(request, judge.classroom_share(challenge))
+    except admission.JudgeBusy as busy:
+        response = JsonResponse({"error": str(busy), "retry_after": busy.retry_after}, status=429)
+        response["Retry-After"] = str(busy.retry_after)
+        return response
+
+    with slot:
+        submission = Submission.objects.create(
+            user=request.user,
+            challenge=challenge,
+            code=code,
+            language=language,
+            status="judging",
+            attempt_number=Submission.objects.filter(user=request.user, challenge=challenge).count() + 1,
+        )
+        judge.judge_submission(submission)
+    is_correct = submission.status == "passed"
+
+    # تحديث مستوى المستخدم عند النجاح
+    if submission.points_awarded:
+        profile = Profile.objects.filter(user=request.user).first()
         if profile:
-            profile.points += points_awarded
-
             # حساب المستوى
             if profile.points < 50:
                 profile.level = "Beginner"
@@ -84,9 +83,7 @@ def submit_challenge_api(request, slug):
             else:
                 profile.level = "Advanced"
 
-            profile.save()
-
-        check_user_badges(request.user)
+            profile.save(update_fields=["level"])
 
     return JsonResponse({
         "submission": {
@@ -0,0 +1,128 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+
+from .models import Badge, Challenge, SolveCount, Submission, UserBadge
+
+
+# ---------- BADGE ENGINE ----------
+# Badges are earned by events, not by rescanning a user's submissions. When a
+# user solves a challenge for the first time, record_solve() bumps their
+# SolveCount for its classroom and looks only at the badges that solve can
+# earn: first solve, the challenge counts the new total has reached, and
+# completing that one classroom. Earned badges are inserted in one go. It
+# takes the same handful of queries however many badges there are.
+# refresh_users() puts counters and badges right from the submissions
+# themselves, for when solves were undone (rejudges) or written in bulk.
+
+def record_solve(submission):
+    # Call for a user's first solve of a challenge (award_points_for_submission),
+    # once the submission has been saved. -> badges earned
+    user_id = submission.user_id
+    classroom_id = submission.challenge.classroom_id
+    _bump(user_id, classroom_id)
+    return _award(user_id, classroom_id)
+
+
+def _bump(user_id, classroom_id):
+    counters = SolveCount.objects.filter(user_id=user_id, classroom_id=classroom_id)
+    if counters.update(solved=F("solved") + 1):
+        return
+    try:
+        with transaction.atomic():
+            SolveCount.objects.create(user_id=user_id, classroom_id=classroom_id, solved=1)
+    except IntegrityError:  # created by a concurrent solve meanwhile
+        counters.update(solved=F("solved") + 1)
+
+
+def _award(user_id, classroom_id):
+    counts = dict(SolveCount.objects.filter(user_id=user_id).values_list("classroom_id", "solved"))
+    total = sum(counts.values())
+
+    candidates = list(
+        Badge.objects.filter(
+            Q(requirement_type=Badge.FIRST_SOLVE)
+            | Q(requirement_type=Badge.CHALLENGE_COUNT, value__lte=total)
+            | Q(requirement_type=Badge.CLASSROOM_COMPLETE, value=classroom_id)
+        ).exclude(users=user_id)
+    )
+    if any(badge.requirement_type == Badge.CLASSROOM_COMPLETE for badge in candidates):
+        class_size = Challenge.objects.filter(classroom_id=classroom_id).count()
+        solved_in_class = counts.get(classroom_id, 0)
+        candidates = [
+            badge for badge in candidates
+            if badge.requirement_type != Badge.CLASSROOM_COMPLETE or 0 < class_size <= solved_in_class
+        ]
+
+    UserBadge.objects.bulk_create(
+        [UserBadge(user_id=user_id, badge=badge) for badge in candidates],
+        ignore_conflicts=True,
+    )
+    return candidates
+
+
+def rebuild_counters(user_ids):
+    # recounts these users' SolveCounts from their passed submissions
+    SolveCount.objects.filter(user_id__in=user_ids).delete()
+    rows = (
+        Submission.objects.filter(user_id__in=user_ids, status="passed")
+        .values("user_id", "challenge__classroom_id")
+        .annotate(solved=Count("challenge", distinct=True))
+    )
+    SolveCount.objects.bulk_create([
+        SolveCount(user_id=row["user_id"], classroom_id=row["challenge__classroom_id"], solved=row["solved"])
+        for row in rows
+    ])
+
+
+def refresh_users(user_ids):
+    # Recounts and grants or revokes badges so they match what each user
+    # has solved now. A fixed number of queries however many users there are.
+    # -> (badges granted, badges revoked)
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0, 0
+    with transaction.atomic():
+        rebuild_counters(user_ids)
+
+        badges = list(Badge.objects.all())
+        classroom_ids = [b.value for b in badges if b.requirement_type == Badge.CLASSROOM_COMPLETE]
+        solved = defaultdict(int)
+        solved_in_class = {}
+        for user_id, classroom_id, count in SolveCount.objects.filter(user_id__in=user_ids).values_list(
+            "user_id", "classroom_id", "solved"
+        ):
+            solved[user_id] += count
+            solved_in_class[user_id, classroom_id] = count
+        class_sizes = dict(
+            Challenge.objects.filter(classroom_id__in=classroom_ids)
+            .values("classroom_id").annotate(n=Count("id")).values_list("classroom_id", "n")
+        )
+
+        def earned(user_id, badge):
+            count = solved[user_id]
+            if badge.requirement_type == Badge.FIRST_SOLVE:
+                return count >= 1
+            if badge.requirement_type == Badge.CHALLENGE_COUNT:
+                return count >= badge.value
+            if badge.requirement_type == Badge.CLASSROOM_COMPLETE:
+                total = class_sizes.get(badge.value, 0)
+                return total > 0 and solved_in_class.get((user_id, badge.value), 0) >= total
+            return False
+
+        held = set(UserBadge.objects.filter(user_id__in=user_ids).values_list("user_id", "badge_id"))
+        granted = []
+        revoked = defaultdict(list)
+        for user_id in user_ids:
+            for badge in badges:
+                has = (user_id, badge.id) in held
+                if earned(user_id, badge) and not has:
+                    granted.append(UserBadge(user_id=user_id, badge=badge))
+                elif has and not earned(user_id, badge):
+                    revoked[badge.id].append(user_id)
+
+        UserBadge.objects.bulk_create(granted, ignore_conflicts=True)
+        for badge_id, ids in revoked.items():
+            UserBadge.objects.filter(badge_id=badge_id, user_id__in=ids).delete()
+    return len(granted), sum(len(ids) for ids in revoked.values())
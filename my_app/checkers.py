@@ -0,0 +1,281 @@
+import functools
+import hashlib
+import math
+import re
+from collections import Counter
+
+from . import test_store
+from .sandbox import SAFE_BUILTINS, compile_guarded
+
+
+# ---------- CHECKERS ----------
+# A checker decides whether a program's output is right for one test. Like
+# sandbox.py this runs inside the judge workers and stays Django-free.
+#
+# The output reaches a checker in pieces as the program prints it (see
+# sandbox.OutputSink): feed() returns False as soon as the output can no
+# longer be right, so the program is stopped early, and finish() gives the
+# verdict once it has exited. The built-in checkers only look at each piece
+# once, so they run in linear time and keep no more of the output than the
+# token or line being read. The expected output, which may be a multi-MB
+# test_store.StoredFile, is read the same way, a chunk at a time as the
+# output reaches it. A challenge picks its checker with a spec, see
+# Challenge.checker_spec():
+#   ("exact", None)            output.strip() == expected (the default)
+#   ("tokens", None)           same whitespace-separated tokens
+#   ("float", epsilon)         tokens, numbers equal within epsilon
+#   ("unordered_lines", None)  same lines in any order
+#   ("custom", source)         mentor-written check(input, expected, output)
+
+_WHITESPACE_OR_WORD_RE = re.compile(r"\s+|\S+")
+_WORD_RE = re.compile(r"\S+")
+
+
+def _split_tokens(text):
+    # -> (whole tokens, a last one that may continue in the next piece)
+    tokens = _WORD_RE.findall(text)
+    if tokens and not text[-1].isspace():
+        return tokens, tokens.pop()
+    return tokens, ""
+
+
+def _iter_tokens(data):
+    partial = ""
+    for text in test_store.iter_text(data):
+        tokens, partial = _split_tokens(partial + text)
+        yield from tokens
+    if partial:
+        yield partial
+
+
+class _Expected:
+    # the expected output as a cursor: only the part read ahead of what has
+    # been matched is in memory
+    def __init__(self, data):
+        self._chunks = test_store.iter_text(data)
+        self._buffer = ""
+        self._pos = 0
+
+    def _fill(self, n):
+        # -> whether n characters past the cursor are there
+        while len(self._buffer) - self._pos < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            self._buffer = self._buffer[self._pos:] + chunk
+            self._pos = 0
+        return True
+
+    def startswith(self, text, offset=0):
+        self._fill(offset + len(text))
+        return self._buffer.startswith(text, self._pos + offset)
+
+    def skip(self, n):
+        self._fill(n)
+        self._pos += n
+
+    def at_end(self):
+        return not self._fill(1)
+
+
+class CheckerError(Exception):
+    # the checker itself is broken, not the submission
+    pass
+
+
+class Checker:
+    error = None  # set when a custom checker fails
+
+    def __init__(self, test_input, expected_output):
+        self.test_input = test_input
+        self.expected = expected_output
+
+    def feed(self, text):
+        return True
+
+    def finish(self):
+        raise NotImplementedError
+
+
+class ExactChecker(Checker):
+    # same result as `output.strip() == expected`: leading whitespace is
+    # dropped, whitespace after the last expected character is ignored,
+    # everything in between must match exactly
+    def __init__(self, test_input, expected_output):
+        super().__init__(test_input, expected_output)
+        self._expected = _Expected(expected_output)  # the cursor is at what is matched so far
+        self._started = False  # seen the first non-whitespace character
+        self._spaces = 0  # length of the whitespace run since then
+        self._spaces_match = True  # ...and whether it matches the expected one
+
+    def feed(self, text):
+        expected = self._expected
+        for match in _WHITESPACE_OR_WORD_RE.finditer(text):
+            token = match.group()
+            if token[0].isspace():
+                if self._started:
+                    if self._spaces_match:
+                        self._spaces_match = expected.startswith(token, self._spaces)
+                    self._spaces += len(token)
+                continue
+
+            if self._spaces:
+                if not self._spaces_match:
+                    return False
+                expected.skip(self._spaces)
+                self._spaces = 0
+            self._started = True
+            if not expected.startswith(token):
+                return False
+            expected.skip(len(token))
+        return True
+
+    def finish(self):
+        return self._expected.at_end()
+
+
+class TokenChecker(Checker):
+    # whitespace-separated tokens, compared one by one; how they are spaced
+    # or split into lines does not matter
+    def __init__(self, test_input, expected_output):
+        super().__init__(test_input, expected_output)
+        self._expected_tokens = _iter_tokens(expected_output)
+        self._partial = ""  # a token that may continue in the next piece
+
+    def tokens_equal(self, actual, expected):
+        return actual == expected
+
+    def _check(self, token):
+        expected = next(self._expected_tokens, None)
+        return expected is not None and self.tokens_equal(token, expected)
+
+    def feed(self, text):
+        tokens, self._partial = _split_tokens(self._partial + text)
+        return all(self._check(token) for token in tokens)
+
+    def finish(self):
+        if self._partial and not self._check(self._partial):
+            return False
+        return next(self._expected_tokens, None) is None
+
+
+class FloatChecker(TokenChecker):
+    # numbers may differ by epsilon, absolute or relative to the expected
+    # value; any other token must match exactly
+    def __init__(self, test_input, expected_output, epsilon=1e-6):
+        super().__init__(test_input, expected_output)
+        self.epsilon = epsilon
+
+    def tokens_equal(self, actual, expected):
+        if actual == expected:
+            return True
+        try:
+            a, b = float(actual), float(expected)
+        except ValueError:
+            return False
+        return math.isclose(a, b, rel_tol=self.epsilon, abs_tol=self.epsilon)
+
+
+class UnorderedLinesChecker(Checker):
+    # the same lines in any order; surrounding whitespace and blank lines
+    # are ignored
+    def __init__(self, test_input, expected_output):
+        super().__init__(test_input, expected_output)
+        # the expected lines have to be counted up front; long ones are
+        # counted by digest, so this holds far less than the whole output
+        self._missing = Counter(
+            self._key(line) for line in test_store.iter_lines(expected_output) if line.strip()
+        )
+        self._missing_total = sum(self._missing.values())
+        self._partial = ""
+
+    @staticmethod
+    def _key(line):
+        line = line.strip()
+        return line if len(line) <= 64 else hashlib.blake2b(line.encode(), digest_size=16).digest()
+
+    def _check(self, line):
+        if not line.strip():
+            return True
+        line = self._key(line)
+        if self._missing[line] <= 0:
+            return False  # not expected, or once too often
+        self._missing[line] -= 1
+        self._missing_total -= 1
+        return True
+
+    def feed(self, text):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        return all(self._check(line) for line in lines)
+
+    def finish(self):
+        return self._check(self._partial) and self._missing_total == 0
+
+
+class CustomChecker(Checker):
+    # Mentor-written: check(input, expected, output) gets the whole output
+    # (bounded by the output limit) and returns whether it is right.
+    def __init__(self, test_input, expected_output, check):
+        super().__init__(test_input, expected_output)
+        self.check = check
+        self._pieces = []
+
+    def feed(self, text):
+        self._pieces.append(text)
+        return True
+
+    def finish(self):
+        # check() takes whole strings: the only checker that reads the
+        # input and expected output in full, and only once the program is done
+        output = "".join(self._pieces)
+        try:
+            return bool(self.check(
+                test_store.read_text(self.test_input), test_store.read_text(self.expected), output,
+            ))
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            return False
+
+
+CHECKERS = {
+    "exact": ExactChecker,
+    "tokens": TokenChecker,
+    "float": FloatChecker,
+    "unordered_lines": UnorderedLinesChecker,
+}
+
+
+def compile_custom_check(source):
+    try:
+        code = compile_guarded(source, "<checker>")
+        namespace = {"__builtins__": dict(SAFE_BUILTINS)}
+        exec(code, namespace)
+    except Exception as e:
+        raise CheckerError(f"{type(e).__name__}: {e}")
+
+    check = namespace.get("check")
+    if not callable(check):
+        raise CheckerError("the checker must define check(input, expected, output)")
+    return check
+
+
+# Every test of a challenge uses the same spec, so each worker compiles a
+# custom checker once and reuses it for all of its tests.
+@functools.lru_cache(maxsize=64)
+def load_checker(spec):
+    name, option = spec or ("exact", None)
+    if name == "custom":
+        return functools.partial(CustomChecker, check=compile_custom_check(option))
+    if name == "float":
+        return functools.partial(FloatChecker, epsilon=option)
+    if name not in CHECKERS:
+        raise CheckerError(f"unknown checker {name!r}")
+    return CHECKERS[name]
+
+
+def make_checker(spec, test_input, expected_output):
+    # expected_output=None only checks that the program runs
+    if expected_output is None:
+        return None
+    return load_checker(spec)(test_input, expected_output)
@@ -0,0 +1,687 @@
+import atexit
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from .models import HiddenTest, Submission, award_points_for_submission
+from . import badges, runners, scheduler, stats, subinterpreters, test_store
+from .sandbox import LINE_BUDGET_ERROR, LINE_BUDGET_TIME_FACTOR, WALL_TIME_FACTOR, make_result
+
+
+# ---------- JUDGE WORKER POOL ----------
+# Student code never runs inside the web worker: every test is sent to a pool
+# of pre-forked judge processes. The pool is created lazily, once per web
+# process, and each judge process is replaced after JUDGE_MAX_JOBS_PER_WORKER
+# jobs so leaked state from student code cannot pile up. With the
+# "forkserver" start method the judge processes are forked from a small
+# server that has only imported the Django-free judge modules (runners.py and
+# what it imports), instead of from the web process.
+
+_pool = None
+_pool_pid = None
+_interpreter_pool = None
+_interpreter_pool_pid = None
+_schedulers = {}  # backend -> LaneScheduler of its current pool
+_pool_lock = threading.Lock()
+
+
+_interpreters_allowed = False  # see allow_interpreters()
+
+
+def allow_interpreters():
+    # Called by judge_worker before it judges anything. Subinterpreters run
+    # student code inside this process with no memory limit of their own, so
+    # only a judge worker uses them, with its whole address space capped.
+    global _interpreters_allowed
+
+    if settings.JUDGE_PYTHON_BACKEND == "interpreters" and subinterpreters.SUPPORTED:
+        subinterpreters.limit_memory(settings.JUDGE_INTERPRETER_MEMORY_MB)
+        _interpreters_allowed = True
+
+
+def python_backend():
+    # "interpreters" only in a judge worker where subinterpreters.py can run,
+    # else "processes"
+    if settings.JUDGE_PYTHON_BACKEND == "interpreters" and subinterpreters.SUPPORTED and _interpreters_allowed:
+        return "interpreters"
+    return "processes"
+
+
+def get_pool(language=None):
+    global _pool, _pool_pid, _interpreter_pool, _interpreter_pool_pid
+
+    if language == "python" and python_backend() == "interpreters":
+        with _pool_lock:
+            # threads do not survive a fork either
+            if _interpreter_pool is None or _interpreter_pool_pid != os.getpid():
+                _interpreter_pool = subinterpreters.InterpreterPool(
+                    settings.JUDGE_POOL_SIZE,
+                    initializer=runners.init_worker,
+                    initargs=({"fork_per_job": False, "monitor_limits": True,
+                               "jail_command": settings.JUDGE_JAIL_COMMAND},),
+                )
+                _interpreter_pool_pid = os.getpid()
+            return _interpreter_pool
+
+    with _pool_lock:
+        # a forked web worker must not reuse its parent's pool
+        if _pool is None or _pool_pid != os.getpid():
+            ctx = multiprocessing.get_context(settings.JUDGE_START_METHOD or None)
+            if ctx.get_start_method() == "forkserver":
+                ctx.set_forkserver_preload(["my_app.runners"])
+            _pool = ctx.Pool(
+                processes=settings.JUDGE_POOL_SIZE,
+                maxtasksperchild=settings.JUDGE_MAX_JOBS_PER_WORKER or None,
+                initializer=runners.init_worker,
+                initargs=({"fork_per_job": settings.JUDGE_FORK_PER_JOB,
+                           "jail_command": settings.JUDGE_JAIL_COMMAND},),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool, _pool_pid, _interpreter_pool, _interpreter_pool_pid
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.terminate()
+            _pool.join()
+        if _interpreter_pool is not None and _interpreter_pool_pid == os.getpid():
+            _interpreter_pool.terminate()
+            _interpreter_pool.join()
+        _pool = None
+        _pool_pid = None
+        _interpreter_pool = None
+        _interpreter_pool_pid = None
+        _schedulers.clear()
+
+
+def get_scheduler(language=None):
+    # the lanes in front of get_pool(language), see scheduler.py
+    pool = get_pool(language)
+    backend = "interpreters" if pool is _interpreter_pool else "processes"
+    with _pool_lock:
+        lanes = _schedulers.get(backend)
+        if lanes is None or lanes.pool is not pool:
+            lanes = _schedulers[backend] = scheduler.LaneScheduler(
+                pool, settings.JUDGE_POOL_SIZE, settings.JUDGE_LANE_WEIGHTS
+            )
+        return lanes
+
+
+def scheduler_metrics():
+    # per backend: queue depth and wait times of each lane, in this process
+    with _pool_lock:
+        schedulers = dict(_schedulers)
+    return {backend: lanes.metrics() for backend, lanes in schedulers.items()}
+
+
+class JudgeTimeout(Exception):
+    pass
+
+
+# Submission status for a test that did not pass, by the sandbox's verdict.
+# Anything not listed (wrong output, runtime error) is a plain "failed".
+STATUS_BY_VERDICT = {
+    "time_limit_exceeded": "time_limit_exceeded",
+    "memory_limit_exceeded": "memory_limit_exceeded",
+    "output_limit_exceeded": "output_limit_exceeded",
+    "compile_error": "error",
+    "checker_error": "error",
+    "unsupported_language": "error",
+}
+
+
+def challenge_limits(challenge):
+    return {
+        "time_limit_ms": challenge.time_limit_ms,
+        "memory_limit_mb": challenge.memory_limit_mb,
+        "output_limit_kb": settings.JUDGE_OUTPUT_LIMIT_KB,
+        "line_budget": challenge.line_budget,
+    }
+
+
+def _job_timeout(limits, time_factor=1):
+    # the sandbox enforces the real limits; this only catches a dead or wedged worker
+    time_limit = (limits.get("time_limit_ms") or 0) / 1000 * time_factor
+    if limits.get("line_budget"):
+        time_limit *= LINE_BUDGET_TIME_FACTOR
+    return time_limit * WALL_TIME_FACTOR + settings.JUDGE_JOB_TIMEOUT
+
+
+def get_runner(language):
+    # Python always; the other languages only once they are switched on and
+    # have a jail to run in (JUDGE_PROCESS_LANGUAGES, JUDGE_JAIL_COMMAND)
+    if language != "python" and not (
+        language in settings.JUDGE_PROCESS_LANGUAGES and settings.JUDGE_JAIL_COMMAND
+    ):
+        return None
+    return runners.get_runner(language)
+
+
+@functools.lru_cache(maxsize=None)
+def available_languages():
+    # (value, label) pairs from Submission.LANGUAGE_CHOICES this server can judge
+    return [
+        (language, label)
+        for language, label in Submission.LANGUAGE_CHOICES
+        if get_runner(language) is not None
+    ]
+
+
+def _prepare(runner, user_code, lanes, lane, share):
+    # compile once per submission, before any test runs (see runners.py)
+    args = (runner.language, user_code, settings.JUDGE_ARTIFACT_DIR, settings.JUDGE_ARTIFACT_MAX_ENTRIES)
+    if lanes is None or not runner.prepare_in_worker:
+        return runners.prepare(*args)
+
+    timeout = runners.COMPILE_TIMEOUT + settings.JUDGE_JOB_TIMEOUT
+    try:
+        return lanes.submit(lane, runners.prepare, args, timeout=timeout, share=share[0], weight=share[1]).get()
+    except multiprocessing.TimeoutError:
+        raise JudgeTimeout(f"no result after {timeout:g}s")
+
+
+def _iter_outcomes(user_code, cases, limits, fail_fast=False, language="python", checker=None, lane="graded",
+                   share=None):
+    # Yields (position in cases, sandbox result) per case as soon as it is
+    # ready, in the order the tests finish: a slow test does not hold back
+    # the results of quicker ones behind it. With fail_fast it stops after
+    # the first case that does not pass. lane
+    # and share (see classroom_share) decide where its jobs wait in the
+    # scheduler (see scheduler.py).
+    share = share or (None, 1)
+    runner = get_runner(language)
+    if runner is None:
+        error = make_result("unsupported_language", f"__ERROR__ {language} is not supported by this judge", 0, 0, None)
+        for position, _ in enumerate(cases[:1 if fail_fast else None]):
+            yield position, dict(error)
+        return
+
+    # JUDGE_POOL_SIZE = 0 runs in-process (handy for local debugging)
+    lanes = get_scheduler(language) if settings.JUDGE_POOL_SIZE > 0 else None
+    if lanes is None:
+        runners.WORKER_CONFIG["jail_command"] = settings.JUDGE_JAIL_COMMAND
+
+    prepared = _prepare(runner, user_code, lanes, lane, share)
+    if prepared["error"] is not None:
+        error = make_result("compile_error", f"__ERROR__ Compilation failed:\n{prepared['error']}", 0, 0, None)
+        for position, _ in enumerate(cases[:1 if fail_fast else None]):
+            yield position, dict(error)
+        return
+    artifact = prepared["artifact"]
+
+    if lanes is None:
+        for position, (test_input, expected_output) in enumerate(cases):
+            result = runners.run_case(language, artifact, test_input, expected_output, checker, **limits)
+            yield position, result
+            if fail_fast and not result["passed"]:
+                return
+        return
+
+    # Hidden tests are independent, so every test is its own pool job and up
+    # to JUDGE_MAX_PARALLEL_TESTS of a submission's tests run side by side.
+    # The cap stops one big suite from taking every worker in the pool; the
+    # worker-side compile cache means each worker still parses the code once.
+    window = max(1, min(settings.JUDGE_MAX_PARALLEL_TESTS, settings.JUDGE_POOL_SIZE))
+    timeout = _job_timeout(limits, runner.time_factor)
+
+    # Each job reports to `completions` when it is done, so results are taken
+    # as they finish and a freed slot goes to the next test straight away.
+    completions = scheduler.Completions(lanes)
+    pending = {}  # job -> position in cases
+    queued = 0
+    try:
+        while queued < len(cases) or pending:
+            while queued < len(cases) and len(pending) < window:
+                test_input, expected_output = cases[queued]
+                job = lanes.submit(
+                    lane,
+                    runners.run_case,
+                    (language, artifact, test_input, expected_output, checker),
+                    limits,
+                    timeout,
+                    share=share[0],
+                    weight=share[1],
+                    on_done=completions.add,
+                )
+                pending[job] = queued
+                queued += 1
+
+            try:
+                job = completions.next(pending)
+                position = pending.pop(job)
+                result = job.get()
+            except multiprocessing.TimeoutError:
+                raise JudgeTimeout(f"no result after {timeout:g}s")
+
+            yield position, result
+            if fail_fast and not result["passed"]:
+                # jobs already in flight finish on their own; nobody waits for them
+                return
+    finally:
+        # jobs still waiting in their lane are not needed any more
+        for job in pending:
+            job.cancel()
+
+
+def _timeout_result(error):
+    return {
+        "passed": False,
+        "verdict": "error",
+        "output": f"__ERROR__ TimeoutError: {error}",
+        "cpu_time_ms": None,
+        "wall_time_ms": None,
+        "peak_memory_kb": None,
+        "lines_executed": None,
+    }
+
+
+# result of a test fail-fast judging never got to
+SKIPPED = {
+    "passed": False,
+    "verdict": "skipped",
+    "output": "",
+    "cpu_time_ms": None,
+    "wall_time_ms": None,
+    "peak_memory_kb": None,
+    "lines_executed": None,
+}
+
+
+def execute(user_code, test_input, limits=None, language="python", lane="graded", share=None):
+    try:
+        outcomes = _iter_outcomes(user_code, [(test_input, None)], limits or {}, language=language, lane=lane, share=share)
+        return next(outcomes)[1]
+    except JudgeTimeout as e:
+        return _timeout_result(e)
+
+
+# ---------- RESULT CACHE ----------
+# "Run tests" followed by "Submit", or resubmitting unchanged code, used to
+# run the exact same program against the exact same tests again. Results are
+# kept in the "judge" cache (an LRU with MAX_ENTRIES) under a key built from
+# the code, the language, the limits and a fingerprint of the tests and the
+# checker, so editing a challenge's tests makes its old entries unreachable
+# without any explicit invalidation. Challenges keep their tests' fingerprint
+# up to date (Challenge.tests_fingerprint), so it is never recomputed here.
+
+def _cacheable(results):
+    # A time limit hit on the CPU or wall clock depends on how loaded the host
+    # was, so caching it would fail every rerun of the same code for a day; an
+    # exhausted line budget does not.
+    return not any(
+        result["verdict"] == "time_limit_exceeded"
+        and not (result["user_output"] or "").startswith(LINE_BUDGET_ERROR)
+        for result in results
+    )
+
+
+def tests_fingerprint(cases):
+    # stored files are named after their content, so their path is enough
+    payload = json.dumps(cases, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def result_cache_key(user_code, language, fingerprint, limits, fail_fast=False, checker=None):
+    # line endings and surrounding blank lines never change what a program does
+    normalized = user_code.replace("\r\n", "\n").strip()
+    code_hash = hashlib.sha256(normalized.encode()).hexdigest()
+    limits_key = ":".join(
+        str(limits.get(name)) for name in ("time_limit_ms", "memory_limit_mb", "output_limit_kb", "line_budget")
+    )
+    mode = "ff" if fail_fast else "all"
+    checker_hash = hashlib.sha256(repr(checker).encode()).hexdigest()[:16]
+    return f"judge:{language}:{code_hash}:{limits_key}:{mode}:{fingerprint}:{checker_hash}"
+
+
+def _test_result(test_input, expected_output, outcome):
+    return {
+        "input": test_store.preview(test_input),
+        "expected": test_store.preview(expected_output),
+        "user_output": outcome["output"],
+        "passed": outcome["passed"],
+        "verdict": outcome["verdict"],
+        "cpu_time_ms": outcome["cpu_time_ms"],
+        "wall_time_ms": outcome["wall_time_ms"],
+        "peak_memory_kb": outcome["peak_memory_kb"],
+        "lines_executed": outcome.get("lines_executed"),
+    }
+
+
+def overall_status(results):
+    # the first test that did not pass decides the verdict
+    for result in results:
+        if not result["passed"] and result["verdict"] != "skipped":
+            return STATUS_BY_VERDICT.get(result["verdict"], "failed")
+    return "passed"
+
+
+# ---------- FAIL-FAST ----------
+# Most graded submissions are wrong, and a wrong one only needs a single
+# failing test to be rejected. In fail-fast mode the worker stops at the first
+# test that does not pass and the remaining ones are reported as "skipped".
+# Tests run in order of how often graded submissions have failed them (see
+# TEST STATISTICS below), ties smallest first, since a wrong submission is
+# then usually rejected by its first or second test.
+# "Run tests" in the editor always runs everything so students get the full
+# picture.
+
+def uses_fail_fast(challenge):
+    if challenge.fail_fast is None:
+        return settings.JUDGE_FAIL_FAST
+    return challenge.fail_fast
+
+
+# ---------- TEST STATISTICS ----------
+# Every graded submission adds to its tests' HiddenTest.runs and .failures.
+# Counts are collected in memory and written with one UPDATE per distinct
+# increment every JUDGE_TEST_STATS_BATCH submissions (or
+# JUDGE_TEST_STATS_FLUSH_SECONDS), so judging never waits on a row lock.
+# Counts lost when a process exits only make the order slightly worse.
+# Tests are matched by checksum, so counts for a test that has been edited
+# meanwhile are dropped; editing tests resets the counts anyway.
+
+# Verdicts that say nothing about the test itself. A runtime error does: it
+# is the test's input that made the program crash. Results that were not
+# judged just now (from the result cache, or filled in because the judge was
+# too busy) are not recorded at all, see iter_judge_submission.
+_NOT_COUNTED = {"skipped", "compile_error", "unsupported_language", "checker_error"}
+
+_stats_lock = threading.Lock()
+_pending_stats = defaultdict(lambda: [0, 0])  # (challenge id, checksum) -> [runs, failures]
+_pending_submissions = 0
+_stats_flushed_at = time.monotonic()
+
+
+def record_test_results(challenge, results):
+    global _pending_submissions
+
+    with _stats_lock:
+        for result in results:
+            if not result.get("checksum") or result["verdict"] in _NOT_COUNTED:
+                continue
+            counts = _pending_stats[challenge.id, result["checksum"]]
+            counts[0] += 1
+            counts[1] += not result["passed"]
+        _pending_submissions += 1
+        due = (
+            _pending_submissions >= settings.JUDGE_TEST_STATS_BATCH
+            or time.monotonic() - _stats_flushed_at >= settings.JUDGE_TEST_STATS_FLUSH_SECONDS
+        )
+    if due:
+        flush_test_stats()
+
+
+def flush_test_stats():
+    global _pending_stats, _pending_submissions, _stats_flushed_at
+
+    with _stats_lock:
+        pending, _pending_stats = _pending_stats, defaultdict(lambda: [0, 0])
+        _pending_submissions = 0
+        _stats_flushed_at = time.monotonic()
+
+    # tests with the same increments share one UPDATE
+    groups = defaultdict(lambda: defaultdict(list))
+    for (challenge_id, checksum), (runs, failures) in pending.items():
+        groups[runs, failures][challenge_id].append(checksum)
+    for (runs, failures), by_challenge in groups.items():
+        match = Q()
+        for challenge_id, checksums in by_challenge.items():
+            match |= Q(challenge_id=challenge_id, checksum__in=checksums)
+        HiddenTest.objects.filter(match).update(
+            runs=F("runs") + runs,
+            failures=F("failures") + failures,
+        )
+
+
+
+def cases_of(tests):
+    # (input, expected output) per HiddenTest; large ones as StoredFiles
+    return [(test.input_data, test.output_data) for test in tests]
+
+
+def iter_judge_tests(user_code, cases, language="python", limits=None, fail_fast=False, checker=None,
+                     fingerprint=None, failure_rates=None, lane="graded", share=None):
+    # Judges a submission and reports as it goes, for the streaming endpoint:
+    #   {"event": "start", "total": n}
+    #   {"event": "test", "index": i, "result": {...}}   once per judged test
+    #   {"event": "done", "status": ..., "results": [...], "fresh": bool}
+    # "fresh" is false when the results are not all from judging the code just
+    # now: they came from the result cache, or the judge was too busy.
+    # Test events come in the order the tests finish; "index" is the test's
+    # position in the challenge. cases are
+    # (input, expected output) pairs, as from cases_of(); failure_rates, one
+    # per case, decide the fail-fast order.
+    limits = limits or {}
+    fingerprint = fingerprint or tests_fingerprint(cases)
+    result_cache = caches["judge"]
+    yield {"event": "start", "total": len(cases)}
+
+    # a full run answers a fail-fast request too, so check for one first
+    full_key = result_cache_key(user_code, language, fingerprint, limits, checker=checker)
+    cache_key = result_cache_key(user_code, language, fingerprint, limits, fail_fast, checker)
+    for key in {full_key, cache_key}:
+        cached = result_cache.get(key)
+        if cached is not None:
+            status, results = cached
+            for index, result in enumerate(results):
+                yield {"event": "test", "index": index, "result": result}
+            yield {"event": "done", "status": status, "results": results, "fresh": False}
+            return
+
+    order = list(range(len(cases)))
+    if fail_fast:
+        rates = failure_rates or [0] * len(cases)
+        order.sort(key=lambda i: (
+            -rates[i],
+            test_store.data_size(cases[i][0]) + test_store.data_size(cases[i][1]),
+        ))
+
+    results = [None] * len(cases)
+    cacheable = True
+    outcomes = _iter_outcomes(user_code, [cases[i] for i in order], limits, fail_fast, language, checker, lane, share)
+    try:
+        for position, outcome in outcomes:
+            index = order[position]
+            results[index] = _test_result(*cases[index], outcome)
+            yield {"event": "test", "index": index, "result": results[index]}
+    except JudgeTimeout as e:
+        # the judge was too busy to answer, which says nothing about the code
+        cacheable = False
+        for index in order:
+            if results[index] is None:
+                results[index] = _test_result(*cases[index], _timeout_result(e))
+                yield {"event": "test", "index": index, "result": results[index]}
+
+    results = [
+        result or _test_result(*cases[index], SKIPPED)
+        for index, result in enumerate(results)
+    ]
+    status = overall_status(results)
+
+    if cacheable and _cacheable(results):
+        result_cache.set(cache_key, (status, results))
+
+    yield {"event": "done", "status": status, "results": results, "fresh": cacheable}
+
+
+def judge_tests(user_code, cases, language="python", limits=None, fail_fast=False, checker=None, fingerprint=None,
+                lane="graded"):
+    for event in iter_judge_tests(user_code, cases, language, limits, fail_fast, checker, fingerprint, lane=lane):
+        if event["event"] == "done":
+            return event["status"], event["results"]
+
+
+def classroom_share(challenge):
+    # a challenge's jobs share the judge with the rest of its classroom
+    return challenge.classroom_id, challenge.classroom.judge_weight
+
+
+def iter_judge_challenge(challenge, user_code, language="python", fail_fast=False, tests=None, lane="graded"):
+    # tests: only judge these of the challenge's HiddenTests; lane: see scheduler.py
+    share = classroom_share(challenge)
+    fingerprint = None if tests is not None else challenge.tests_fingerprint
+    if tests is None:
+        tests = list(challenge.test_cases.all())
+    limits = challenge_limits(challenge)
+
+    if not tests:
+        # No hidden tests configured — just check the code runs without error
+        result = _test_result("", "(no hidden tests)", execute(user_code, "", limits, language, lane, share))
+        yield {"event": "start", "total": 1}
+        yield {"event": "test", "index": 0, "result": result}
+        yield {"event": "done", "status": overall_status([result]), "results": [result], "fresh": False}
+        return
+
+    events = iter_judge_tests(
+        user_code, cases_of(tests), language, limits, fail_fast, challenge.checker_spec(), fingerprint,
+        [test.failure_rate for test in tests], lane, share,
+    )
+    for event in events:
+        # results carry their test's checksum, so a rejudge can tell which
+        # tests a submission has already passed (see rejudge.py)
+        if event["event"] == "test":
+            event["result"]["checksum"] = tests[event["index"]].checksum
+        elif event["event"] == "done":
+            for test, result in zip(tests, event["results"]):
+                result["checksum"] = test.checksum
+        yield event
+
+
+def judge_challenge(challenge, user_code, language="python", fail_fast=False, tests=None, lane="graded"):
+    for event in iter_judge_challenge(challenge, user_code, language, fail_fast, tests, lane):
+        if event["event"] == "done":
+            return event["status"], event["results"]
+
+
+def _sum_measure(results, key):
+    values = [r[key] for r in results if r.get(key) is not None]
+    return sum(values) if values else None
+
+
+RESULT_FIELDS = ["status", "results", "cpu_time_ms", "wall_time_ms", "peak_memory_kb", "lines_executed"]
+
+
+def set_results(submission, status, results):
+    submission.status = status
+    submission.results = results
+    submission.cpu_time_ms = _sum_measure(results, "cpu_time_ms")
+    submission.wall_time_ms = _sum_measure(results, "wall_time_ms")
+    submission.lines_executed = _sum_measure(results, "lines_executed")
+    submission.peak_memory_kb = max(
+        (r["peak_memory_kb"] for r in results if r.get("peak_memory_kb") is not None),
+        default=None,
+    )
+
+
+def iter_judge_submission(submission):
+    # iter_judge_challenge for a graded submission; the "done" event comes
+    # once its verdict is saved and adds submission_id, attempt_number and
+    # points_awarded
+    challenge = submission.challenge
+    events = iter_judge_challenge(
+        challenge,
+        submission.code,
+        submission.language,
+        fail_fast=uses_fail_fast(challenge),
+    )
+    for event in events:
+        if event["event"] == "done":
+            points_awarded = save_judged(submission, event["status"], event["results"])
+            if event["fresh"]:
+                record_test_results(challenge, event["results"])
+            event.update(
+                submission_id=submission.id,
+                attempt_number=submission.attempt_number,
+                points_awarded=points_awarded,
+            )
+        yield event
+
+
+def judge_submission(submission):
+    for event in iter_judge_submission(submission):
+        if event["event"] == "done":
+            return event["points_awarded"]
+
+
+def save_judged(submission, status, results):
+    # stores a verdict and everything that follows from it, all or nothing
+    set_results(submission, status, results)
+    with transaction.atomic():
+        submission.save(update_fields=RESULT_FIELDS)
+        points_awarded, first_solve = award_points_for_submission(submission)
+        stats.record_judged(submission, first_solve, points_awarded)
+        stats.record_progress(submission)
+        if first_solve:
+            badges.record_solve(submission)
+    return points_awarded
+
+
+# ---------- SUBMISSION QUEUE ----------
+# With JUDGE_ASYNC_SUBMISSIONS on, challenge_submit only stores the submission
+# and the judge_worker command judges it later. "pending" rows are the queue:
+# a worker claims one by flipping it to "judging" with a conditional UPDATE, so
+# two workers can never judge the same submission.
+# The queue is not first come first served across classrooms: a worker takes
+# the oldest submission of the classroom that has had the fewest turns,
+# counted in 1/judge_weight steps like the pool's lanes (see scheduler.py),
+# so a small class is not stuck behind a large one's whole backlog. Turns
+# are kept per worker process and only for classrooms with something queued.
+
+_claim_turns = {}  # classroom id -> turns taken, in 1/judge_weight steps
+_claim_lock = threading.Lock()
+
+
+def claim_next_submission():
+    while True:
+        heads = list(
+            Submission.objects.filter(status="pending")
+            .values("challenge__classroom_id", "challenge__classroom__judge_weight")
+            .annotate(first_id=Min("id"))
+        )
+        if not heads:
+            return None
+
+        with _claim_lock:
+            queued = {head["challenge__classroom_id"] for head in heads}
+            for classroom_id in set(_claim_turns) - queued:
+                del _claim_turns[classroom_id]  # an idle classroom banks no turns
+            start = min(_claim_turns.values(), default=0)
+            for classroom_id in queued - set(_claim_turns):
+                _claim_turns[classroom_id] = start  # new to the queue: level with the rest
+            head = min(heads, key=lambda head: (_claim_turns[head["challenge__classroom_id"]], head["first_id"]))
+
+        submission_id = head["first_id"]
+        claimed = Submission.objects.filter(id=submission_id, status="pending").update(
+            status="judging",
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            classroom_id = head["challenge__classroom_id"]
+            with _claim_lock:
+                turns = _claim_turns.get(classroom_id, start)
+                _claim_turns[classroom_id] = turns + 1 / max(1, head["challenge__classroom__judge_weight"])
+            return Submission.objects.select_related("user", "challenge__classroom").get(id=submission_id)
+        # another worker got there first, try the next one
+
+
+def requeue_stale_submissions(max_age):
+    # submissions whose worker died mid-judging go back to the queue
+    return Submission.objects.filter(
+        status="judging",
+        updated_at__lt=timezone.now() - max_age,
+    ).update(status="pending", updated_at=timezone.now())
@@ -0,0 +1,84 @@
+from collections import namedtuple
+
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+
+from .models import Profile
+
+
+# ---------- LEADERBOARD RANKS ----------
+# The points leaderboard of a scope (everyone, or one classroom's members) is
+# ordered by points, then solved count, then username, straight from the
+# database, so a solve is ranked as soon as its points are committed and
+# there is nothing to keep up to date. What each query costs:
+# - top K: the global board walks Profile.points (indexed) from the top and
+#   only sorts rows tied on points by the tie-break, in a small temporary
+#   B-tree; a classroom board sorts all of the classroom's members.
+# - rank: a COUNT of the rows ahead of the user, a range on Profile.points
+#   plus their ties, so it reads about as many rows as the rank is deep.
+# - neighbors: that COUNT again, then the nearest rows on either side.
+# That is cheap at the size of a school's boards. A rank that costs the same
+# however deep the user is would need an order-statistic index updated on
+# every points change; this module used to keep one in the cache and dropped
+# it, because each solve re-sent the whole index and other processes read
+# stale copies of it.
+
+GLOBAL = "global"
+
+Entry = namedtuple("Entry", "rank user_id points solved")
+
+ORDER = ("-points", "-solved", "user__username")
+
+
+def _profiles(scope):
+    profiles = Profile.objects.annotate(solved=Coalesce(F("user__stats__solved_count"), Value(0)))
+    if scope != GLOBAL:
+        profiles = profiles.filter(user__user_joined_classes__classroom_id=scope)
+    return profiles
+
+
+def _position(profiles, user_id):
+    # -> (points, solved, username) of the user, None outside the scope
+    return profiles.filter(user_id=user_id).values_list("points", "solved", "user__username").first()
+
+
+def _ahead(points, solved, username):
+    return (
+        Q(points__gt=points)
+        | Q(points=points, solved__gt=solved)
+        | Q(points=points, solved=solved, user__username__lt=username)
+    )
+
+
+def _entries(rows, first_rank):
+    return [Entry(rank, *row) for rank, row in enumerate(rows, start=first_rank)]
+
+
+def top(scope, k):
+    rows = _profiles(scope).order_by(*ORDER).values_list("user_id", "points", "solved")[:k]
+    return _entries(rows, 1)
+
+
+def rank(scope, user_id):
+    profiles = _profiles(scope)
+    position = _position(profiles, user_id)
+    if position is None:
+        return None
+    return profiles.filter(_ahead(*position)).count() + 1
+
+
+def neighbors(scope, user_id, n=2):
+    # the user and up to n users either side of them
+    profiles = _profiles(scope)
+    position = _position(profiles, user_id)
+    if position is None:
+        return []
+    ahead = profiles.filter(_ahead(*position))
+    user_rank = ahead.count() + 1
+    above = list(
+        ahead.order_by("points", "solved", "-user__username").values_list("user_id", "points", "solved")[:n]
+    )[::-1]
+    rest = (
+        profiles.exclude(_ahead(*position)).order_by(*ORDER).values_list("user_id", "points", "solved")[:n + 1]
+    )
+    return _entries([*above, *rest], user_rank - len(above))
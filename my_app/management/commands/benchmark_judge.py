@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from my_app import judge, subinterpreters
+
+# a bit of everything: parsing input, a loop, a function call per line
+BENCHMARK_CODE = """
+def solve(n):
+    return sum(i * i for i in range(n % 1000))
+
+count = int(input())
+for _ in range(count):
+    print(solve(int(input())))
+"""
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _pool_rss_kb():
+    # this process plus the judge processes, if any
+    pids = [None]
+    if judge._pool is not None:
+        pids += [process.pid for process in judge._pool._pool]
+    return sum(_rss_kb(pid or "self") for pid in pids)
+
+
+class Command(BaseCommand):
+    help = 'Compares the Python judge backends (process pool vs. subinterpreters)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=200)
+        parser.add_argument('--tests', type=int, default=5,
+                            help='Tests per submission')
+        parser.add_argument('--lines', type=int, default=200,
+                            help='Input lines per test')
+
+    def handle(self, *args, **options):
+        cases = []
+        for t in range(options['tests']):
+            numbers = [(t * 7919 + i * 104729) % 100000 for i in range(options['lines'])]
+            test_input = "\n".join([str(len(numbers))] + [str(n) for n in numbers])
+            expected = "\n".join(str(sum(i * i for i in range(n % 1000))) for n in numbers)
+            cases.append((test_input, expected))
+        limits = {'time_limit_ms': 2000, 'memory_limit_mb': 256, 'output_limit_kb': settings.JUDGE_OUTPUT_LIMIT_KB}
+        total_tests = options['submissions'] * len(cases)
+
+        self.stdout.write(f"{options['submissions']} submissions x {len(cases)} tests, "
+                          f"JUDGE_POOL_SIZE={settings.JUDGE_POOL_SIZE}")
+        for backend in ('processes', 'interpreters'):
+            if backend == 'interpreters' and not subinterpreters.SUPPORTED:
+                self.stdout.write(f'  {backend:<13} skipped: needs Python 3.13+')
+                continue
+
+            with override_settings(JUDGE_PYTHON_BACKEND=backend):
+                judge.shutdown_pool()
+                # warm up the pool so startup is not part of the numbers
+                judge.judge_tests('print(1)', [('', '1')], 'python', limits)
+
+                def run(i):
+                    # a distinct comment per submission defeats the result cache
+                    code = f'{BENCHMARK_CODE}# {backend} {i} {time.time()}'
+                    return judge.judge_tests(code, cases, 'python', limits)[0]
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max(1, settings.JUDGE_POOL_SIZE)) as executor:
+                    statuses = list(executor.map(run, range(options['submissions'])))
+                elapsed = time.perf_counter() - started
+                rss = _pool_rss_kb()
+                judge.shutdown_pool()
+
+            failed = sum(status != 'passed' for status in statuses)
+            self.stdout.write(
+                f'  {backend:<13} {elapsed:7.2f}s  {total_tests / elapsed:8.1f} tests/s  '
+                f'{rss / 1024:7.1f} MB resident'
+                + (f'  {failed} FAILED' if failed else '')
+            )
@@ -0,0 +1,93 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from my_app import judge, rejudge
+
+# how often a running rejudge tells the queue it is still alive
+HEARTBEAT_SECONDS = 30
+
+
+class Command(BaseCommand):
+    help = 'Judges queued ("pending") submissions and queued rejudges until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Requeue submissions stuck in "judging", and rejudges '
+                                 'with no heartbeat, for this many seconds')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue and exit instead of waiting for more work')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        judge.allow_interpreters()
+        self.stdout.write('Judge worker started.')
+
+        # one rejudge at a time runs on its own thread, so submissions keep
+        # being judged meanwhile; its tests queue behind theirs in the pool
+        rejudging = None  # (request, thread)
+        last_heartbeat = 0.0
+
+        while True:
+            close_old_connections()
+
+            requeued = judge.requeue_stale_submissions(stale_after)
+            if requeued:
+                self.stdout.write(f'  ↺ Requeued {requeued} stale submission(s)')
+            requeued = rejudge.requeue_stale_requests(stale_after)
+            if requeued:
+                self.stdout.write(f'  ↺ Requeued {requeued} stale rejudge(s)')
+
+            if rejudging and not rejudging[1].is_alive():
+                self._report(rejudging[0])
+                rejudging = None
+            if rejudging is None:
+                request = rejudge.claim_next_request()
+                if request is not None and not settings.JUDGE_POOL_SIZE:
+                    # in-process judging only has time limits on the main thread
+                    self._report(rejudge.run_request(request))
+                elif request is not None:
+                    self.stdout.write(f'  … Rejudging "{request.challenge.title}"')
+                    thread = threading.Thread(target=self._rejudge, args=(request,), daemon=True)
+                    thread.start()
+                    rejudging = (request, thread)
+                    last_heartbeat = time.monotonic()
+            elif time.monotonic() - last_heartbeat > HEARTBEAT_SECONDS:
+                rejudge.heartbeat(rejudging[0])
+                last_heartbeat = time.monotonic()
+
+            submission = judge.claim_next_submission()
+            if submission is None:
+                judge.flush_test_stats()
+                if options['once'] and rejudging is None:
+                    break
+                time.sleep(options['poll'])
+                continue
+
+            try:
+                judge.judge_submission(submission)
+            except Exception as e:
+                submission.status = 'error'
+                submission.results = [{'error': f'{type(e).__name__}: {e}'}]
+                submission.save(update_fields=['status', 'results'])
+                self.stderr.write(f'  ✗ Submission #{submission.id}: {type(e).__name__}: {e}')
+                continue
+
+            self.stdout.write(f'  ✓ Submission #{submission.id}: {submission.status}')
+
+        self.stdout.write(self.style.SUCCESS('Queue drained.'))
+
+    def _report(self, request):
+        self.stdout.write(f'  ✓ Rejudge of "{request.challenge.title}": {request.status}, {request.summary}')
+
+    def _rejudge(self, request):
+        try:
+            rejudge.run_request(request)
+        finally:
+            connection.close()
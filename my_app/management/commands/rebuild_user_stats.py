@@ -0,0 +1,36 @@
+import itertools
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from my_app import badges, stats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Recounts every user's UserStats and badge counters from their submissions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help='Only these users (default: everyone)')
+        parser.add_argument('--batch-size', type=int, default=stats.BATCH_SIZE,
+                            help='Users recounted per transaction')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f'No user "{sorted(missing)[0]}"')
+
+        ids = users.values_list('id', flat=True).iterator()
+        done = 0
+        while batch := list(itertools.islice(ids, options['batch_size'])):
+            stats.rebuild(batch)
+            badges.rebuild_counters(batch)
+            done += len(batch)
+            self.stdout.write(f'  … {done} users')
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt stats for {done} users'))
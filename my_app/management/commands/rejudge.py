@@ -0,0 +1,71 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from my_app import judge, rejudge
+from my_app.models import Challenge
+
+
+class Command(BaseCommand):
+    help = "Rejudges a challenge's submissions and corrects points and badges"
+
+    def add_arguments(self, parser):
+        parser.add_argument('challenges', nargs='*',
+                            help='Challenge slugs or ids')
+        parser.add_argument('--all', action='store_true',
+                            help='Rejudge every challenge')
+        parser.add_argument('--full', action='store_true',
+                            help='Run every test again, also for passed submissions '
+                                 '(needed after changing the checker or the limits)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Submissions judged at once (default: JUDGE_REJUDGE_POOL_SIZE)')
+        parser.add_argument('--batch-size', type=int, default=rejudge.BATCH_SIZE,
+                            help='Submissions written per transaction')
+        parser.add_argument('--queue', action='store_true',
+                            help='Queue the rejudges for judge_worker instead of running them here')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            challenges = list(Challenge.objects.order_by('id'))
+        elif options['challenges']:
+            challenges = []
+            for name in options['challenges']:
+                lookup = {'id': int(name)} if name.isdigit() else {'slug': name}
+                try:
+                    challenges.append(Challenge.objects.get(**lookup))
+                except Challenge.DoesNotExist:
+                    raise CommandError(f'No challenge "{name}"')
+        else:
+            raise CommandError('Name at least one challenge, or use --all')
+
+        if options['queue']:
+            queued = rejudge.enqueue(challenges, full=options['full'])
+            self.stdout.write(self.style.SUCCESS(f'✓ Queued {len(queued)} rejudge(s) for judge_worker'))
+            return
+
+        # before the pool exists, so its workers inherit it
+        if settings.JUDGE_BACKGROUND_NICE and hasattr(os, 'nice'):
+            os.nice(settings.JUDGE_BACKGROUND_NICE)
+
+        # a pool of its own, kept small: it competes with the web processes'
+        # pools for the same CPUs
+        pool_size = min(settings.JUDGE_POOL_SIZE, settings.JUDGE_REJUDGE_POOL_SIZE)
+        try:
+            with override_settings(JUDGE_POOL_SIZE=pool_size):
+                self._rejudge(challenges, options)
+        finally:
+            judge.shutdown_pool()
+
+    def _rejudge(self, challenges, options):
+        for challenge in challenges:
+            self.stdout.write(f'Rejudging "{challenge.title}"...')
+            stats = rejudge.rejudge_challenge(
+                challenge,
+                full=options['full'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                progress=lambda stats: self.stdout.write(f'  … {rejudge.summary(stats)}'),
+            )
+            self.stdout.write(self.style.SUCCESS(f'  ✓ {rejudge.summary(stats)}'))
@@ -1,8 +1,9 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from my_app import badges, stats
 from my_app.models import (
     Classroom, ClassroomMembership, Challenge, Tag,
-    Submission, Badge, UserBadge, Profile, check_user_badges
+    Submission, Badge, UserBadge, Profile
 )
 import random
 
@@ -624,9 +625,9 @@ class Command(BaseCommand):
                         'sample_output': chd.get('sample_output', ''),
                         'constraints': chd.get('constraints', ''),
                         'starter_code': chd.get('starter_code', ''),
-                        'hidden_tests': chd.get('hidden_tests', []),
                     }
                 )
+                challenge.set_tests(chd.get('hidden_tests', []))
                 if created:
                     for tag_name in chd.get('tags', []):
                         if tag_name in tags:
@@ -663,9 +664,11 @@ class Command(BaseCommand):
                     )
                     if status == 'passed':
                         total_points += ch.points
+                stats.rebuild_progress(ch, [student.id])
             profile.points = (profile.points or 0) + total_points
             profile.save()
-            check_user_badges(student)
+            badges.refresh_users([student.id])
+        stats.rebuild([student.id for student in students])
 
         self.stdout.write('  ✓ Sample submissions created')
         self.stdout.write(self.style.SUCCESS('\nDone! Sample data seeded successfully.'))
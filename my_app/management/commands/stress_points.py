@@ -0,0 +1,100 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from my_app import judge
+from my_app.models import ChallengeProgress, Challenge, Classroom, Profile, SolveCount, Submission, UserStats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Judges many passing submissions of one challenge at once and checks '
+            'every user was paid its points exactly once')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--submissions', type=int, default=8,
+                            help='Passing submissions per user, all judged at once')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the throwaway users and classroom')
+
+    def handle(self, *args, **options):
+        tag = f'stress-{uuid.uuid4().hex[:8]}'
+        mentor = User.objects.create_user(username=f'{tag}-mentor')
+        classroom = Classroom.objects.create(name=tag, mentor=mentor)
+        challenge = Challenge.objects.create(
+            title=tag, classroom=classroom, description='stress test', points=25,
+        )
+        users = [User.objects.create_user(username=f'{tag}-{i}') for i in range(options['users'])]
+        submissions = [
+            Submission.objects.create(user=user, challenge=challenge, code='print(1)', status='judging')
+            for _ in range(options['submissions'])
+            for user in users
+        ]
+        self.stdout.write(f'{len(submissions)} submissions from {len(users)} users, '
+                          f'{options["threads"]} threads, {connection.vendor}')
+
+        def save(submission):
+            try:
+                for attempt in range(20):
+                    try:
+                        return judge.save_judged(submission, 'passed', [])
+                    except OperationalError:  # sqlite: database is locked
+                        time.sleep(0.05 * (attempt + 1))
+                raise CommandError(f'submission {submission.id} could not be saved')
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(options['threads']) as executor:
+                paid = list(executor.map(save, submissions))
+            elapsed = time.perf_counter() - started
+
+            problems = []
+            points = dict(Profile.objects.filter(user__in=users).values_list('user_id', 'points'))
+            stats = {row.user_id: row for row in UserStats.objects.filter(user__in=users)}
+            solves = dict(SolveCount.objects.filter(user__in=users).values_list('user_id', 'solved'))
+            progress = dict(
+                ChallengeProgress.objects.filter(challenge=challenge).values_list('user_id', 'points_submission_id')
+            )
+            for user in users:
+                holders = list(Submission.objects.filter(user=user, challenge=challenge, points_awarded__gt=0)
+                               .values_list('id', flat=True))
+                found = {
+                    'profile points': points.get(user.id),
+                    'paid submissions': len(holders),
+                    'UserStats points': stats[user.id].points,
+                    'UserStats solved': stats[user.id].solved_count,
+                    'SolveCount': solves.get(user.id),
+                }
+                expected = {
+                    'profile points': challenge.points,
+                    'paid submissions': 1,
+                    'UserStats points': challenge.points,
+                    'UserStats solved': 1,
+                    'SolveCount': 1,
+                }
+                problems += [
+                    f'{user.username}: {name} is {found[name]}, expected {value}'
+                    for name, value in expected.items() if found[name] != value
+                ]
+                if holders and progress.get(user.id) != holders[0]:
+                    problems.append(f'{user.username}: ChallengeProgress points submission is not the paid one')
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=f'{tag}-').delete()
+
+        self.stdout.write(f'  judged in {elapsed:.2f}s, {sum(paid)} points paid '
+                          f'(expected {challenge.points * len(users)})')
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'  ✗ {problem}'))
+            raise CommandError(f'{len(problems)} problems')
+        self.stdout.write(self.style.SUCCESS('✓ Every user was paid exactly once'))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:54
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0023_submission_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='memory_limit_mb',
+            field=models.PositiveIntegerField(default=256, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='time_limit_ms',
+            field=models.PositiveIntegerField(default=2000, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='cpu_time_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='peak_memory_kb',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='wall_time_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('judging', 'Judging'), ('passed', 'Passed'), ('failed', 'Failed'), ('time_limit_exceeded', 'Time Limit Exceeded'), ('memory_limit_exceeded', 'Memory Limit Exceeded'), ('error', 'Error')], default='pending', max_length=30),
+        ),
+    ]
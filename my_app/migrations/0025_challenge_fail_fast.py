@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0024_judge_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='fail_fast',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0025_challenge_fail_fast'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='submission',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('judging', 'Judging'), ('passed', 'Passed'), ('failed', 'Failed'), ('time_limit_exceeded', 'Time Limit Exceeded'), ('memory_limit_exceeded', 'Memory Limit Exceeded'), ('output_limit_exceeded', 'Output Limit Exceeded'), ('error', 'Error')], default='pending', max_length=30),
+        ),
+    ]
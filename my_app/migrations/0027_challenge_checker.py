@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:07
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0026_submission_output_limit_exceeded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='checker',
+            field=models.CharField(choices=[('exact', 'Exact (surrounding whitespace ignored)'), ('tokens', 'Tokens (any whitespace between them)'), ('float', 'Tokens, numbers within epsilon'), ('unordered_lines', 'Lines in any order'), ('custom', 'Custom Python checker')], default='exact', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='checker_code',
+            field=models.TextField(blank=True, help_text='For the custom checker: define check(input, expected, output) returning True when the output is right.'),
+        ),
+        migrations.AddField(
+            model_name='challenge',
+            name='checker_epsilon',
+            field=models.FloatField(default=1e-06, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
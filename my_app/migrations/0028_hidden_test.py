@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0027_challenge_checker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='tests_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='HiddenTest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('input_text', models.TextField(blank=True)),
+                ('output_text', models.TextField(blank=True)),
+                ('input_file', models.CharField(blank=True, editable=False, max_length=100)),
+                ('output_file', models.CharField(blank=True, editable=False, max_length=100)),
+                ('input_size', models.PositiveBigIntegerField(default=0, editable=False)),
+                ('output_size', models.PositiveBigIntegerField(default=0, editable=False)),
+                ('checksum', models.CharField(blank=True, editable=False, max_length=64)),
+                ('challenge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_cases', to='my_app.challenge')),
+            ],
+            options={
+                'ordering': ['position', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.db import migrations
+
+from my_app import test_store
+
+
+def move_hidden_tests(apps, schema_editor):
+    Challenge = apps.get_model('my_app', 'Challenge')
+    HiddenTest = apps.get_model('my_app', 'HiddenTest')
+    inline_limit = settings.TEST_STORE_INLINE_LIMIT_KB * 1024
+
+    for challenge in Challenge.objects.iterator():
+        tests = challenge.hidden_tests if isinstance(challenge.hidden_tests, list) else []
+        cases = []
+        for position, test in enumerate(tests):
+            case = HiddenTest(challenge=challenge, position=position)
+            digests = []
+            for field, text in (("input", test.get("input", "") or ""), ("output", (test.get("output", "") or "").strip())):
+                text, stored, size, digest = test_store.pack(text, settings.TEST_STORE_ROOT, inline_limit)
+                setattr(case, f"{field}_text", text)
+                setattr(case, f"{field}_file", stored)
+                setattr(case, f"{field}_size", size)
+                digests.append(digest)
+            case.checksum = hashlib.sha256(":".join(digests).encode()).hexdigest()
+            cases.append(case)
+        HiddenTest.objects.bulk_create(cases)
+
+        # same as Challenge.refresh_tests_fingerprint()
+        checksums = "\n".join(case.checksum for case in cases)
+        challenge.tests_fingerprint = hashlib.sha256(checksums.encode()).hexdigest()
+        challenge.save(update_fields=["tests_fingerprint"])
+
+
+def restore_hidden_tests(apps, schema_editor):
+    Challenge = apps.get_model('my_app', 'Challenge')
+    HiddenTest = apps.get_model('my_app', 'HiddenTest')
+
+    def read(case, field):
+        stored = getattr(case, f"{field}_file")
+        if not stored:
+            return getattr(case, f"{field}_text")
+        path = os.path.join(settings.TEST_STORE_ROOT, stored)
+        return test_store.read_text(test_store.StoredFile(path, getattr(case, f"{field}_size")))
+
+    for challenge in Challenge.objects.iterator():
+        cases = HiddenTest.objects.filter(challenge=challenge).order_by("position", "id")
+        challenge.hidden_tests = [{"input": read(case, "input"), "output": read(case, "output")} for case in cases]
+        challenge.save(update_fields=["hidden_tests"])
+    HiddenTest.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0028_hidden_test'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_hidden_tests, restore_hidden_tests),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0029_move_hidden_tests'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='challenge',
+            name='hidden_tests',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0030_remove_challenge_hidden_tests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hiddentest',
+            name='failures',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hiddentest',
+            name='runs',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0031_hidden_test_failure_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='line_budget',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='lines_executed',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
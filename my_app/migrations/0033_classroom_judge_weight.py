@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:45
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0032_line_budget'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroom',
+            name='judge_weight',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_solves(apps, schema_editor):
+    Submission = apps.get_model('my_app', 'Submission')
+    SolveCount = apps.get_model('my_app', 'SolveCount')
+    rows = (
+        Submission.objects.filter(status='passed')
+        .values('user_id', 'challenge__classroom_id')
+        .annotate(solved=Count('challenge', distinct=True))
+    )
+    SolveCount.objects.bulk_create(
+        [SolveCount(user_id=row['user_id'], classroom_id=row['challenge__classroom_id'], solved=row['solved'])
+         for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0033_classroom_judge_weight'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolveCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('solved', models.PositiveIntegerField(default=0)),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solve_counts', to='my_app.classroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solve_counts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'classroom')},
+            },
+        ),
+        migrations.RunPython(count_solves, migrations.RunPython.noop),
+    ]
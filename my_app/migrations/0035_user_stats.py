@@ -0,0 +1,67 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def count_user_stats(apps, schema_editor):
+    # the same counts as stats.rebuild(), with the models as of this migration
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Submission = apps.get_model('my_app', 'Submission')
+    UserStats = apps.get_model('my_app', 'UserStats')
+
+    rows = {user_id: UserStats(user_id=user_id, solved_by_tag={}) for user_id in User.objects.values_list('id', flat=True)}
+    judged = Submission.objects.exclude(status__in=['pending', 'judging'])
+    passed = judged.filter(status='passed')
+    for row in judged.values('user_id').annotate(n=Count('id'), points=Sum('points_awarded')):
+        rows[row['user_id']].attempts = row['n']
+        rows[row['user_id']].points = row['points'] or 0
+    for row in passed.values('user_id').annotate(last=Max('created_at')):
+        rows[row['user_id']].last_solved_at = row['last']
+    for row in passed.values('user_id', 'challenge__difficulty').annotate(n=Count('challenge', distinct=True)):
+        stats = rows[row['user_id']]
+        stats.solved_count += row['n']
+        field = f"{row['challenge__difficulty']}_solved"
+        if hasattr(stats, field):
+            setattr(stats, field, row['n'])
+    for row in (
+        passed.filter(challenge__tags__isnull=False)
+        .values('user_id', 'challenge__tags')
+        .annotate(n=Count('challenge', distinct=True))
+    ):
+        rows[row['user_id']].solved_by_tag[str(row['challenge__tags'])] = row['n']
+    UserStats.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('my_app', '0034_solve_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('solved_count', models.PositiveIntegerField(default=0)),
+                ('easy_solved', models.PositiveIntegerField(default=0)),
+                ('medium_solved', models.PositiveIntegerField(default=0)),
+                ('hard_solved', models.PositiveIntegerField(default=0)),
+                ('solved_by_tag', models.JSONField(blank=True, default=dict)),
+                ('points', models.IntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_solved_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['user', '-created_at'], name='submission_user_recent_idx'),
+        ),
+        migrations.RunPython(count_user_stats, migrations.RunPython.noop),
+    ]
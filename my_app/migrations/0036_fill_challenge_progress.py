@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import Count, Q
+
+
+def fill_challenge_progress(apps, schema_editor):
+    Submission = apps.get_model('my_app', 'Submission')
+    ChallengeProgress = apps.get_model('my_app', 'ChallengeProgress')
+    rows = (
+        Submission.objects.exclude(status__in=['pending', 'judging'])
+        .values('user_id', 'challenge_id')
+        .annotate(passed=Count('id', filter=Q(status='passed')))
+    )
+    ChallengeProgress.objects.bulk_create(
+        [ChallengeProgress(user_id=row['user_id'], challenge_id=row['challenge_id'],
+                           status='passed' if row['passed'] else 'in_progress')
+         for row in rows],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0035_user_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_challenge_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_points_submission(apps, schema_editor):
+    # the submission that was paid, else the first one that passed
+    Submission = apps.get_model('my_app', 'Submission')
+    ChallengeProgress = apps.get_model('my_app', 'ChallengeProgress')
+    holders = {}
+    for user_id, challenge_id, submission_id, points in (
+        Submission.objects.filter(status='passed').order_by('id')
+        .values_list('user_id', 'challenge_id', 'id', 'points_awarded')
+    ):
+        key = (user_id, challenge_id)
+        if key not in holders or (points > 0 and not holders[key][1]):
+            holders[key] = (submission_id, points > 0)
+
+    changed = []
+    for progress in ChallengeProgress.objects.filter(status='passed'):
+        holder = holders.get((progress.user_id, progress.challenge_id))
+        if holder:
+            progress.points_submission_id = holder[0]
+            changed.append(progress)
+    ChallengeProgress.objects.bulk_update(changed, ['points_submission'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0036_fill_challenge_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengeprogress',
+            name='points_submission',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='my_app.submission'),
+        ),
+        migrations.RunPython(fill_points_submission, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:12
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_app', '0037_progress_points_submission'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='points',
+            field=models.IntegerField(db_index=True, default=0, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
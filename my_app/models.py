@@ -1,9 +1,16 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.conf import settings
+import hashlib
+import os
 import re
 from django.utils import timezone
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator    
+from django.core.exceptions import ValidationError
+from . import test_store
+from .checkers import CheckerError, load_checker
 
 User = get_user_model()
 
@@ -103,6 +110,8 @@ class Classroom(models.Model):
         related_name='created_classrooms',
         on_delete=models.CASCADE
     )
+    # share of the judge this classroom gets while others are judging too
+    judge_weight = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)])
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -153,6 +162,15 @@ class Challenge(models.Model):
         ("hard", "Hard"),
     ]
 
+    # how a test's output is compared to the expected one, see checkers.py
+    CHECKER_CHOICES = [
+        ("exact", "Exact (surrounding whitespace ignored)"),
+        ("tokens", "Tokens (any whitespace between them)"),
+        ("float", "Tokens, numbers within epsilon"),
+        ("unordered_lines", "Lines in any order"),
+        ("custom", "Custom Python checker"),
+    ]
+
     title = models.CharField(max_length=150)
     slug = models.SlugField(unique=True, blank=True)
     classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name="challenges")
@@ -165,7 +183,16 @@ class Challenge(models.Model):
     example_explanation = models.TextField(blank=True)
     constraints = models.TextField(blank=True)
     starter_code = models.TextField(blank=True)
-    hidden_tests = models.JSONField(default=dict) 
+    tests_fingerprint = models.CharField(max_length=64, blank=True, editable=False)  # changes whenever the hidden tests do
+    time_limit_ms = models.PositiveIntegerField(default=2000, validators=[MinValueValidator(1)])  # CPU time per test
+    memory_limit_mb = models.PositiveIntegerField(default=256, validators=[MinValueValidator(1)])  # per test
+    fail_fast = models.BooleanField(null=True, blank=True)  # stop grading at the first failed test; None = JUDGE_FAIL_FAST
+    # Python only: judge on lines executed per test instead of CPU time, so
+    # verdicts do not depend on judge load (see sandbox.py)
+    line_budget = models.PositiveBigIntegerField(null=True, blank=True)
+    checker = models.CharField(max_length=20, choices=CHECKER_CHOICES, default="exact")
+    checker_epsilon = models.FloatField(default=1e-6, validators=[MinValueValidator(0)])  # for the "float" checker
+    checker_code = models.TextField(blank=True, help_text="For the custom checker: define check(input, expected, output) returning True when the output is right.")
     difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, default='easy')
     tags = models.ManyToManyField(Tag, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -181,15 +208,153 @@ class Challenge(models.Model):
             self.slug = slug
         super().save(*args, **kwargs)  
 
+    def clean(self):
+        if self.checker == "custom":
+            try:
+                load_checker(("custom", self.checker_code))
+            except CheckerError as e:
+                raise ValidationError({"checker_code": str(e)})
+
+    def checker_spec(self):
+        if self.checker == "float":
+            return ("float", self.checker_epsilon)
+        if self.checker == "custom":
+            return ("custom", self.checker_code)
+        return (self.checker, None)
+
+    def set_tests(self, tests):
+        # replaces the hidden tests with [{"input": ..., "output": ...}, ...]
+        with transaction.atomic():
+            old_files = HiddenTest.files_of(self.test_cases.all())
+            self.test_cases.all().delete()
+            cases = []
+            for position, test in enumerate(tests):
+                case = HiddenTest(
+                    challenge=self,
+                    position=position,
+                    input_text=test.get("input", "") or "",
+                    output_text=test.get("output", "") or "",
+                )
+                case.pack()
+                cases.append(case)
+            HiddenTest.objects.bulk_create(cases)
+            self.refresh_tests_fingerprint()
+        HiddenTest.prune_files(old_files)
+
+    def refresh_tests_fingerprint(self):
+        checksums = self.test_cases.values_list("checksum", flat=True)
+        self.tests_fingerprint = hashlib.sha256("\n".join(checksums).encode()).hexdigest()
+        changed = (
+            Challenge.objects.filter(pk=self.pk)
+            .exclude(tests_fingerprint=self.tests_fingerprint)
+            .update(tests_fingerprint=self.tests_fingerprint)
+        )
+        if changed:
+            # failure rates are relative to the other tests, start over
+            self.test_cases.update(runs=0, failures=0)
+
     def __str__(self):
         return self.title
 
 
+class HiddenTest(models.Model):
+    # One hidden test of a challenge. Inputs and outputs past
+    # TEST_STORE_INLINE_LIMIT_KB are kept as files, see test_store.py.
+    challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name="test_cases")
+    position = models.PositiveIntegerField(default=0)
+    input_text = models.TextField(blank=True)
+    output_text = models.TextField(blank=True)
+    input_file = models.CharField(max_length=100, blank=True, editable=False)  # relative to TEST_STORE_ROOT
+    output_file = models.CharField(max_length=100, blank=True, editable=False)
+    input_size = models.PositiveBigIntegerField(default=0, editable=False)  # bytes
+    output_size = models.PositiveBigIntegerField(default=0, editable=False)
+    checksum = models.CharField(max_length=64, blank=True, editable=False)
+    runs = models.PositiveIntegerField(default=0, editable=False)  # graded submissions judged on it
+    failures = models.PositiveIntegerField(default=0, editable=False)  # ...that did not pass it
+
+    class Meta:
+        ordering = ["position", "id"]
+
+    @property
+    def failure_rate(self):
+        # smoothed, so a new test starts at 0.5 rather than 0 or 1
+        return (self.failures + 1) / (self.runs + 2)
+
+    def pack(self):
+        # moves large text to the store and recomputes sizes and checksum
+        self.output_text = self.output_text.strip()
+        digests = []
+        for field in ("input", "output"):
+            text = getattr(self, f"{field}_text")
+            stored = getattr(self, f"{field}_file")
+            if stored and not text:
+                # already in the store; the file name is its hash
+                digests.append(os.path.basename(stored).split(".")[0])
+                continue
+            text, stored, size, digest = test_store.pack(
+                text, settings.TEST_STORE_ROOT, settings.TEST_STORE_INLINE_LIMIT_KB * 1024
+            )
+            setattr(self, f"{field}_text", text)
+            setattr(self, f"{field}_file", stored)
+            setattr(self, f"{field}_size", size)
+            digests.append(digest)
+        self.checksum = hashlib.sha256(":".join(digests).encode()).hexdigest()
+
+    def _data(self, field):
+        stored = getattr(self, f"{field}_file")
+        if stored:
+            return test_store.StoredFile(os.path.join(settings.TEST_STORE_ROOT, stored), getattr(self, f"{field}_size"))
+        return getattr(self, f"{field}_text")
+
+    @property
+    def input_data(self):
+        return self._data("input")
+
+    @property
+    def output_data(self):
+        return self._data("output")
+
+    @staticmethod
+    def files_of(cases):
+        return {name for case in cases for name in (case.input_file, case.output_file) if name}
+
+    @staticmethod
+    def prune_files(names):
+        # files are shared between identical tests: only drop unreferenced ones
+        for name in names:
+            in_use = HiddenTest.objects.filter(models.Q(input_file=name) | models.Q(output_file=name)).exists()
+            if not in_use:
+                test_store.delete_blob(settings.TEST_STORE_ROOT, name)
+
+    def save(self, *args, **kwargs):
+        old_files = set()
+        if self.pk:
+            old_files = HiddenTest.files_of(HiddenTest.objects.filter(pk=self.pk))
+        self.pack()
+        super().save(*args, **kwargs)
+        self.challenge.refresh_tests_fingerprint()
+        HiddenTest.prune_files(old_files - HiddenTest.files_of([self]))
+
+    def delete(self, *args, **kwargs):
+        old_files = HiddenTest.files_of([self])
+        result = super().delete(*args, **kwargs)
+        self.challenge.refresh_tests_fingerprint()
+        HiddenTest.prune_files(old_files)
+        return result
+
+    def __str__(self):
+        return f"{self.challenge} #{self.position}"
+
+
 class Submission(models.Model):
     STATUS_CHOICES = [
         ("pending", "Pending"),
+        ("judging", "Judging"),
         ("passed", "Passed"),
         ("failed", "Failed"),
+        ("time_limit_exceeded", "Time Limit Exceeded"),
+        ("memory_limit_exceeded", "Memory Limit Exceeded"),
+        ("output_limit_exceeded", "Output Limit Exceeded"),
         ("error", "Error"),
     ]
 
@@ -210,16 +375,52 @@ class Submission(models.Model):
     challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name="submissions")
     code = models.TextField()
     language = models.CharField(max_length=20, choices=LANGUAGE_CHOICES, default='python')
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    status = models.CharField(max_length=30, choices=STATUS_CHOICES, default="pending")
     points_awarded = models.IntegerField(default=0,validators=[MinValueValidator(0)])
     attempt_number = models.PositiveIntegerField(default=1)  
+    results = models.JSONField(default=list, blank=True)  # per-test results, filled in by the judge
+    cpu_time_ms = models.PositiveIntegerField(null=True, blank=True)  # summed over all tests
+    wall_time_ms = models.PositiveIntegerField(null=True, blank=True)  # summed over all tests
+    lines_executed = models.PositiveBigIntegerField(null=True, blank=True)  # summed; only under a line budget
+    peak_memory_kb = models.PositiveIntegerField(null=True, blank=True)  # worst test
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # the judge queue polls for the oldest "pending" submission
+        indexes = [
+            models.Index(fields=["status", "id"], name="submission_queue_idx"),
+            models.Index(fields=["user", "-created_at"], name="submission_user_recent_idx"),
+        ]
     
     def __str__(self):
         return f"{self.user} - {self.challenge} (#{self.attempt_number})"
 
 
+class RejudgeRequest(models.Model):
+    # a rejudge waiting for, or being run by, `manage.py judge_worker`
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("error", "Error"),
+    ]
+
+    challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name="rejudge_requests")
+    full = models.BooleanField(default=False)  # run every test again, see rejudge.py
+    requested_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    summary = models.TextField(blank=True)  # rejudge.summary(), updated after every batch
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "id"], name="rejudge_queue_idx")]
+
+    def __str__(self):
+        return f"Rejudge {self.challenge} ({self.status})"
+
+
 class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
     challenge = models.ForeignKey(Challenge, on_delete=models.CASCADE, related_name="comments")
@@ -269,6 +470,35 @@ class UserBadge(models.Model):
         return f"{self.user} earned {self.badge}"
 
 
+class SolveCount(models.Model):
+    # Running count of the challenges a user has solved in a classroom, kept
+    # by the badge engine (badges.py) so badge checks never count submissions.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="solve_counts")
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name="solve_counts")
+    solved = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "classroom")
+
+
+class UserStats(models.Model):
+    # A user's totals, kept up to date as their submissions are judged (see
+    # stats.py) so pages never aggregate the submissions table.
+    user = models.OneToOneField(User, primary_key=True, related_name="stats", on_delete=models.CASCADE)
+    solved_count = models.PositiveIntegerField(default=0)  # distinct challenges
+    easy_solved = models.PositiveIntegerField(default=0)
+    medium_solved = models.PositiveIntegerField(default=0)
+    hard_solved = models.PositiveIntegerField(default=0)
+    solved_by_tag = models.JSONField(default=dict, blank=True)  # tag id -> challenges solved
+    points = models.IntegerField(default=0)  # sum of points_awarded
+    attempts = models.PositiveIntegerField(default=0)  # judged submissions
+    last_solved_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} stats"
+
+
 class Profile(models.Model):
     ROLE_CHOICES = [
         ('student', 'Student'),
@@ -279,7 +509,7 @@ class Profile(models.Model):
     
     level = models.CharField(max_length=20, default="Beginner")
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='student')
-    points = models.IntegerField(default=0,validators=[MinValueValidator(0)])
+    points = models.IntegerField(default=0,validators=[MinValueValidator(0)], db_index=True)  # leaderboard ranks
     def __str__(self):
         return f"{self.user.username} ({self.role})"
     
@@ -292,6 +522,10 @@ class ChallengeProgress(models.Model):
         ('in_progress', 'In Progress'),
         ('passed', 'Passed'),
     ])
+    # the submission that was paid this challenge's points (see award_points_for_submission)
+    points_submission = models.OneToOneField(
+        "Submission", null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -299,35 +533,58 @@ class ChallengeProgress(models.Model):
         unique_together = ('user', 'challenge')
 
 
-def check_user_badges(user):
-    solved_challenges = user.submissions.filter(status="passed").values_list("challenge", flat=True).distinct()
-    solved_count = solved_challenges.count()
-    badges = Badge.objects.all()
-
-    for badge in badges:
-        if UserBadge.objects.filter(user=user, badge=badge).exists():
-            continue
-
-        # FIRST SOLVE
-        if badge.requirement_type == Badge.FIRST_SOLVE and solved_count >= 1:
-            UserBadge.objects.create(user=user, badge=badge)
-        # CHALLENGE COUNT
-        if badge.requirement_type == Badge.CHALLENGE_COUNT and solved_count >= badge.value:
-            UserBadge.objects.create(user=user, badge=badge)
-
-        # CLASSROOM COMPLETE
-        if badge.requirement_type == Badge.CLASSROOM_COMPLETE:
-            # badge.value = classroom_id
-            classroom_id = badge.value
-            classroom = Classroom.objects.get(id=classroom_id)
-            total_challenges = classroom.challenges.count()
-            solved_in_class = classroom.challenges.filter(
-                submissions__user=user,
-                submissions__status="passed"
-            ).distinct().count()
-
-            if total_challenges > 0 and solved_in_class == total_challenges:
-                UserBadge.objects.create(user=user, badge=badge)
+def award_points_for_submission(submission):
+    # The first passed submission of a challenge claims the user's
+    # ChallengeProgress.points_submission, and only the claim pays points.
+    # (user, challenge) is unique there and the claim is one conditional
+    # UPDATE, which row-locks, so two passes judged at once cannot both be
+    # paid; points are added with F() so concurrent awards never overwrite
+    # each other. -> (points awarded, whether this was the first solve)
+
+    # 1) Only passed submissions can get points
+    if submission.status != "passed":
+        if submission.points_awarded != 0:
+            submission.points_awarded = 0
+            submission.save(update_fields=["points_awarded"])
+        return 0, False
+
+    with transaction.atomic():
+        # 2) Claim the first solve of THIS challenge
+        claimed = ChallengeProgress.objects.filter(
+            user_id=submission.user_id,
+            challenge_id=submission.challenge_id,
+            points_submission__isnull=True,
+        ).update(points_submission=submission, status="passed", updated_at=timezone.now())
+        if not claimed:
+            try:
+                with transaction.atomic():
+                    ChallengeProgress.objects.create(
+                        user_id=submission.user_id,
+                        challenge_id=submission.challenge_id,
+                        status="passed",
+                        points_submission=submission,
+                    )
+                claimed = True
+            except IntegrityError:
+                pass  # an earlier (or concurrent) submission holds the points
+
+        if not claimed:
+            if submission.points_awarded != 0:
+                submission.points_awarded = 0
+                submission.save(update_fields=["points_awarded"])
+            return 0, False
+
+        # 3) First time solving this challenge successfully → award points
+        challenge_points = submission.challenge.points
+        submission.points_awarded = challenge_points
+        submission.save(update_fields=["points_awarded"])
+
+        if not Profile.objects.filter(user_id=submission.user_id).update(points=F("points") + challenge_points):
+            Profile.objects.get_or_create(user_id=submission.user_id)
+            Profile.objects.filter(user_id=submission.user_id).update(points=F("points") + challenge_points)
+
+    return challenge_points, True
+
 
 def create_initial_badges():
     initial_badges = [
@@ -0,0 +1,243 @@
+import itertools
+import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import badges, judge
+from .stats import rebuild as rebuild_user_stats, rebuild_progress
+from .models import Profile, RejudgeRequest, Submission
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- REJUDGE ----------
+# Re-runs a challenge's submissions after its tests were edited, then puts
+# points and badges right. The results of a judged submission record the
+# checksum of every test (see judge.iter_judge_challenge), so a submission
+# that passed only runs the tests it has not seen yet, i.e. the ones added or
+# changed since, and keeps its results for the others. Everything else, and
+# anything judged before results had checksums, is judged again in full.
+# Editing the checker or the limits changes no checksum: use full=True then.
+#
+# Submissions are judged from several threads at once. The threads only wait
+# on the judge pool, so this keeps every worker busy instead of leaving them
+# idle between one submission's handful of tests; the tests wait in the
+# judge's "background" lane, so submissions judged by the same process
+# (judge_worker, see the queue below) go first (see scheduler.py). All
+# database writes happen on the calling thread, a batch at a time.
+
+BATCH_SIZE = 200
+
+
+def _judge_again(challenge, tests, submission, fail_fast, full):
+    # -> (status, results, tests run); runs on a worker thread, so no queries
+    kept = {}
+    if not full and submission.status == "passed":
+        kept = {r["checksum"]: r for r in submission.results if r.get("checksum")}
+
+    if not kept or not tests:
+        status, results = judge.judge_challenge(
+            challenge, submission.code, submission.language, fail_fast, tests, lane="background"
+        )
+        return status, results, len(tests)
+
+    todo = [test for test in tests if test.checksum not in kept]
+    if todo:
+        _, new_results = judge.judge_challenge(
+            challenge, submission.code, submission.language, fail_fast, todo, lane="background"
+        )
+        kept.update((result["checksum"], result) for result in new_results)
+
+    # tests that were removed drop out here
+    results = [kept[test.checksum] for test in tests]
+    return judge.overall_status(results), results, len(todo)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def correct_points(challenge, user_ids):
+    # The first passed submission of each user holds the challenge's points.
+    # -> (users whose solved state changed, net points change)
+    holders = defaultdict(list)
+    first_passed = {}
+    submissions = (
+        Submission.objects.filter(challenge=challenge, user_id__in=user_ids, status="passed")
+        | Submission.objects.filter(challenge=challenge, user_id__in=user_ids, points_awarded__gt=0)
+    ).only("id", "user_id", "status", "points_awarded").order_by("id")
+    for submission in submissions:
+        if submission.status == "passed":
+            first_passed.setdefault(submission.user_id, submission)
+        if submission.points_awarded:
+            holders[submission.user_id].append(submission)
+
+    changed = []
+    users_by_delta = defaultdict(list)
+    flipped = set()
+    for user_id in user_ids:
+        winner = first_passed.get(user_id)
+        held = holders.get(user_id, [])
+        if held == ([winner] if winner else []):
+            continue
+
+        old_total = sum(submission.points_awarded for submission in held)
+        # moving the points to another passed submission keeps the amount
+        amount = held[0].points_awarded if held else challenge.points
+        for submission in held:
+            if submission is not winner:
+                submission.points_awarded = 0
+                changed.append(submission)
+        if winner and winner not in held:
+            winner.points_awarded = amount
+            changed.append(winner)
+
+        delta = (winner.points_awarded if winner else 0) - old_total
+        if delta:
+            users_by_delta[delta].append(user_id)
+        if bool(winner) != bool(held):
+            flipped.add(user_id)
+
+    Submission.objects.bulk_update(changed, ["points_awarded"])
+    for delta, ids in users_by_delta.items():
+        Profile.objects.filter(user_id__in=ids).update(points=F("points") + delta)
+
+    return flipped, sum(delta * len(ids) for delta, ids in users_by_delta.items())
+
+
+def rejudge_challenge(challenge, full=False, workers=None, batch_size=BATCH_SIZE, progress=None):
+    # -> Counter of what happened; progress(stats) is called after each batch
+    tests = list(challenge.test_cases.all())
+    fail_fast = judge.uses_fail_fast(challenge)
+    if settings.JUDGE_POOL_SIZE == 0:
+        workers = 1  # code runs in this process, and limits only work on the main thread
+    workers = workers or max(1, settings.JUDGE_POOL_SIZE)
+
+    # queued submissions will be judged against the current tests anyway
+    submissions = (
+        challenge.submissions.exclude(status__in=["pending", "judging"])
+        .only("id", "user_id", "code", "language", "status", "results", "points_awarded")
+        .order_by("id")
+    )
+
+    def judge_again(submission):
+        try:
+            return _judge_again(challenge, tests, submission, fail_fast, full)
+        except Exception:
+            # counted in stats["errors"]; the rest of the rejudge goes on
+            logger.exception("Rejudging submission #%s failed", submission.id)
+            return None
+
+    stats = Counter()
+    executor = ThreadPoolExecutor(workers) if workers > 1 else None
+    try:
+        for batch in _batches(submissions.iterator(chunk_size=batch_size), batch_size):
+            outcomes = executor.map(judge_again, batch) if executor else map(judge_again, batch)
+
+            changed = []
+            for submission, outcome in zip(batch, outcomes):
+                if outcome is None:
+                    stats["errors"] += 1
+                    continue
+                status, results, ran = outcome
+                if ran == 0 and results == submission.results:
+                    stats["unchanged"] += 1
+                    continue
+                stats["rejudged"] += 1
+                stats["tests_run"] += ran
+                if submission.status == "passed" and status != "passed":
+                    stats["no_longer_passing"] += 1
+                elif submission.status != "passed" and status == "passed":
+                    stats["now_passing"] += 1
+                judge.set_results(submission, status, results)
+                changed.append(submission)
+
+            with transaction.atomic():
+                Submission.objects.bulk_update(changed, judge.RESULT_FIELDS)
+                user_ids = {s.user_id for s in changed}
+                flipped, points = correct_points(challenge, user_ids)
+                granted, revoked = badges.refresh_users(flipped)
+                rebuild_user_stats(user_ids)
+                rebuild_progress(challenge, user_ids)
+            stats["points_change"] += points
+            stats["badges_granted"] += granted
+            stats["badges_revoked"] += revoked
+            if progress:
+                progress(stats)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    return stats
+
+
+def summary(stats):
+    return (
+        f"{stats['rejudged']} rejudged ({stats['tests_run']} test runs), "
+        f"{stats['unchanged']} unchanged, {stats['now_passing']} now passing, "
+        f"{stats['no_longer_passing']} no longer passing, "
+        f"points {stats['points_change']:+d}, badges +{stats['badges_granted']}/-{stats['badges_revoked']}"
+        + (f", {stats['errors']} could not be judged" if stats["errors"] else "")
+    )
+
+
+# ---------- REJUDGE QUEUE ----------
+# Rejudges asked for from the admin are not run in the request: they are
+# queued as RejudgeRequests for `manage.py judge_worker`, which runs one at a
+# time next to the submissions it judges. Both share that worker's judge pool,
+# where rejudge tests wait in the "background" lane behind graded ones.
+
+def enqueue(challenges, full=False, user=None):
+    return RejudgeRequest.objects.bulk_create([
+        RejudgeRequest(challenge=challenge, full=full, requested_by=user) for challenge in challenges
+    ])
+
+
+def claim_next_request():
+    while True:
+        request_id = (
+            RejudgeRequest.objects.filter(status="pending").order_by("id").values_list("id", flat=True).first()
+        )
+        if request_id is None:
+            return None
+        claimed = RejudgeRequest.objects.filter(id=request_id, status="pending").update(
+            status="running", updated_at=timezone.now(),
+        )
+        if claimed:
+            return RejudgeRequest.objects.select_related("challenge__classroom").get(id=request_id)
+        # another worker got there first, try the next one
+
+
+def run_request(request):
+    def progress(stats):
+        RejudgeRequest.objects.filter(id=request.id).update(summary=summary(stats), updated_at=timezone.now())
+
+    try:
+        stats = rejudge_challenge(request.challenge, full=request.full, progress=progress)
+    except Exception as e:
+        request.status = "error"
+        request.summary = f"{type(e).__name__}: {e}"
+    else:
+        request.status = "done"
+        request.summary = summary(stats)
+    request.save(update_fields=["status", "summary", "updated_at"])
+    return request
+
+
+def heartbeat(request):
+    RejudgeRequest.objects.filter(id=request.id, status="running").update(updated_at=timezone.now())
+
+
+def requeue_stale_requests(max_age):
+    # a rejudge whose worker died (no heartbeat) is started again from the top
+    return RejudgeRequest.objects.filter(
+        status="running",
+        updated_at__lt=timezone.now() - max_age,
+    ).update(status="pending", updated_at=timezone.now())
@@ -0,0 +1,456 @@
+import codecs
+import hashlib
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from . import checkers, test_store
+from .sandbox import (
+    WALL_TIME_FACTOR,
+    OutputLimitExceeded,
+    OutputMismatch,
+    OutputSink,
+    make_result,
+    read_proc_status_kb,
+    reset_peak_rss,
+    run_test as run_python_test,
+)
+
+
+# ---------- LANGUAGE RUNNERS ----------
+# One runner per entry in Submission.LANGUAGE_CHOICES the judge can handle.
+# Like sandbox.py this runs inside the judge workers and stays Django-free.
+#
+# A runner first prepares a submission into an artifact (for compiled
+# languages: the compiled program), then runs that artifact once per test.
+# Artifacts live on disk under a directory named after a hash of the
+# language, the build command and the source, so recompiling the same code —
+# another test of the same submission, a rerun, a resubmit — is a directory
+# lookup instead of a compiler run. Builds happen in a private temp directory
+# that is renamed into place, so two workers compiling the same source at
+# once can't see a half-written artifact.
+#
+# Every language but Python runs as a child process, and a child process is
+# only as contained as the jail it is started in (WORKER_CONFIG["jail_command"],
+# see JUDGE_JAIL_COMMAND): without one, ProcessRunner refuses to compile or
+# run anything. Which languages are offered at all is the judge's call, see
+# judge.get_runner().
+
+COMPILE_TIMEOUT = 30  # seconds
+COMPILE_ERROR_FILE = "compile_error.txt"
+STDERR_LIMIT = 64 * 1024  # bytes of a program's stderr kept for the error message
+STDOUT_CHUNK = 64 * 1024  # stdout is read and judged this much at a time
+FILE_SIZE_LIMIT = 16 * 1024 * 1024  # biggest file a test run may write
+NOT_JAILED = "this judge has no jail for programs outside Python (JUDGE_JAIL_COMMAND)"
+
+
+class Runner:
+    language = None
+    toolchain = ()  # executables that must be on PATH
+    prepare_in_worker = False  # building is real work: keep it off the web process
+    time_factor = 1  # startup-heavy runtimes get a longer time limit
+
+    def available(self):
+        return all(shutil.which(tool) for tool in self.toolchain)
+
+    def prepare(self, source, artifact_root, max_artifacts):
+        # -> {"artifact": ..., "error": compiler output or None}
+        return {"artifact": source, "error": None}
+
+    def run(self, artifact, test_input, checker, time_limit_ms, memory_limit_mb, output_limit_kb,
+            line_budget=None):
+        # line_budget (see sandbox.py) only applies to Python
+        raise NotImplementedError
+
+
+class PythonRunner(Runner):
+    # runs in the worker itself with the exec sandbox (no child process)
+    language = "python"
+
+    def available(self):
+        return True
+
+    def run(self, artifact, test_input, checker, time_limit_ms, memory_limit_mb, output_limit_kb,
+            line_budget=None):
+        return run_python_test(
+            artifact, test_input, checker, time_limit_ms, memory_limit_mb, output_limit_kb,
+            isolate=WORKER_CONFIG["fork_per_job"], monitor_limits=WORKER_CONFIG["monitor_limits"],
+            line_budget=line_budget,
+        )
+
+
+class ProcessRunner(Runner):
+    # Runs every test as a child process. Commands are run from the artifact
+    # directory; "{mem}" in run_command is replaced by the memory limit in MB.
+    source_name = None
+    compile_command = None  # None for interpreted languages
+    run_command = None
+    # runtimes that reserve a lot of virtual memory up front (JVM, Go, V8,
+    # Ruby) can't run under RLIMIT_AS; they get their own heap flag where
+    # there is one and are otherwise held to the limit by their peak RSS
+    limit_address_space = True
+    prepare_in_worker = True
+
+    def prepare(self, source, artifact_root, max_artifacts):
+        if not WORKER_CONFIG["jail_command"]:
+            return {"artifact": None, "error": NOT_JAILED}
+        build_key = "\0".join([self.language, " ".join(self.compile_command or ()), source])
+        digest = hashlib.sha256(build_key.encode()).hexdigest()
+        final_dir = os.path.join(artifact_root, f"{self.language}-{digest}")
+
+        if os.path.isdir(final_dir):
+            os.utime(final_dir)  # most recently used, see prune_artifacts
+            return self._load(final_dir)
+
+        os.makedirs(artifact_root, exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix=".build-", dir=artifact_root)
+        with open(os.path.join(build_dir, self.source_name), "w") as f:
+            f.write(source)
+
+        if self.compile_command:
+            error = self._compile(build_dir, artifact_root)
+            if error is not None:
+                # failed builds are cached too: resubmitting them is common
+                with open(os.path.join(build_dir, COMPILE_ERROR_FILE), "w") as f:
+                    f.write(error)
+
+        try:
+            os.rename(build_dir, final_dir)
+        except OSError:
+            # another worker built the same source first
+            shutil.rmtree(build_dir, ignore_errors=True)
+        else:
+            prune_artifacts(artifact_root, max_artifacts)
+
+        return self._load(final_dir)
+
+    def _compile(self, build_dir, artifact_root):
+        env = dict(os.environ, GOCACHE=os.path.join(artifact_root, ".gocache"))
+        try:
+            proc = subprocess.run(
+                _jailed(self.compile_command, build_dir),
+                cwd=build_dir,
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=COMPILE_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            return f"compilation took longer than {COMPILE_TIMEOUT}s"
+        if proc.returncode != 0:
+            return (proc.stderr or proc.stdout).strip()[-4000:]
+        return None
+
+    def _load(self, artifact_dir):
+        error_path = os.path.join(artifact_dir, COMPILE_ERROR_FILE)
+        if os.path.exists(error_path):
+            with open(error_path) as f:
+                return {"artifact": None, "error": f.read()}
+        return {"artifact": artifact_dir, "error": None}
+
+    def run(self, artifact, test_input, checker, time_limit_ms, memory_limit_mb, output_limit_kb,
+            line_budget=None):
+        if not WORKER_CONFIG["jail_command"]:
+            return make_result("error", f"__ERROR__ {NOT_JAILED}", 0, 0, None)
+        command = _jailed([part.format(mem=memory_limit_mb or 256) for part in self.run_command], artifact)
+        if time_limit_ms:
+            time_limit_ms *= self.time_factor
+        return run_process(
+            command,
+            artifact,
+            test_input,
+            checker,
+            time_limit_ms,
+            memory_limit_mb,
+            output_limit_kb,
+            self.limit_address_space,
+        )
+
+
+class CRunner(ProcessRunner):
+    language = "c"
+    toolchain = ("gcc",)
+    source_name = "main.c"
+    compile_command = ["gcc", "-O2", "-std=gnu11", "-pipe", "-o", "main", "main.c", "-lm"]
+    run_command = ["./main"]
+
+
+class CppRunner(ProcessRunner):
+    language = "cpp"
+    toolchain = ("g++",)
+    source_name = "main.cpp"
+    compile_command = ["g++", "-O2", "-std=gnu++17", "-pipe", "-o", "main", "main.cpp"]
+    run_command = ["./main"]
+
+
+class JavaRunner(ProcessRunner):
+    language = "java"
+    toolchain = ("javac", "java")
+    source_name = "Main.java"
+    compile_command = ["javac", "-encoding", "UTF-8", "Main.java"]
+    run_command = ["java", "-Xmx{mem}m", "-Xss64m", "-XX:+UseSerialGC", "-cp", ".", "Main"]
+    limit_address_space = False
+    time_factor = 2
+
+
+class GoRunner(ProcessRunner):
+    language = "go"
+    toolchain = ("go",)
+    source_name = "main.go"
+    compile_command = ["go", "build", "-o", "main", "main.go"]
+    run_command = ["./main"]
+    limit_address_space = False
+
+
+class JavaScriptRunner(ProcessRunner):
+    language = "javascript"
+    toolchain = ("node",)
+    source_name = "main.js"
+    run_command = ["node", "--max-old-space-size={mem}", "main.js"]
+    limit_address_space = False
+
+
+class RubyRunner(ProcessRunner):
+    language = "ruby"
+    toolchain = ("ruby",)
+    source_name = "main.rb"
+    run_command = ["ruby", "main.rb"]
+    limit_address_space = False
+
+
+class PhpRunner(ProcessRunner):
+    language = "php"
+    toolchain = ("php",)
+    source_name = "main.php"
+    run_command = ["php", "main.php"]
+
+
+RUNNERS = {
+    runner.language: runner
+    for runner in (
+        PythonRunner(), CRunner(), CppRunner(), JavaRunner(), GoRunner(),
+        JavaScriptRunner(), RubyRunner(), PhpRunner(),
+    )
+}
+
+
+def get_runner(language):
+    runner = RUNNERS.get(language)
+    if runner is None or not runner.available():
+        return None
+    return runner
+
+
+def prune_artifacts(artifact_root, max_artifacts):
+    # keep the max_artifacts most recently used artifacts
+    if not max_artifacts:
+        return
+    try:
+        entries = [
+            entry for entry in os.scandir(artifact_root)
+            if entry.is_dir() and not entry.name.startswith(".")
+        ]
+    except OSError:
+        return
+    if len(entries) <= max_artifacts:
+        return
+
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - max_artifacts]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+# ---------- PROCESS EXECUTION ----------
+
+def _jailed(command, directory):
+    jail = [part.replace("{dir}", directory) for part in WORKER_CONFIG["jail_command"]]
+    return [*jail, *command]
+
+
+def _limited(command, time_limit, memory_limit_mb):
+    # Limits are applied by a tiny sh wrapper rather than a preexec_fn: with a
+    # preexec_fn the child is a full fork of the worker, and Linux carries the
+    # worker's peak RSS through exec into the child's ru_maxrss.
+    limits = ["-c 0", f"-f {FILE_SIZE_LIMIT // 512}"]  # -f counts 512-byte blocks
+    if time_limit:
+        # the wall-clock timer normally fires first; this is the backstop
+        limits.append(f"-t {int(time_limit) + 2}")
+    if memory_limit_mb:
+        limits.append(f"-v {memory_limit_mb * 1024}")
+    script = "".join(f"ulimit {limit}; " for limit in limits) + 'exec "$@"'
+    return ["/bin/sh", "-c", script, "sh", *command]
+
+
+def _sample_peak_rss(pid, done, samples):
+    # Linux carries the spawning worker's peak RSS through exec into the
+    # child's ru_maxrss, so below that baseline ru_maxrss says nothing and
+    # the child's own VmHWM is sampled instead.
+    path = f"/proc/{pid}/status"
+    while True:
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        samples.append(int(line.split()[1]))
+                        break
+        except (OSError, ValueError):
+            return
+        if done.wait(0.005):
+            return
+
+
+def _feed_stdin(stream, data):
+    try:
+        for chunk in test_store.iter_bytes(data):
+            stream.write(chunk)
+    except (BrokenPipeError, OSError):
+        pass  # the program stopped reading, that's its business
+    finally:
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+
+def _read_output(stream, sink):
+    # feeds the sink until EOF, or until it has seen enough for a verdict
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        while True:
+            chunk = stream.read1(STDOUT_CHUNK)
+            if not chunk:
+                sink.write(decoder.decode(b"", final=True))
+                return True
+            sink.write(decoder.decode(chunk))
+    except (OutputLimitExceeded, OutputMismatch):
+        return False
+
+
+def run_process(command, cwd, test_input, checker=None, time_limit_ms=None, memory_limit_mb=None,
+                output_limit_kb=None, limit_address_space=True):
+    time_limit = time_limit_ms / 1000 if time_limit_ms else None
+
+    with tempfile.TemporaryFile() as stderr_file:
+        reset_peak_rss()
+        baseline_kb = read_proc_status_kb("VmHWM")
+        wall_start = time.perf_counter()
+        proc = subprocess.Popen(
+            _limited(command, time_limit, memory_limit_mb if limit_address_space else None),
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            env={"PATH": os.environ.get("PATH", ""), "LANG": "C.UTF-8"},
+            start_new_session=True,  # so a timeout kills anything it spawned too
+        )
+
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+        killer = None
+        if time_limit:
+            killer = threading.Timer(time_limit * WALL_TIME_FACTOR, kill)
+            killer.start()
+
+        feeder = threading.Thread(target=_feed_stdin, args=(proc.stdin, test_input), daemon=True)
+        feeder.start()
+
+        sampled = []
+        sampling_done = threading.Event()
+        sampler = threading.Thread(target=_sample_peak_rss, args=(proc.pid, sampling_done, sampled), daemon=True)
+        sampler.start()
+
+        sink = OutputSink(checker, output_limit_kb * 1024 if output_limit_kb else None)
+        if not _read_output(proc.stdout, sink):
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        proc.stdout.close()
+
+        # wait4 gives this child's own CPU time and peak RSS
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        wall_time = time.perf_counter() - wall_start
+        sampling_done.set()
+        sampler.join()
+
+        if killer is not None:
+            killer.cancel()
+        feeder.join(timeout=1)
+
+        stderr_file.seek(0)
+        stderr = stderr_file.read(STDERR_LIMIT).decode(errors="replace")
+
+    cpu_time = usage.ru_utime + usage.ru_stime
+    # ru_maxrss is in KB on Linux but in bytes on macOS
+    peak_memory_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    if baseline_kb is not None and peak_memory_kb <= baseline_kb:
+        peak_memory_kb = max(sampled, default=None)
+
+    if sink.over_limit or sink.mismatched:
+        # stopped by us, not by the program
+        return sink.result(cpu_time, wall_time, peak_memory_kb)
+
+    if timed_out.is_set() or (time_limit and cpu_time > time_limit) or proc.returncode == -signal.SIGXCPU:
+        return make_result("time_limit_exceeded", "__ERROR__ Time limit exceeded", cpu_time, wall_time, peak_memory_kb)
+
+    over_memory = bool(memory_limit_mb and peak_memory_kb) and peak_memory_kb > memory_limit_mb * 1024
+    if over_memory and not limit_address_space:
+        return make_result("memory_limit_exceeded", "__ERROR__ Memory limit exceeded", cpu_time, wall_time, peak_memory_kb)
+
+    if proc.returncode != 0:
+        out_of_memory = (
+            "OutOfMemoryError" in stderr
+            or "bad_alloc" in stderr
+            or "out of memory" in stderr.lower()
+            or over_memory
+        )
+        if out_of_memory:
+            return make_result("memory_limit_exceeded", "__ERROR__ Memory limit exceeded", cpu_time, wall_time, peak_memory_kb)
+
+        message = stderr.strip().splitlines()[-1] if stderr.strip() else f"exit status {proc.returncode}"
+        return make_result("error", f"__ERROR__ {message}", cpu_time, wall_time, peak_memory_kb)
+
+    return sink.result(cpu_time, wall_time, peak_memory_kb)
+
+
+# ---------- WORKER ENTRY POINTS ----------
+# What the judge pool actually calls.
+
+# set in each judge process (or subinterpreter) by init_worker(); the defaults
+# are for judging in-process (JUDGE_POOL_SIZE=0), where forking the web worker
+# is not an option
+WORKER_CONFIG = {"fork_per_job": False, "monitor_limits": False, "jail_command": ()}
+
+
+def init_worker(config):
+    WORKER_CONFIG.update(config)
+
+
+def prepare(language, source, artifact_root, max_artifacts=None):
+    return RUNNERS[language].prepare(source, artifact_root, max_artifacts)
+
+
+def run_case(language, artifact, test_input, expected_output=None, checker=None, time_limit_ms=None,
+             memory_limit_mb=None, output_limit_kb=None, line_budget=None):
+    # checker is the challenge's checker spec, see checkers.py; the test's
+    # input and expected output may be test_store.StoredFiles
+    try:
+        test_checker = checkers.make_checker(checker, test_input, expected_output)
+    except checkers.CheckerError as e:
+        return make_result("checker_error", f"__ERROR__ Checker failed: {e}", 0, 0, None)
+    return RUNNERS[language].run(
+        artifact, test_input, test_checker, time_limit_ms, memory_limit_mb, output_limit_kb, line_budget
+    )
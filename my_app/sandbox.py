@@ -0,0 +1,618 @@
+import ast
+import bisect
+import builtins
+import collections
+import contextlib
+import functools
+import heapq
+import itertools
+import math
+import os
+import pickle
+import signal
+import sys
+import threading
+import time
+import types
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from . import test_store
+
+
+# This module runs inside the judge worker processes, so it must stay free of
+# Django imports: workers only ever execute student code, they never touch
+# the database or the settings.
+
+# builtins student code is never allowed to reach
+BLOCKED_BUILTINS = (
+    "open", "exec", "eval", "compile", "__import__", "breakpoint", "exit", "quit",
+    "getattr", "setattr", "delattr", "hasattr",  # replaced by the guarded versions below
+)
+
+# ---------- ATTRIBUTE GUARD ----------
+# Leaving names out of the builtins and the allowed modules keeps nothing
+# out of reach on its own: from any object, introspection leads to the rest
+# of the process. A Python function's __globals__ is its module's namespace
+# (collections.namedtuple.__globals__["_sys"].modules["os"]),
+# object.__subclasses__() lists every class loaded, a builtin's __self__ is
+# the builtins module, and a frame's f_back/f_globals lead to the judge's own
+# frames. So student code may not use those attributes at all: compile_code
+# refuses code that names one (in `obj.attr` or a match pattern), and the
+# getattr family refuses them by string. Dunder attributes are allowed only
+# from DUNDER_ALLOWED, the ones classes written by students need; single
+# underscore names are the student's own.
+# This is a guard against the known ways out, not a proof; the judge process
+# around the code (forked per test, rlimits) is what contains anything that
+# still gets through.
+
+DUNDER_ALLOWED = frozenset(
+    f"__{name}__" for name in (
+        "init new del repr str format bytes hash bool len iter next reversed contains call "
+        "getitem setitem delitem missing enter exit "
+        "eq ne lt le gt ge "
+        "add sub mul matmul truediv floordiv mod divmod pow lshift rshift and xor or "
+        "radd rsub rmul rmatmul rtruediv rfloordiv rmod rdivmod rpow rlshift rrshift rand rxor ror "
+        "iadd isub imul imatmul itruediv ifloordiv imod ipow ilshift irshift iand ixor ior "
+        "neg pos abs invert complex int float index round trunc floor ceil "
+        "class name qualname doc post_init"
+    ).split()
+)
+
+# frames and code objects, from generators, coroutines and tracebacks
+BLOCKED_ATTRIBUTES = frozenset({
+    "gi_frame", "gi_code", "cr_frame", "cr_code", "ag_frame", "ag_code", "tb_frame", "tb_next",
+    "f_back", "f_builtins", "f_code", "f_globals", "f_locals",
+})
+
+
+def attribute_allowed(name):
+    if name.startswith("__") and name.endswith("__"):
+        return name in DUNDER_ALLOWED
+    return name not in BLOCKED_ATTRIBUTES
+
+
+def _check_attribute(name):
+    if not isinstance(name, str):
+        raise TypeError("attribute name must be string")
+    if not attribute_allowed(name):
+        raise AttributeError(f"access to '{name}' is not allowed")
+
+
+def _safe_getattr(obj, name, *default):
+    _check_attribute(name)
+    return getattr(obj, name, *default)
+
+
+def _safe_setattr(obj, name, value):
+    _check_attribute(name)
+    setattr(obj, name, value)
+
+
+def _safe_delattr(obj, name):
+    _check_attribute(name)
+    delattr(obj, name)
+
+
+def _safe_hasattr(obj, name):
+    _check_attribute(name)
+    return hasattr(obj, name)
+
+
+def compile_guarded(source, filename):
+    # compile(), refusing code that names an attribute it may not use
+    tree = ast.parse(source, filename)
+    lines = source.splitlines()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute):
+            names = [node.attr]
+        elif isinstance(node, ast.MatchClass):
+            names = node.kwd_attrs
+        else:
+            continue
+        for name in names:
+            if not attribute_allowed(name):
+                raise SyntaxError(
+                    f"access to '{name}' is not allowed",
+                    (filename, node.lineno, node.col_offset + 1, lines[node.lineno - 1]),
+                )
+    return compile(tree, filename, "exec")
+
+
+# The only modules student code may import. They are imported here, once per
+# judge process, so `import math` in a submission is a dict lookup. Student
+# code never gets the module itself, whose namespace leads to the rest of
+# the process (collections._sys.modules["os"]): it gets a read-only view
+# holding the module's public functions, classes and constants, and no
+# modules. What those are written in Python (namedtuple, Counter,
+# heapq.nlargest, ...) carry their module's globals, which the attribute
+# guard above keeps out of reach.
+
+class _ReadOnly(type):
+    # None, like __hash__ = None: setting or deleting a view's attribute
+    # through its class is a TypeError
+    __setattr__ = None
+    __delattr__ = None
+
+
+def _module_view(module):
+    public = {
+        # staticmethod: a Python function stored on a class would bind
+        name: staticmethod(value) if isinstance(value, types.FunctionType) else value
+        for name, value in vars(module).items()
+        if not name.startswith("_") and not isinstance(value, types.ModuleType)
+    }
+    # no __slots__ entries: the instance holds nothing and takes no attributes
+    return _ReadOnly(module.__name__, (), {"__slots__": (), **public})()
+
+
+ALLOWED_MODULES = {
+    module.__name__: _module_view(module)
+    for module in (math, collections, itertools, heapq, bisect)
+}
+
+
+def _safe_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level == 0 and name in ALLOWED_MODULES:
+        return ALLOWED_MODULES[name]
+    raise ImportError(f"import of '{name}' is not allowed")
+
+
+# Built once per process; every test run gets a shallow copy plus its own
+# input/print shims, so student code can't leak changes into the next test.
+SAFE_BUILTINS = {
+    k: getattr(builtins, k)
+    for k in dir(builtins)
+    if not k.startswith("_")
+    and k not in BLOCKED_BUILTINS
+}
+SAFE_BUILTINS["__import__"] = _safe_import
+SAFE_BUILTINS["__build_class__"] = builtins.__build_class__  # class statements
+SAFE_BUILTINS.update(getattr=_safe_getattr, setattr=_safe_setattr, delattr=_safe_delattr, hasattr=_safe_hasattr)
+
+# wall-clock limit = CPU time limit * WALL_TIME_FACTOR
+WALL_TIME_FACTOR = 2
+
+
+class TimeLimitExceeded(BaseException):
+    # BaseException so a student's `except Exception:` can't swallow it
+    pass
+
+
+def _raise_time_limit(signum, frame):
+    raise TimeLimitExceeded()
+
+
+class OutputLimitExceeded(BaseException):
+    pass
+
+
+class LineBudgetExceeded(BaseException):
+    pass
+
+
+LINE_BUDGET_ERROR = "__ERROR__ Line budget exceeded"
+
+
+class OutputMismatch(BaseException):
+    # the output already differs from the expected one: no point running on
+    pass
+
+
+# ---------- RESOURCE LIMITS ----------
+# The time limit is armed as two interval timers: ITIMER_PROF for CPU time and
+# ITIMER_REAL as a wall-clock guard. RLIMIT_CPU is set a couple of seconds past
+# the limit as a backstop: if student code swallows TimeLimitExceeded with a
+# bare `except:`, the kernel kills the worker and the pool replaces it. The
+# memory limit is RLIMIT_AS relative to what the worker already has mapped, so
+# an over-allocation raises MemoryError inside the student's code.
+# Timers only work on the main thread of a process, which is where pool
+# workers run jobs; in-process judging (JUDGE_POOL_SIZE=0) from a threaded dev
+# server runs unlimited.
+
+def read_proc_status_kb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    # writing 5 to clear_refs resets VmHWM (Linux >= 4.0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _address_space_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Limits:
+    def __init__(self, time_limit_ms, memory_limit_mb):
+        self.time_limit = time_limit_ms / 1000 if time_limit_ms else None
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.armed = threading.current_thread() is threading.main_thread() and hasattr(signal, "setitimer")
+        self.saved_as = None
+        self.saved_cpu = None
+
+    def __enter__(self):
+        if self.time_limit and self.armed:
+            signal.signal(signal.SIGPROF, _raise_time_limit)
+            signal.signal(signal.SIGALRM, _raise_time_limit)
+            signal.setitimer(signal.ITIMER_PROF, self.time_limit)
+            signal.setitimer(signal.ITIMER_REAL, self.time_limit * WALL_TIME_FACTOR)
+
+            if resource is not None:
+                self.saved_cpu = resource.getrlimit(resource.RLIMIT_CPU)
+                used = resource.getrusage(resource.RUSAGE_SELF)
+                backstop = int(used.ru_utime + used.ru_stime + self.time_limit) + 2
+                if self.saved_cpu[1] == resource.RLIM_INFINITY or backstop <= self.saved_cpu[1]:
+                    resource.setrlimit(resource.RLIMIT_CPU, (backstop, self.saved_cpu[1]))
+
+        if self.memory_limit and self.armed and resource is not None:
+            mapped = _address_space_bytes()
+            if mapped is not None:
+                self.saved_as = resource.getrlimit(resource.RLIMIT_AS)
+                cap = mapped + self.memory_limit
+                if self.saved_as[1] == resource.RLIM_INFINITY or cap <= self.saved_as[1]:
+                    resource.setrlimit(resource.RLIMIT_AS, (cap, self.saved_as[1]))
+        return self
+
+    def __exit__(self, *exc):
+        # a timer can still fire while we disarm it; the program has finished
+        # by then, so retry until every limit is restored
+        while True:
+            try:
+                self._restore()
+                return False
+            except TimeLimitExceeded:
+                continue
+
+    def _restore(self):
+        if self.time_limit and self.armed:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        if self.saved_cpu is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, self.saved_cpu)
+        if self.saved_as is not None:
+            resource.setrlimit(resource.RLIMIT_AS, self.saved_as)
+
+
+# ---------- MONITORED LIMITS ----------
+# Subinterpreters (see subinterpreters.py) share their process, and signals
+# and rlimits only work for a whole process, so there the time limit is
+# checked by the student's code itself: sys.monitoring (Python 3.12+) calls
+# back at every function start and every jump in the submission's code
+# objects, and the callback raises TimeLimitExceeded once the thread's CPU
+# time or the wall clock is past the limit. Only the submission's own code
+# objects are instrumented, so the judge's code runs at full speed and can't
+# be interrupted. A single long call into C (`10 ** 10 ** 8`) is not
+# interrupted, and there is no memory limit.
+
+MONITORING_TOOL_ID = 4  # unassigned by Python; 0-2 and 5 are taken by convention
+CHECK_EVERY = 1000  # events between looks at the clock
+
+
+def code_objects(code):
+    # a code object and every function, class and comprehension nested in it
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from code_objects(const)
+
+
+class _MonitoredLimits:
+    def __init__(self, code, time_limit_ms):
+        self.code = code
+        self.time_limit = time_limit_ms / 1000 if time_limit_ms else None
+        self.armed = self.time_limit is not None and hasattr(sys, "monitoring")
+
+    def _check(self, *args):
+        # reading the clocks costs more than the rest of the callback
+        self.countdown -= 1
+        if self.countdown:
+            return
+        self.countdown = CHECK_EVERY
+        if time.thread_time() > self.cpu_deadline or time.perf_counter() > self.wall_deadline:
+            raise TimeLimitExceeded()
+
+    def __enter__(self):
+        if not self.armed:
+            return self
+        monitoring = sys.monitoring
+        events = monitoring.events.PY_START | monitoring.events.JUMP
+        self.countdown = CHECK_EVERY
+        self.cpu_deadline = time.thread_time() + self.time_limit
+        self.wall_deadline = time.perf_counter() + self.time_limit * WALL_TIME_FACTOR
+
+        monitoring.use_tool_id(MONITORING_TOOL_ID, "codequest-judge")
+        monitoring.register_callback(MONITORING_TOOL_ID, monitoring.events.PY_START, self._check)
+        monitoring.register_callback(MONITORING_TOOL_ID, monitoring.events.JUMP, self._check)
+        for code in code_objects(self.code):
+            monitoring.set_local_events(MONITORING_TOOL_ID, code, events)
+        return self
+
+    def __exit__(self, *exc):
+        if self.armed:
+            monitoring = sys.monitoring
+            # the code object is cached and reused by the next test
+            for code in code_objects(self.code):
+                monitoring.set_local_events(MONITORING_TOOL_ID, code, 0)
+            monitoring.register_callback(MONITORING_TOOL_ID, monitoring.events.PY_START, None)
+            monitoring.register_callback(MONITORING_TOOL_ID, monitoring.events.JUMP, None)
+            monitoring.free_tool_id(MONITORING_TOOL_ID)
+        return False
+
+
+# ---------- LINE BUDGET ----------
+# Time limits depend on how busy the judge host is: the same submission can
+# pass at night and time out on exam day. A challenge with a line budget is
+# judged on the number of lines of its Python code a test executes instead,
+# which is the same on any machine under any load. Lines are counted with
+# sys.monitoring LINE events (Python 3.12+) or sys.settrace before that, in
+# the submission's own code only. Counting slows the program down several
+# times, so the time limit stays on as a backstop, LINE_BUDGET_TIME_FACTOR
+# times as long, for calls into C that execute no lines at all.
+
+LINE_BUDGET_TOOL_ID = 3  # unassigned by Python, and not MONITORING_TOOL_ID
+LINE_BUDGET_TIME_FACTOR = 10
+
+
+class _LineBudget:
+    def __init__(self, code, budget):
+        self.budget = budget
+        self.count = 0
+        self.codes = set(code_objects(code))
+        self.use_monitoring = hasattr(sys, "monitoring")
+
+    def _count(self, *args):
+        self.count += 1
+        if self.count > self.budget:
+            raise LineBudgetExceeded()
+
+    def _trace(self, frame, event, arg):
+        # settrace: only trace frames running the submission's code
+        if frame.f_code in self.codes:
+            return self._trace_lines
+        return None
+
+    def _trace_lines(self, frame, event, arg):
+        if event == "line":
+            self._count()
+        return self._trace_lines
+
+    def __enter__(self):
+        if self.use_monitoring:
+            monitoring = sys.monitoring
+            monitoring.use_tool_id(LINE_BUDGET_TOOL_ID, "codequest-line-budget")
+            monitoring.register_callback(LINE_BUDGET_TOOL_ID, monitoring.events.LINE, self._count)
+            for code in self.codes:
+                monitoring.set_local_events(LINE_BUDGET_TOOL_ID, code, monitoring.events.LINE)
+        else:
+            sys.settrace(self._trace)
+        return self
+
+    def __exit__(self, *exc):
+        if self.use_monitoring:
+            monitoring = sys.monitoring
+            for code in self.codes:
+                monitoring.set_local_events(LINE_BUDGET_TOOL_ID, code, 0)
+            monitoring.register_callback(LINE_BUDGET_TOOL_ID, monitoring.events.LINE, None)
+            monitoring.free_tool_id(LINE_BUDGET_TOOL_ID)
+        else:
+            sys.settrace(None)
+        return False
+
+
+# ---------- OUTPUT ----------
+# A program's output is never collected whole. It is written to an OutputSink
+# that hands it to a checker (see checkers.py) as it arrives, keeps the first
+# OUTPUT_PREVIEW_CHARS for display and counts the rest. Writing past the byte
+# limit raises OutputLimitExceeded and output the checker rejects raises
+# OutputMismatch, so a program printing millions of lines is judged in
+# constant memory and is stopped as soon as the verdict is known.
+
+OUTPUT_PREVIEW_CHARS = 16 * 1024
+
+
+class OutputSink:
+    def __init__(self, checker=None, limit_bytes=None):
+        self.checker = checker  # None only records the output
+        self.limit_bytes = limit_bytes
+        self.size = 0
+        self.preview = []
+        self.preview_chars = 0
+        self.over_limit = False
+        self.mismatched = False
+
+    def write(self, text):
+        if self.over_limit:
+            raise OutputLimitExceeded()
+        if self.mismatched:
+            raise OutputMismatch()
+
+        self.size += len(text.encode(errors="replace"))
+        if self.limit_bytes is not None and self.size > self.limit_bytes:
+            self.over_limit = True
+            raise OutputLimitExceeded()
+
+        if self.preview_chars < OUTPUT_PREVIEW_CHARS:
+            chunk = text[:OUTPUT_PREVIEW_CHARS - self.preview_chars]
+            self.preview.append(chunk)
+            self.preview_chars += len(chunk)
+
+        if self.checker is not None and not self.checker.feed(text):
+            self.mismatched = True
+            raise OutputMismatch()
+
+    @property
+    def output(self):
+        output = "".join(self.preview).strip()
+        if self.size > self.preview_chars and not self.over_limit:
+            output += f"\n... ({self.size} bytes in total)"
+        return output
+
+    def result(self, cpu_time, wall_time, peak_memory_kb):
+        if self.over_limit:
+            return make_result("output_limit_exceeded", "__ERROR__ Output limit exceeded", cpu_time, wall_time, peak_memory_kb)
+        if self.checker is None:
+            return make_result("passed", self.output, cpu_time, wall_time, peak_memory_kb)
+
+        passed = not self.mismatched and self.checker.finish()
+        if self.checker.error is not None:
+            return make_result("checker_error", f"__ERROR__ Checker failed: {self.checker.error}", cpu_time, wall_time, peak_memory_kb)
+        return make_result("passed" if passed else "wrong_answer", self.output, cpu_time, wall_time, peak_memory_kb)
+
+
+# A submission's tests arrive as separate jobs, often at the same worker; the
+# code object is cached so each worker parses a submission only once.
+@functools.lru_cache(maxsize=32)
+def compile_code(user_code: str):
+    return compile_guarded(user_code, "<submission>")
+
+
+def make_result(verdict, output, cpu_time, wall_time, peak_memory_kb, lines_executed=None):
+    return {
+        "passed": verdict == "passed",
+        "verdict": verdict,
+        "output": output,
+        "cpu_time_ms": round(cpu_time * 1000),
+        "wall_time_ms": round(wall_time * 1000),
+        "peak_memory_kb": peak_memory_kb,
+        "lines_executed": lines_executed,
+    }
+
+
+def run_compiled(code, test_input, checker=None, time_limit_ms=None, memory_limit_mb=None,
+                 output_limit_kb=None, monitor_limits=False, line_budget=None):
+    # test_input is a str or a test_store.StoredFile, read a line at a time
+    input_lines = test_store.iter_lines(test_input)
+
+    def fake_input(prompt=None):
+        return next(input_lines, "")
+
+    sink = OutputSink(checker, output_limit_kb * 1024 if output_limit_kb else None)
+
+    def fake_print(*args, sep=" ", end="\n", **kwargs):
+        sink.write(sep.join(str(a) for a in args) + "\n")
+
+    # Expose all safe builtins so student code can use list, dict, map, etc.
+    safe_builtins = dict(SAFE_BUILTINS)
+    safe_builtins["input"] = fake_input
+    safe_builtins["print"] = fake_print
+
+    env = {"__builtins__": safe_builtins, "__name__": "__main__"}
+
+    budget = _LineBudget(code, line_budget) if line_budget else contextlib.nullcontext()
+    if line_budget and time_limit_ms:
+        time_limit_ms *= LINE_BUDGET_TIME_FACTOR
+
+    if monitor_limits:
+        # the process's peak RSS belongs to every interpreter in it
+        limits = _MonitoredLimits(code, time_limit_ms)
+        baseline_kb = None
+        clock = time.thread_time
+    else:
+        limits = _Limits(time_limit_ms, memory_limit_mb)
+        baseline_kb = read_proc_status_kb("VmRSS") if reset_peak_rss() else None
+        clock = time.process_time
+    cpu_start = clock()
+    wall_start = time.perf_counter()
+
+    verdict, output = None, None
+    try:
+        with limits, budget:
+            exec(code, env)
+    except (OutputLimitExceeded, OutputMismatch):
+        pass  # the sink knows the verdict
+    except LineBudgetExceeded:
+        verdict, output = "time_limit_exceeded", f"{LINE_BUDGET_ERROR} ({line_budget} lines)"
+    except TimeLimitExceeded:
+        verdict, output = "time_limit_exceeded", "__ERROR__ Time limit exceeded"
+    except MemoryError:
+        verdict, output = "memory_limit_exceeded", "__ERROR__ Memory limit exceeded"
+    except Exception as e:
+        # output that already went wrong outranks the crash it led to
+        if not (sink.over_limit or sink.mismatched):
+            verdict, output = "error", f"__ERROR__ {type(e).__name__}: {e}"
+
+    cpu_time = clock() - cpu_start
+    wall_time = time.perf_counter() - wall_start
+
+    peak_kb = read_proc_status_kb("VmHWM") if baseline_kb is not None else None
+    peak_memory_kb = max(0, peak_kb - baseline_kb) if peak_kb is not None and baseline_kb is not None else None
+
+    if verdict is None:
+        result = sink.result(cpu_time, wall_time, peak_memory_kb)
+    else:
+        result = make_result(verdict, output, cpu_time, wall_time, peak_memory_kb)
+    if line_budget:
+        result["lines_executed"] = budget.count
+    return result
+
+
+# ---------- FORK PER JOB ----------
+# A judge process is a warm fork server: it has imported the allowed modules
+# and built SAFE_BUILTINS once, at startup. With isolate=True every test then
+# runs in a fresh copy-on-write fork of it, which costs about a millisecond
+# and throws away everything the test did to the process: patched modules,
+# leaked objects, a limit it dodged with a bare `except:`. The parent keeps
+# the compile cache; the child only runs the code and pipes its result back.
+
+def run_forked(func, *args):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            payload = pickle.dumps(func(*args))
+        except BaseException as e:
+            payload = pickle.dumps(make_result("error", f"__ERROR__ {type(e).__name__}: {e}", 0, 0, None))
+        with os.fdopen(write_fd, "wb") as f:
+            f.write(payload)
+        os._exit(0)  # skip the parent's atexit handlers and buffers
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as f:
+        payload = f.read()
+    _, status, usage = os.wait4(pid, 0)
+    if payload:
+        return pickle.loads(payload)
+
+    # the child was killed before it could answer, e.g. by the RLIMIT_CPU
+    # backstop after swallowing TimeLimitExceeded
+    cpu_time = usage.ru_utime + usage.ru_stime
+    code = os.waitstatus_to_exitcode(status)
+    if code in (-signal.SIGXCPU, -signal.SIGKILL):
+        return make_result("time_limit_exceeded", "__ERROR__ Time limit exceeded", cpu_time, cpu_time, None)
+    return make_result("error", f"__ERROR__ judge process exited with status {code}", cpu_time, cpu_time, None)
+
+
+def run_test(user_code: str, test_input, checker=None, time_limit_ms=None, memory_limit_mb=None,
+             output_limit_kb=None, isolate=False, monitor_limits=False, line_budget=None):
+    try:
+        code = compile_code(user_code)
+    except Exception as e:
+        return make_result("error", f"__ERROR__ {type(e).__name__}: {e}", 0, 0, None)
+
+    args = (code, test_input, checker, time_limit_ms, memory_limit_mb, output_limit_kb, monitor_limits, line_budget)
+    if isolate and hasattr(os, "fork"):
+        return run_forked(run_compiled, *args)
+    return run_compiled(*args)
@@ -0,0 +1,301 @@
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+
+
+# ---------- JUDGE SCHEDULER ----------
+# Every test headed for a judge pool goes through a LaneScheduler, which keeps
+# at most `capacity` jobs (one per worker) in the pool and holds the rest
+# back in a queue per lane:
+#   interactive  "Run tests" in the editor, someone is watching
+#   graded       submissions
+#   background   rejudges and other bulk work
+# Whenever a worker frees up, the next job is picked by weighted fair queuing:
+# each lane's next job gets a virtual finish time of max(now, the lane's last
+# finish) + 1 / lane weight, and the smallest goes first. Busy lanes share the workers
+# in proportion to their weights, a lane that was idle starts again right
+# away without having saved up credit, and an otherwise idle pool runs
+# background work at full speed. Without this, a rejudge that filled the
+# pool's own FIFO queue with thousands of tests made every "Run tests" wait
+# behind them.
+# Within a lane, jobs are grouped by share (the classroom whose challenge is
+# being judged) and the shares take turns by deficit round robin: every turn a
+# share may start as many jobs as its weight (Classroom.judge_weight). So
+# when two classes sit an exam at once, the smaller one still gets its half
+# of the workers however many students the larger one has.
+# Time limits count from when a job reaches the pool: waiting in a lane is
+# not the job's fault.
+
+LANES = ("interactive", "graded", "background")
+
+# how often a caller waiting for its job to start checks for stuck jobs
+_POLL_SECONDS = 1.0
+
+
+class Job:
+    def __init__(self, scheduler, lane, func, args, kwds, timeout, share, weight, on_done=None):
+        self.lane = lane
+        self.share = share
+        self.weight = weight
+        self.func = func
+        self.args = args
+        self.kwds = kwds
+        self.timeout = timeout
+        self.queued_at = time.monotonic()
+        self.deadline = None
+        self.state = "queued"  # -> running -> done, or cancelled / abandoned
+        self.on_done = on_done  # called with the job once its result is in
+        self._scheduler = scheduler
+        self._dispatched = threading.Event()
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def get(self):
+        # like AsyncResult.get(timeout): raises multiprocessing.TimeoutError
+        while not self._dispatched.wait(_POLL_SECONDS):
+            self._scheduler.reap()
+        if not self._done.wait(max(0, self.deadline - time.monotonic())):
+            self._scheduler.reap()
+            raise multiprocessing.TimeoutError()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def cancel(self):
+        # drops the job if it has not started yet
+        self._scheduler._cancel(self)
+
+
+class Completions:
+    # For a caller with several jobs in flight that takes their results as
+    # they finish rather than in the order it submitted them:
+    #   completions = Completions(scheduler)
+    #   scheduler.submit(..., on_done=completions.add)
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._finished = queue.Queue()
+
+    def add(self, job):
+        self._finished.put(job)
+
+    def next(self, jobs):
+        # -> whichever of jobs (all unfinished) finishes first; raises
+        # multiprocessing.TimeoutError, like Job.get, once one of them has
+        # run past its deadline
+        while True:
+            now = time.monotonic()
+            deadlines = [job.deadline - now for job in jobs if job.deadline is not None]
+            try:
+                return self._finished.get(timeout=max(0, min([_POLL_SECONDS, *deadlines])))
+            except queue.Empty:
+                pass
+            self._scheduler.reap()
+            now = time.monotonic()
+            if any(job.deadline is not None and job.deadline <= now for job in jobs):
+                raise multiprocessing.TimeoutError()
+
+
+class _FairQueue:
+    # One lane's queue: a FIFO per share, served by deficit round robin.
+    # A share is credited its weight whenever its turn comes up; each job
+    # started costs 1.
+    def __init__(self):
+        self._queues = {}  # share -> deque of jobs
+        self._turns = deque()  # shares with jobs waiting; the first has the turn
+        self._deficit = {}
+        self._weights = {}
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, job):
+        queue = self._queues.get(job.share)
+        if queue is None:
+            queue = self._queues[job.share] = deque()
+            self._deficit[job.share] = 0
+            self._turns.append(job.share)
+            if len(self._turns) == 1:
+                self._deficit[job.share] = job.weight
+        self._weights[job.share] = job.weight  # the latest weight counts
+        queue.append(job)
+        self._length += 1
+
+    def popleft(self):
+        while self._deficit[self._turns[0]] < 1:
+            self._next_turn()
+        share = self._turns[0]
+        self._deficit[share] -= 1
+        job = self._queues[share].popleft()
+        self._length -= 1
+        if not self._queues[job.share]:
+            self._drop(job.share)
+        return job
+
+    def remove(self, job):
+        self._queues[job.share].remove(job)
+        self._length -= 1
+        if not self._queues[job.share]:
+            self._drop(job.share)
+
+    def _next_turn(self):
+        self._turns.rotate(-1)
+        share = self._turns[0]
+        self._deficit[share] += self._weights[share]
+
+    def _drop(self, share):
+        # an idle share keeps no credit
+        had_turn = self._turns[0] == share
+        self._turns.remove(share)
+        del self._queues[share], self._deficit[share], self._weights[share]
+        if had_turn and self._turns:
+            share = self._turns[0]
+            self._deficit[share] += self._weights[share]
+
+    def oldest(self):
+        return min((queue[0].queued_at for queue in self._queues.values()), default=None)
+
+    def depth_by_share(self):
+        return {share: len(queue) for share, queue in self._queues.items()}
+
+
+class _LaneStats:
+    def __init__(self):
+        self.submitted = 0
+        self.started = 0
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_wait = 0.0  # moving average
+
+
+class LaneScheduler:
+    def __init__(self, pool, capacity, weights):
+        self.pool = pool
+        self.capacity = max(1, capacity)
+        self.weights = {lane: weights.get(lane, 1) for lane in LANES}
+        if any(weight <= 0 for weight in self.weights.values()):
+            raise ValueError("lane weights must be positive")
+        self._queues = {lane: _FairQueue() for lane in LANES}
+        self._finish = dict.fromkeys(LANES, 0.0)  # virtual finish of each lane's last job
+        self._virtual_time = 0.0
+        self._running = set()
+        self._stats = {lane: _LaneStats() for lane in LANES}
+        self._lock = threading.Lock()
+
+    def submit(self, lane, func, args=(), kwds=None, timeout=None, share=None, weight=1, on_done=None):
+        # share / weight: whose job this is within the lane, and their weight
+        if lane not in self._queues:
+            raise ValueError(f"unknown judge lane {lane!r}")
+        job = Job(self, lane, func, args, kwds or {}, timeout, share, max(1, weight), on_done)
+        with self._lock:
+            self._queues[lane].append(job)
+            self._stats[lane].submitted += 1
+            ready = self._take()
+        self._dispatch(ready)
+        return job
+
+    def _take(self):
+        # -> the jobs to start now; called with the lock held
+        now = time.monotonic()
+        ready = []
+        while len(self._running) < self.capacity:
+            busy = [lane for lane in LANES if self._queues[lane]]
+            if not busy:
+                break
+            # a lane that was idle starts from now, not from where it stopped
+            lane = min(busy, key=lambda lane: max(self._virtual_time, self._finish[lane]) + 1 / self.weights[lane])
+            start = max(self._virtual_time, self._finish[lane])
+            self._finish[lane] = start + 1 / self.weights[lane]
+            self._virtual_time = start
+            job = self._queues[lane].popleft()
+            job.state = "running"
+            job.deadline = now + (job.timeout if job.timeout is not None else float("inf"))
+            self._running.add(job)
+
+            stats = self._stats[job.lane]
+            waited = now - job.queued_at
+            stats.started += 1
+            stats.running += 1
+            stats.total_wait += waited
+            stats.max_wait = max(stats.max_wait, waited)
+            stats.recent_wait += 0.1 * (waited - stats.recent_wait)
+            ready.append(job)
+        return ready
+
+    def _dispatch(self, jobs):
+        # outside the lock: the pool may call back on this thread
+        for job in jobs:
+            job._dispatched.set()
+            try:
+                self.pool.apply_async(
+                    job.func, job.args, job.kwds,
+                    callback=lambda result, job=job: self._finished(job, result, None),
+                    error_callback=lambda error, job=job: self._finished(job, None, error),
+                )
+            except Exception as e:  # the pool has been shut down
+                self._finished(job, None, e)
+
+    def _finished(self, job, result, error):
+        with self._lock:
+            if job.state == "running":
+                self._running.discard(job)
+                self._stats[job.lane].running -= 1
+                self._stats[job.lane].completed += 1
+            job.state = "done"
+            ready = self._take()
+        job._result, job._error = result, error
+        job._done.set()
+        if job.on_done is not None:
+            job.on_done(job)
+        self._dispatch(ready)
+
+    def reap(self):
+        # A job past its deadline gives its place back: a wedged worker or a
+        # lost job must not shrink the pool for good. The pool may then hold
+        # more than `capacity` jobs for a while.
+        now = time.monotonic()
+        with self._lock:
+            for job in [job for job in self._running if job.deadline <= now]:
+                self._running.discard(job)
+                job.state = "abandoned"
+                self._stats[job.lane].running -= 1
+                self._stats[job.lane].timed_out += 1
+            ready = self._take()
+        self._dispatch(ready)
+
+    def _cancel(self, job):
+        with self._lock:
+            if job.state == "queued":
+                self._queues[job.lane].remove(job)
+                job.state = "cancelled"
+                self._stats[job.lane].cancelled += 1
+
+    def metrics(self):
+        now = time.monotonic()
+        with self._lock:
+            lanes = {}
+            for lane in LANES:
+                queue, stats = self._queues[lane], self._stats[lane]
+                lanes[lane] = {
+                    "weight": self.weights[lane],
+                    "queued": len(queue),
+                    "running": stats.running,
+                    "submitted": stats.submitted,
+                    "started": stats.started,
+                    "completed": stats.completed,
+                    "cancelled": stats.cancelled,
+                    "timed_out": stats.timed_out,
+                    "oldest_wait_ms": round((now - queue.oldest()) * 1000) if queue else 0,
+                    "average_wait_ms": round(stats.total_wait / stats.started * 1000) if stats.started else 0,
+                    "recent_wait_ms": round(stats.recent_wait * 1000),
+                    "max_wait_ms": round(stats.max_wait * 1000),
+                    "queued_by_share": {str(share): n for share, n in queue.depth_by_share().items()},
+                }
+            return {"capacity": self.capacity, "running": len(self._running), "lanes": lanes}
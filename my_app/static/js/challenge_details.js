@@ -76,6 +76,88 @@ if (isCurrentlyHidden) {
         return submissionList.querySelectorAll(".submission-item").length;
     }
 
+    const languageSelect = document.getElementById("language-select");
+
+    function selectedLanguage() {
+        return languageSelect ? languageSelect.value : "python";
+    }
+
+    // "time_limit_exceeded" -> "time limit exceeded"
+    function formatStatus(status) {
+        return (status || "").replace(/_/g, " ");
+    }
+
+    // Cost of one test run, e.g. "12 ms CPU · 48 ms wall · 1.2 MB"
+    // (plus "3,120 lines" on challenges judged by line budget)
+    function formatUsage(t) {
+        const parts = [];
+        if (t.cpu_time_ms != null) parts.push(`${t.cpu_time_ms} ms CPU`);
+        if (t.wall_time_ms != null) parts.push(`${t.wall_time_ms} ms wall`);
+        if (t.lines_executed != null) parts.push(`${t.lines_executed.toLocaleString()} lines`);
+        if (t.peak_memory_kb != null) parts.push(`${(t.peak_memory_kb / 1024).toFixed(1)} MB`);
+        return parts.join(" · ");
+    }
+
+    // When the judge is saturated the server answers 429 with Retry-After;
+    // wait that long and try again (a few times) instead of hammering it.
+    const MAX_BUSY_RETRIES = 5;
+
+    async function postToJudge(url, body, onBusy) {
+        for (let attempt = 0; ; attempt++) {
+            const response = await fetch(url, {
+                method: "POST",
+                headers: {
+                    "X-CSRFToken": csrfToken,
+                    "X-Requested-With": "XMLHttpRequest",
+                },
+                body: body,
+            });
+            if (response.status !== 429 || attempt >= MAX_BUSY_RETRIES) {
+                return response;
+            }
+
+            const seconds = parseInt(response.headers.get("Retry-After"), 10) || 2;
+            if (onBusy) onBusy(seconds);
+            await new Promise(resolve => setTimeout(resolve, seconds * 1000));
+        }
+    }
+
+    // Streamed judging answers with one JSON event per line (NDJSON);
+    // handleEvent gets each as soon as it arrives.
+    async function readEvents(response, handleEvent) {
+        const reader  = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split("\n");
+            buffer = lines.pop(); // keep the incomplete last line for the next chunk
+
+            lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+        }
+        if (buffer.trim()) handleEvent(JSON.parse(buffer));
+    }
+
+    // Queued submissions come back as "pending"; poll until the judge is done.
+    async function waitForVerdict(statusUrl) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+
+            const response = await fetch(statusUrl, {
+                headers: { "X-Requested-With": "XMLHttpRequest" },
+            });
+            const data = await response.json(); // { status, done, results, ... }
+
+            if (!response.ok || data.done) {
+                return data;
+            }
+        }
+    }
+
     // ------------------------------------------------------------------
     // 2) SUBMIT SOLUTION (AJAX)
     // ------------------------------------------------------------------
@@ -94,30 +176,50 @@ if (isCurrentlyHidden) {
 
         const form = submitBtn.closest("form");
         const formData = new FormData(form);
+        formData.append("language", selectedLanguage());
 
         try {
-            const response = await fetch(form.action, {
-                method: "POST",
-                headers: {
-                    "X-CSRFToken": csrfToken,
-                    "X-Requested-With": "XMLHttpRequest",
-                },
-                body: formData,
+            const response = await postToJudge(form.action, formData, (seconds) => {
+                if (btnText) btnText.textContent = `Judge busy, retrying in ${seconds}s...`;
             });
 
-            const isJson = response.headers.get("content-type")?.includes("application/json");
-            if (!isJson) {
+            const contentType = response.headers.get("content-type") || "";
+            let data;
+            if (response.ok && contentType.includes("application/x-ndjson")) {
+                // judged in the request: tests are reported as they finish,
+                // the "done" event has the saved verdict
+                let total = 0;
+                let judged = 0;
+                await readEvents(response, (event) => {
+                    if (event.event === "start") {
+                        total = event.total;
+                    } else if (event.event === "test") {
+                        judged++;
+                        if (btnText) btnText.textContent = `Judging... ${judged}/${total}`;
+                    } else if (event.event === "done") {
+                        data = event; // { status, results, submission_id, ... }
+                    }
+                });
+                if (!data) {
+                    throw new Error("The judge stream ended without a verdict");
+                }
+            } else if (contentType.includes("application/json")) {
+                data = await response.json(); // { status, results, submission_id, ... }
+            } else {
                 throw new Error("Non-JSON response from server");
             }
 
-            const data = await response.json(); // { status, results, submission_id, ... }
+            if (response.ok && data.status_url && !["passed", "failed", "error"].includes(data.status)) {
+                if (btnText) btnText.textContent = "Judging...";
+                data = await waitForVerdict(data.status_url);
+            }
 
             if (response.ok) {
                 const nextNumber = getCurrentSubmissionCount() + 1;
 
                 resultDiv.innerHTML = `
                     <span style="color:${data.status === "passed" ? "green" : "red"};">
-                        Submission #${nextNumber}: ${data.status.toUpperCase()}
+                        Submission #${nextNumber}: ${formatStatus(data.status).toUpperCase()}
                     </span>
                 `;
 
@@ -147,7 +249,7 @@ if (isCurrentlyHidden) {
                         <span class="badge-modern"
                               style="background-color:${data.status === "passed"
                                   ? "rgba(16,185,129,0.1)" : "rgba(248,113,113,0.1)"};color:var(--success);">
-                            <i class="fas fa-check-circle"></i> ${data.status}
+                            <i class="fas fa-check-circle"></i> ${formatStatus(data.status)}
                         </span>
                         <button class="view-code-btn btn-modern btn-secondary" style="padding:0.5rem 1rem;">
                             <i class="fas fa-eye"></i> View Code
@@ -178,8 +280,35 @@ if (isCurrentlyHidden) {
     });
 
     // ------------------------------------------------------------------
-    // 3) RUN TESTS (AJAX)
+    // 3) RUN TESTS (streamed: one NDJSON line per judged test)
     // ------------------------------------------------------------------
+    function renderTestResult(t, idx) {
+        const userOut = t.user_output || t.output || "";
+        return `
+            <div style="padding:0.75rem;margin-bottom:0.75rem;
+                        border:1px solid ${t.passed ? "#16a34a" : "#e11d48"};
+                        border-radius:8px;">
+                <strong>Test ${idx + 1} – ${t.passed ? "✅ Passed" : `❌ ${t.verdict ? formatStatus(t.verdict) : "Failed"}`}</strong>
+                <span style="color:var(--text-secondary);font-size:0.85rem;">${formatUsage(t)}</span><br>
+                <strong>Input:</strong>
+                <pre>${t.input}</pre>
+                <strong>Expected output:</strong>
+                <pre>${t.expected}</pre>
+                <strong>Your output:</strong>
+                <pre>${userOut}</pre>
+            </div>
+        `;
+    }
+
+    function renderPendingTest(idx) {
+        return `
+            <div style="padding:0.75rem;margin-bottom:0.75rem;border:1px solid var(--border-color, #d1d5db);border-radius:8px;
+                        color:var(--text-secondary);">
+                <strong>Test ${idx + 1}</strong> – running...
+            </div>
+        `;
+    }
+
     window.runTests = async function (button) {
         const testSpinner = button.querySelector(".spinner");
         const resultsDiv  = document.getElementById("test-results");
@@ -195,53 +324,54 @@ if (isCurrentlyHidden) {
 
         const formData = new FormData();
         formData.append("code", code);
+        formData.append("language", selectedLanguage());
 
-        try {
-            const response = await fetch(`/challenge/${challengeSlug}/run-tests/`, {
-                method: "POST",
-                headers: {
-                    "X-CSRFToken": csrfToken,
-                    "X-Requested-With": "XMLHttpRequest",
-                },
-                body: formData,
-            });
+        let statusDiv = null;
+        let testDivs = [];
 
-            const isJson = response.headers.get("content-type")?.includes("application/json");
-            if (!isJson) {
-                throw new Error("Non-JSON response from server");
+        // event = { event: "start" | "test" | "done", ... }
+        function handleEvent(event) {
+            if (event.event === "start") {
+                resultsDiv.innerHTML = `
+                    <div style="margin-bottom:1rem;">
+                        <strong>Overall status:</strong> <span class="overall-status">⏳ running</span>
+                    </div>
+                `;
+                statusDiv = resultsDiv.querySelector(".overall-status");
+                testDivs = [];
+                for (let idx = 0; idx < event.total; idx++) {
+                    const slot = document.createElement("div");
+                    slot.innerHTML = renderPendingTest(idx);
+                    resultsDiv.appendChild(slot);
+                    testDivs.push(slot);
+                }
+            } else if (event.event === "test") {
+                if (testDivs[event.index]) {
+                    testDivs[event.index].innerHTML = renderTestResult(event.result, event.index);
+                }
+            } else if (event.event === "done") {
+                if (statusDiv) {
+                    statusDiv.textContent = event.status === "passed" ? "✅ passed" : `❌ ${formatStatus(event.status)}`;
+                }
+                event.results.forEach((t, idx) => {
+                    if (testDivs[idx]) testDivs[idx].innerHTML = renderTestResult(t, idx);
+                });
             }
+        }
 
-            const data = await response.json(); // { status, results }
+        try {
+            const response = await postToJudge(`/challenge/${challengeSlug}/run-tests/stream/`, formData, (seconds) => {
+                resultsDiv.innerHTML = `<p style="color:var(--text-secondary);">Judge busy, retrying in ${seconds}s...</p>`;
+            });
 
-            if (!response.ok) {
+            if (!response.ok || !response.body) {
+                const isJson = response.headers.get("content-type")?.includes("application/json");
+                const data = isJson ? await response.json() : {};
                 resultsDiv.innerHTML = `<p style="color:red;">${data.error || "Failed to run tests."}</p>`;
                 return;
             }
 
-            let html = `
-                <div style="margin-bottom:1rem;">
-                    <strong>Overall status:</strong> ${data.status === "passed" ? "✅ passed" : "❌ failed"}
-                </div>
-            `;
-
-            data.results.forEach((t, idx) => {
-                const userOut = t.user_output || t.output || "";
-                html += `
-                    <div style="padding:0.75rem;margin-bottom:0.75rem;
-                                border:1px solid ${t.passed ? "#16a34a" : "#e11d48"};
-                                border-radius:8px;">
-                        <strong>Test ${idx + 1} – ${t.passed ? "✅ Passed" : "❌ Failed"}</strong><br>
-                        <strong>Input:</strong>
-                        <pre>${t.input}</pre>
-                        <strong>Expected output:</strong>
-                        <pre>${t.expected}</pre>
-                        <strong>Your output:</strong>
-                        <pre>${userOut}</pre>
-                    </div>
-                `;
-            });
-
-            resultsDiv.innerHTML = html;
+            await readEvents(response, handleEvent);
         } catch (err) {
             console.error(err);
             resultsDiv.innerHTML = `<p style="color:red;">An error occurred while running tests.</p>`;
@@ -0,0 +1,165 @@
+import itertools
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import ChallengeProgress, Submission, UserStats
+
+User = get_user_model()
+
+
+# ---------- USER STATS ----------
+# UserStats holds each user's solved count (overall, by difficulty and by
+# tag), points, judged submissions and last solve, so the dashboard, profile
+# and classroom pages read one row instead of aggregating the user's whole
+# submission history. record_judged() updates the row under a row lock in the
+# same transaction that stores the submission's result; rebuild() recounts it
+# from the submissions, after rejudges or for rows that drifted (a challenge
+# moved to another difficulty or tag, submissions deleted by hand).
+# Every user gets a row when they sign up (see views.create_user_profile).
+
+BATCH_SIZE = 500
+
+
+def is_first_solve(submission):
+    # a passed submission, and no other passed one for the same challenge
+    return submission.status == "passed" and not (
+        Submission.objects.filter(user_id=submission.user_id, challenge_id=submission.challenge_id, status="passed")
+        .exclude(id=submission.id)
+        .exists()
+    )
+
+
+def record_judged(submission, first_solve, points):
+    with transaction.atomic():
+        stats = UserStats.objects.select_for_update().filter(user_id=submission.user_id).first()
+        if stats is None:
+            rebuild([submission.user_id])  # counts this submission too
+            return
+
+        stats.attempts += 1
+        stats.points += points
+        if submission.status == "passed":
+            stats.last_solved_at = max(filter(None, [stats.last_solved_at, submission.created_at]))
+        if first_solve:
+            challenge = submission.challenge
+            stats.solved_count += 1
+            field = f"{challenge.difficulty}_solved"
+            if hasattr(stats, field):
+                setattr(stats, field, getattr(stats, field) + 1)
+            for tag_id in challenge.tags.values_list("id", flat=True):
+                stats.solved_by_tag[str(tag_id)] = stats.solved_by_tag.get(str(tag_id), 0) + 1
+        stats.save()
+
+
+def rebuild(user_ids=None, batch_size=BATCH_SIZE):
+    # recounts these users' UserStats, or everyone's; -> rows written
+    if user_ids is None:
+        user_ids = User.objects.order_by("id").values_list("id", flat=True).iterator()
+    written = 0
+    iterator = iter(user_ids)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        written += _rebuild_batch(batch)
+    return written
+
+
+def _rebuild_batch(user_ids):
+    rows = {user_id: UserStats(user_id=user_id, solved_by_tag={}) for user_id in user_ids}
+    judged = Submission.objects.filter(user_id__in=user_ids).exclude(status__in=["pending", "judging"])
+    passed = judged.filter(status="passed")
+
+    for row in judged.values("user_id").annotate(n=Count("id"), points=Sum("points_awarded")):
+        rows[row["user_id"]].attempts = row["n"]
+        rows[row["user_id"]].points = row["points"] or 0
+    for row in passed.values("user_id").annotate(last=Max("created_at")):
+        rows[row["user_id"]].last_solved_at = row["last"]
+    for row in passed.values("user_id", "challenge__difficulty").annotate(n=Count("challenge", distinct=True)):
+        stats = rows[row["user_id"]]
+        stats.solved_count += row["n"]
+        field = f"{row['challenge__difficulty']}_solved"
+        if hasattr(stats, field):
+            setattr(stats, field, row["n"])
+    for row in (
+        passed.filter(challenge__tags__isnull=False)
+        .values("user_id", "challenge__tags")
+        .annotate(n=Count("challenge", distinct=True))
+    ):
+        rows[row["user_id"]].solved_by_tag[str(row["challenge__tags"])] = row["n"]
+
+    with transaction.atomic():
+        UserStats.objects.filter(user_id__in=user_ids).delete()
+        UserStats.objects.bulk_create(rows.values())
+    return len(rows)
+
+
+def for_user(user):
+    # the user's UserStats, recounted first if they have none yet
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        rebuild([user.id])
+        return UserStats.objects.get(user=user)
+
+
+# ---------- CHALLENGE PROGRESS ----------
+# ChallengeProgress is each user's status on each challenge they have tried:
+# "in_progress" after a judged submission, "passed" once one passes (it never
+# goes back, short of a rejudge). Pages read every challenge's status with
+# one query through challenge_statuses() instead of asking per challenge.
+
+def record_progress(submission):
+    status = "passed" if submission.status == "passed" else "in_progress"
+    progress, created = ChallengeProgress.objects.get_or_create(
+        user_id=submission.user_id,
+        challenge_id=submission.challenge_id,
+        defaults={"status": status},
+    )
+    if not created and status == "passed" and progress.status != "passed":
+        progress.status = "passed"
+        progress.save(update_fields=["status", "updated_at"])
+
+
+def challenge_statuses(user, challenges):
+    # -> {challenge id: "not_started" / "in_progress" / "passed"}
+    ids = [challenge.id for challenge in challenges]
+    statuses = dict.fromkeys(ids, "not_started")
+    if user.is_authenticated:
+        statuses.update(
+            ChallengeProgress.objects.filter(user=user, challenge_id__in=ids).values_list("challenge_id", "status")
+        )
+    return statuses
+
+
+def rebuild_progress(challenge, user_ids):
+    # puts these users' progress on one challenge right after a rejudge,
+    # including which submission now holds the points (rejudge.correct_points)
+    judged = Submission.objects.filter(challenge=challenge, user_id__in=user_ids).exclude(
+        status__in=["pending", "judging"]
+    )
+    passed = set(judged.filter(status="passed").values_list("user_id", flat=True))
+    tried = set(judged.values_list("user_id", flat=True))
+    holders = {}
+    # correct_points has just given the points to each user's first passed submission
+    for user_id, submission_id in judged.filter(status="passed").order_by("-id").values_list("user_id", "id"):
+        holders[user_id] = submission_id  # the earliest wins
+
+    rows = {p.user_id: p for p in ChallengeProgress.objects.filter(challenge=challenge, user_id__in=user_ids)}
+    changed = []
+    created = []
+    for user_id in tried | set(rows):
+        status = "passed" if user_id in passed else "in_progress"
+        progress = rows.get(user_id)
+        if progress is None:
+            created.append(ChallengeProgress(
+                user_id=user_id, challenge=challenge, status=status, points_submission_id=holders.get(user_id),
+            ))
+        elif (progress.status, progress.points_submission_id) != (status, holders.get(user_id)):
+            progress.status = status
+            progress.points_submission_id = holders.get(user_id)
+            progress.updated_at = timezone.now()
+            changed.append(progress)
+
+    ChallengeProgress.objects.bulk_update(changed, ["status", "points_submission", "updated_at"])
+    ChallengeProgress.objects.bulk_create(created, ignore_conflicts=True)
@@ -0,0 +1,170 @@
+import concurrent.futures
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+import threading
+
+try:
+    import _interpreters  # Python 3.13+
+except ImportError:
+    _interpreters = None
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+
+# ---------- SUBINTERPRETER BACKEND ----------
+# With JUDGE_PYTHON_BACKEND = "interpreters", Python tests run in a pool of
+# subinterpreters inside the judge_worker process instead of in the judge
+# process pool. Every subinterpreter has its own GIL (PEP 684), so they
+# run on separate cores like processes do, but share one process: no process
+# per worker, no pickling through pipes, no fork.
+#
+# Each interpreter is driven by a thread of its own. A job is pickled into
+# the interpreter, run there with the same runners.run_case the process pool
+# uses, and its result is pickled back through a temporary file. Like the
+# process pool's workers, interpreters have imported the judge modules once
+# and keep their compile cache between jobs.
+#
+# What a process gives and an interpreter does not: no memory limit, and the
+# time limit is checked by the student's code (sandbox._MonitoredLimits)
+# rather than by the kernel. So only the judge_worker command uses this
+# backend, never a web process, and it first caps its own address space as a
+# whole with limit_memory(): a runaway allocation then fails with MemoryError
+# (or takes the worker down, to be restarted and its submission requeued)
+# instead of eating the host. There is no CPU rlimit: one for the process
+# would eventually kill the long-running worker, whatever its jobs do.
+# This uses the private _interpreters module of Python 3.13+ (3.12's version
+# hangs destroying an interpreter that has imported threading). Anywhere else
+# SUPPORTED is False and the judge uses the process pool.
+# Like sandbox.py this module must stay Django-free: interpreters import it.
+
+SUPPORTED = _interpreters is not None and hasattr(sys, "monitoring")
+
+_SETUP = """
+import pickle, sys
+sys.path[:] = _path.split(_pathsep)
+from my_app import subinterpreters
+initializer, initargs = pickle.loads(_setup)
+if initializer is not None:
+    initializer(*initargs)
+"""
+
+_RUN = "subinterpreters.run_job(_job, _result_fd)"
+
+
+class SubinterpreterError(Exception):
+    pass
+
+
+def limit_memory(megabytes):
+    # caps this process's address space for good (soft and hard limit)
+    if resource is None:
+        return
+    cap = megabytes * 1024 * 1024
+    hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+    if hard != resource.RLIM_INFINITY:
+        cap = min(cap, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (cap, cap))
+
+
+def run_job(job, result_fd):
+    # runs inside the interpreter
+    try:
+        func, args, kwds = pickle.loads(job)
+        result = (True, func(*args, **kwds))
+    except BaseException as e:
+        result = (False, f"{type(e).__name__}: {e}")
+
+    view = memoryview(pickle.dumps(result))
+    while view:
+        view = view[os.write(result_fd, view):]
+
+
+def _run(interpreter, script, shared):
+    error = _interpreters.run_string(interpreter, script, shared)
+    if error is not None:  # what the script raised, as a snapshot
+        raise SubinterpreterError(getattr(error, "formatted", None) or str(error))
+
+
+class _AsyncResult:
+    def __init__(self, future):
+        self._future = future
+
+    def get(self, timeout=None):
+        try:
+            return self._future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise multiprocessing.TimeoutError() from None
+
+
+def _report(future, callback, error_callback):
+    # Pool's callback / error_callback, from the thread that ran the job
+    error = None if future.cancelled() else future.exception()
+    if future.cancelled() or error is not None:
+        if error_callback:
+            error_callback(error or concurrent.futures.CancelledError())
+    elif callback:
+        callback(future.result())
+
+
+class InterpreterPool:
+    # The part of multiprocessing.Pool's interface the judge uses. A job
+    # that never returns (a long call into C) keeps its thread and its
+    # interpreter busy until it does; the caller gives up on it after the
+    # job timeout as with a wedged process.
+    def __init__(self, processes, initializer=None, initargs=()):
+        self._setup = pickle.dumps((initializer, initargs))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._interpreters = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(processes, thread_name_prefix="judge-interpreter")
+
+    def _interpreter(self):
+        state = getattr(self._local, "state", None)
+        if state is None:
+            interpreter = _interpreters.create()
+            with self._lock:
+                self._interpreters.append(interpreter)
+            _run(interpreter, _SETUP, {
+                "_path": os.pathsep.join(sys.path),
+                "_pathsep": os.pathsep,
+                "_setup": self._setup,
+            })
+            state = self._local.state = (interpreter, tempfile.TemporaryFile())
+        return state
+
+    def _call(self, func, args, kwds):
+        interpreter, results = self._interpreter()
+        results.seek(0)
+        results.truncate()
+        _run(interpreter, _RUN, {"_job": pickle.dumps((func, args, kwds)), "_result_fd": results.fileno()})
+
+        results.seek(0)
+        payload = results.read()
+        if not payload:
+            raise SubinterpreterError("the interpreter returned no result")
+        ok, value = pickle.loads(payload)
+        if not ok:
+            raise SubinterpreterError(value)
+        return value
+
+    def apply_async(self, func, args=(), kwds=None, callback=None, error_callback=None):
+        future = self._executor.submit(self._call, func, args, kwds or {})
+        if callback or error_callback:
+            future.add_done_callback(lambda future: _report(future, callback, error_callback))
+        return _AsyncResult(future)
+
+    def terminate(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def join(self):
+        with self._lock:
+            interpreters, self._interpreters = self._interpreters, []
+        for interpreter in interpreters:
+            if not _interpreters.is_running(interpreter):
+                _interpreters.destroy(interpreter)
@@ -0,0 +1,132 @@
+import codecs
+import hashlib
+import mmap
+import os
+import tempfile
+from collections import namedtuple
+
+
+# ---------- TEST STORE ----------
+# Hidden tests live in the HiddenTest table, one row per test, never on the
+# challenge row. Small inputs and outputs are kept in the row itself; anything
+# past the inline limit goes to a file under TEST_STORE_ROOT named after the
+# hash of its content, so identical data is stored once and a file never
+# changes after it is written. The judge hands workers a StoredFile instead
+# of the data: they map the file into memory and read it from there a chunk
+# at a time (iter_bytes, iter_text, iter_lines), so large tests are never
+# loaded by the web process, copied through the pool or held whole by a
+# worker. Only custom checkers, which take whole strings, use read_text().
+# Like sandbox.py this is used inside the judge workers and stays Django-free.
+
+PREVIEW_CHARS = 16 * 1024  # what results and pages show of a stored file
+STREAM_CHUNK = 64 * 1024
+
+
+class StoredFile(namedtuple("StoredFile", ["path", "size"])):
+    # a test input or output kept on disk; size is in bytes
+    pass
+
+
+def data_size(data):
+    return data.size if isinstance(data, StoredFile) else len(data)
+
+
+def _mapped(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_text(data):
+    if not isinstance(data, StoredFile):
+        return data
+    mapped = _mapped(data.path)
+    if mapped is None:
+        return ""
+    with mapped:
+        return str(mapped, "utf-8", errors="replace")
+
+
+def iter_bytes(data, chunk_size=STREAM_CHUNK):
+    # for feeding a program's stdin without building one big bytes object
+    if not isinstance(data, StoredFile):
+        yield data.encode()
+        return
+    mapped = _mapped(data.path)
+    if mapped is None:
+        return
+    with mapped:
+        for start in range(0, len(mapped), chunk_size):
+            yield mapped[start:start + chunk_size]
+
+
+def iter_text(data, chunk_size=STREAM_CHUNK):
+    if not isinstance(data, StoredFile):
+        if data:
+            yield data
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in iter_bytes(data, chunk_size):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def iter_lines(data):
+    # lines without their "\n" (or "\r\n")
+    partial = ""
+    for text in iter_text(data):
+        lines = (partial + text).split("\n")
+        partial = lines.pop()
+        for line in lines:
+            yield line[:-1] if line.endswith("\r") else line
+    if partial:
+        yield partial[:-1] if partial.endswith("\r") else partial
+
+
+def preview(data):
+    if not isinstance(data, StoredFile):
+        return data
+    mapped = _mapped(data.path)
+    if mapped is None:
+        return ""
+    with mapped:
+        head = mapped[:PREVIEW_CHARS].decode(errors="replace")
+    return f"{head}\n... ({data.size} bytes in total)"
+
+
+def pack(text, root, inline_limit):
+    # -> (text to keep in the row, file name or "", size in bytes, sha256)
+    data = text.encode()
+    digest = hashlib.sha256(data).hexdigest()
+    if len(data) <= inline_limit:
+        return text, "", len(data), digest
+    return "", write_blob(root, text), len(data), digest
+
+
+def write_blob(root, text):
+    # -> file name relative to root
+    data = text.encode()
+    digest = hashlib.sha256(data).hexdigest()
+    name = os.path.join(digest[:2], f"{digest}.txt")
+    path = os.path.join(root, name)
+    if os.path.exists(path):
+        return name
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)  # readers never see a half-written file
+    return name
+
+
+def delete_blob(root, name):
+    try:
+        os.remove(os.path.join(root, name))
+    except FileNotFoundError:
+        pass
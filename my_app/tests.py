@@ -1,3 +1,1445 @@
-from django.test import TestCase
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    admission, api_views, badges, checkers, judge, leaderboard, rejudge, runners, sandbox, scheduler, stats,
+    subinterpreters, test_store,
+)
+from .models import (
+    Badge, Challenge, ChallengeProgress, Classroom, ClassroomMembership, Profile, RejudgeRequest, SolveCount,
+    Submission, Tag, UserBadge, UserStats,
+)
+
+User = get_user_model()
+
+
+# ---------- SANDBOX ----------
+
+def run(code, test_input=""):
+    return sandbox.run_test(code, test_input, time_limit_ms=2000)
+
+
+class ModuleViewTests(SimpleTestCase):
+    def test_allowed_modules_work(self):
+        result = run(
+            "import math, itertools\n"
+            "from heapq import nlargest\n"
+            "from collections import Counter, namedtuple\n"
+            "Point = namedtuple('Point', 'x y')\n"
+            "print(math.sqrt(16), nlargest(1, [3, 9, 4]), Counter('aab').most_common(1),\n"
+            "      Point(1, 2).x, list(itertools.islice(itertools.count(), 3)))\n"
+        )
+        self.assertEqual(result["verdict"], "passed", result["output"])
+        self.assertEqual(result["output"].strip(), "4.0 [9] [('a', 2)] 1 [0, 1, 2]")
+
+    def test_private_and_module_attributes_are_unreachable(self):
+        for expression in [
+            "collections._sys",
+            "collections.abc",
+            "math.__loader__",
+            "math.__spec__",
+            "math.__dict__",
+            "math.__file__",
+            "math.__builtins__",
+            "vars(math)",
+        ]:
+            with self.subTest(expression):
+                result = run(f"import math, collections\nprint({expression})")
+                self.assertEqual(result["verdict"], "error")
+                self.assertRegex(result["output"], r"AttributeError|TypeError|not allowed")
+
+    def test_views_are_read_only(self):
+        for statement in ["math.pi = 3", "type(math).pi = 3", "del type(math).pi", "math.floor = print"]:
+            with self.subTest(statement):
+                result = run(f"import math\n{statement}")
+                self.assertEqual(result["verdict"], "error")
+        self.assertEqual(run("import math\nprint(math.pi)")["output"].strip(), "3.141592653589793")
+
+    def test_python_members_do_not_lead_to_their_module(self):
+        for code in [
+            "import collections\nprint(collections.namedtuple.__globals__['_sys'].modules['os'])",
+            "import collections\nprint(collections.Counter.__init__.__globals__['_sys'])",
+            "import collections\nprint(getattr(collections.namedtuple, '__glob' + 'als__'))",
+            "import collections\nprint(getattr(vars(collections.Counter)['__init__'], '__globals__'))",
+            "import collections\nmatch collections.namedtuple:\n    case object(__globals__=g):\n        print(g)",
+            "import heapq\nprint(heapq.nlargest.__globals__)",
+        ]:
+            with self.subTest(code):
+                result = run(code)
+                self.assertEqual(result["verdict"], "error")
+                self.assertIn("is not allowed", result["output"])
+
+    def test_introspection_does_not_lead_out(self):
+        for code in [
+            "print(().__class__.__base__.__subclasses__())",
+            "print(len.__self__)",
+            "print(getattr(len, '__self__'))",
+            "print(input.__globals__)",
+            "def f():\n    raise ValueError\ntry:\n    f()\nexcept ValueError as e:\n    print(e.__traceback__)",
+            "def g():\n    yield\nprint(g().gi_frame.f_back)",
+            "setattr(print, '__code__', None)",
+        ]:
+            with self.subTest(code):
+                result = run(code)
+                self.assertEqual(result["verdict"], "error")
+                self.assertIn("is not allowed", result["output"])
+
+    def test_student_classes_still_work(self):
+        result = run(
+            "import collections\n"
+            "class A:\n"
+            "    def __init__(self, x):\n"
+            "        self._x = x\n"
+            "    def __repr__(self):\n"
+            "        return f'{self.__class__.__name__}({self._x})'\n"
+            "class B(A):\n"
+            "    def __init__(self):\n"
+            "        super().__init__(1)\n"
+            "P = collections.namedtuple('P', 'a b')\n"
+            "print(B(), P(1, 2)._asdict(), getattr(B(), '_x'), __name__)\n"
+        )
+        self.assertEqual(result["verdict"], "passed", result["output"])
+        self.assertEqual(result["output"].strip(), "B(1) {'a': 1, 'b': 2} 1 __main__")
+
+    def test_other_imports_are_refused(self):
+        for module in ["os", "sys", "importlib", "collections.abc"]:
+            with self.subTest(module):
+                result = run(f"import {module}")
+                self.assertEqual(result["verdict"], "error")
+                self.assertIn("ImportError", result["output"])
+
+
+class LimitTests(SimpleTestCase):
+    # isolate: each run in its own fork, so the limits never touch the test process
+    def run_limited(self, code, **limits):
+        return sandbox.run_test(code, "", isolate=True, **limits)
+
+    def test_time_limit(self):
+        result = self.run_limited("while True:\n    pass", time_limit_ms=200)
+        self.assertEqual(result["verdict"], "time_limit_exceeded")
+        self.assertGreaterEqual(result["cpu_time_ms"], 150)
+
+    def test_time_limit_cannot_be_caught(self):
+        code = "while True:\n    try:\n        while True:\n            pass\n    except BaseException:\n        pass"
+        self.assertEqual(self.run_limited(code, time_limit_ms=200)["verdict"], "time_limit_exceeded")
+
+    def test_memory_limit(self):
+        result = self.run_limited("x = bytearray(512 * 1024 * 1024)", memory_limit_mb=64)
+        self.assertEqual(result["verdict"], "memory_limit_exceeded")
+
+    def test_usage_is_measured(self):
+        result = self.run_limited("x = bytearray(32 * 1024 * 1024)\nprint(len(x))", time_limit_ms=2000,
+                                  memory_limit_mb=256)
+        self.assertEqual(result["verdict"], "passed", result["output"])
+        self.assertIsNotNone(result["cpu_time_ms"])
+        self.assertIsNotNone(result["wall_time_ms"])
+        if result["peak_memory_kb"] is not None:  # needs /proc/self/clear_refs
+            self.assertGreaterEqual(result["peak_memory_kb"], 32 * 1024)
+
+
+class OutputCaptureTests(SimpleTestCase):
+    # endless output must end the run well before the time limit would
+    def test_output_limit_stops_the_program(self):
+        result = sandbox.run_test("while True:\n    print('x' * 100)", "", time_limit_ms=5000, output_limit_kb=64,
+                                  isolate=True)
+        self.assertEqual(result["verdict"], "output_limit_exceeded")
+        self.assertLess(result["wall_time_ms"], 1000)
+
+    def test_wrong_output_stops_the_program(self):
+        checker = checkers.make_checker(None, "", "1\n2\n")
+        result = sandbox.run_test("while True:\n    print(9)", "", checker=checker, time_limit_ms=5000, isolate=True)
+        self.assertEqual(result["verdict"], "wrong_answer")
+        self.assertLess(result["wall_time_ms"], 1000)
+
+    def test_preview_of_a_long_output_is_bounded(self):
+        result = sandbox.run_test("print('y' * 100000)", "", output_limit_kb=1024)
+        self.assertEqual(result["verdict"], "passed")
+        self.assertLessEqual(len(result["output"]), sandbox.OUTPUT_PREVIEW_CHARS + 100)
+        self.assertIn("100001 bytes in total", result["output"])
+
+
+class LineBudgetTests(SimpleTestCase):
+    LOOP = "total = 0\nfor i in range(100):\n    total += i\nprint(total)"
+
+    def test_lines_are_counted_the_same_every_run(self):
+        counts = {sandbox.run_test(self.LOOP, "", line_budget=10000)["lines_executed"] for _ in range(3)}
+        self.assertEqual(len(counts), 1)
+        self.assertGreater(counts.pop(), 200)
+
+    def test_exhausted_budget_is_a_time_limit(self):
+        result = sandbox.run_test(self.LOOP, "", line_budget=50)
+        self.assertEqual(result["verdict"], "time_limit_exceeded")
+        self.assertTrue(result["output"].startswith(sandbox.LINE_BUDGET_ERROR))
+
+    def test_only_the_submissions_lines_count(self):
+        result = sandbox.run_test("print(sum(sorted(range(100000))))", "", line_budget=10)
+        self.assertEqual(result["verdict"], "passed", result["output"])
+        self.assertEqual(result["lines_executed"], 1)
+
+    def test_no_budget_counts_nothing(self):
+        self.assertIsNone(sandbox.run_test(self.LOOP, "")["lines_executed"])
+
+
+@override_settings(JUDGE_POOL_SIZE=0)
+class CompileOnceTests(SimpleTestCase):
+    def setUp(self):
+        caches["judge"].clear()
+        sandbox.compile_code.cache_clear()
+
+    def test_code_is_compiled_once_for_all_tests(self):
+        cases = [(str(n), str(n * 2)) for n in range(5)]
+        status, results = judge.judge_tests("print(int(input()) * 2)", cases)
+        self.assertEqual(status, "passed", results)
+        self.assertEqual(sandbox.compile_code.cache_info().misses, 1)
+
+    def test_syntax_error_is_reported_for_every_test(self):
+        status, results = judge.judge_tests("print(", [("1", "1"), ("2", "2")])
+        self.assertEqual(status, "failed")
+        self.assertEqual([result["verdict"] for result in results], ["error", "error"])
+        self.assertIn("SyntaxError", results[1]["user_output"])
+
+
+# ---------- JUDGE POOL ----------
+
+@override_settings(JUDGE_POOL_SIZE=2)
+class JudgePoolTests(SimpleTestCase):
+    def setUp(self):
+        caches["judge"].clear()
+        judge.shutdown_pool()
+        self.addCleanup(judge.shutdown_pool)
+
+    def test_student_code_runs_outside_the_web_process(self):
+        self.assertNotEqual(judge.get_pool().apply(os.getpid), os.getpid())
+
+    def test_runaway_code_times_out_and_the_pool_carries_on(self):
+        status, results = judge.judge_tests("while True:\n    pass", [("", "")], limits={"time_limit_ms": 200})
+        self.assertEqual((status, results[0]["verdict"]), ("time_limit_exceeded", "time_limit_exceeded"))
+        status, results = judge.judge_tests("print(input())", [("ok", "ok")])
+        self.assertEqual(status, "passed", results)
+
+    def test_a_job_cannot_change_the_next_one(self):
+        judge.judge_tests("import math\nmath.pi = 3", [("", "")])
+        status, results = judge.judge_tests("import math\nprint(round(math.pi, 2))", [("", "3.14")])
+        self.assertEqual(status, "passed", results)
+
+
+# ---------- FAIL FAST ----------
+
+@override_settings(JUDGE_POOL_SIZE=0)
+class FailFastTests(SimpleTestCase):
+    def setUp(self):
+        caches["judge"].clear()
+
+    def test_stops_at_the_first_failure(self):
+        cases = [("1", "1"), ("2", "3"), ("3", "3"), ("4", "4")]
+        status, results = judge.judge_tests("print(input())", cases, fail_fast=True)
+        self.assertEqual(status, "failed")
+        self.assertEqual([result["verdict"] for result in results], ["passed", "wrong_answer", "skipped", "skipped"])
+
+    def test_full_run_judges_every_test(self):
+        cases = [("1", "1"), ("2", "3"), ("3", "3")]
+        status, results = judge.judge_tests("print(input())", cases)
+        self.assertEqual([result["verdict"] for result in results], ["passed", "wrong_answer", "passed"])
+
+    def test_challenge_setting_overrides_the_default(self):
+        challenge = Challenge(title="Echo", description="-")
+        with override_settings(JUDGE_FAIL_FAST=True):
+            self.assertTrue(judge.uses_fail_fast(challenge))
+            challenge.fail_fast = False
+            self.assertFalse(judge.uses_fail_fast(challenge))
+
+
+# ---------- LANGUAGE RUNNERS ----------
+
+# reads a file of the server and says whether it could
+READ_SETTINGS_C = f"""
+#include <stdio.h>
+int main(void) {{
+    FILE *f = fopen("{settings.BASE_DIR / 'CodeQuest' / 'settings.py'}", "r");
+    puts(f ? "leaked" : "blocked");
+    return 0;
+}}
+"""
+
+# A stand-in for nsjail/bwrap, good enough to show the jail is what keeps
+# the server's files out of reach: jail.sh DIR COMMAND... runs COMMAND in
+# DIR with no network, in a root holding only DIR and the read-only system
+# directories.
+TEST_JAIL = r"""#!/bin/sh
+dir=$1
+shift
+exec unshare --mount --net --pid --fork --kill-child sh -e -c '
+dir=$1
+shift
+root=/mnt
+mount -t tmpfs -o size=64m jail "$root"
+for d in bin sbin lib lib32 lib64 libx32 usr; do
+    if [ -L "/$d" ]; then
+        ln -s "$(readlink "/$d")" "$root/$d"
+    elif [ -d "/$d" ]; then
+        mkdir "$root/$d"
+        mount --rbind "/$d" "$root/$d"
+        mount -o remount,bind,ro "$root/$d"
+    fi
+done
+mkdir -p "$root/tmp" "$root$dir"
+mount --bind "$dir" "$root$dir"
+exec chroot "$root" sh -c "cd \"\$0\" && exec \"\$@\"" "$dir" "$@"
+' sh "$dir" "$@"
+"""
+
+
+def reachable_in_jail(tool):
+    # TEST_JAIL only has the system directories
+    path = shutil.which(tool)
+    return path is not None and os.path.realpath(path).startswith(("/bin/", "/sbin/", "/lib", "/usr/"))
+
+
+def can_jail():
+    try:
+        return subprocess.run(["unshare", "--mount", "--net", "true"], capture_output=True).returncode == 0
+    except OSError:
+        return False
+
+
+@override_settings(JUDGE_POOL_SIZE=0)
+class ProcessLanguageTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        caches["judge"].clear()
+
+    def judge_c(self, code, cases=(("", "blocked"),)):
+        return judge.judge_tests(code, list(cases), "c", {"time_limit_ms": 5000})
+
+    def test_off_by_default(self):
+        self.assertIsNone(judge.get_runner("c"))
+        status, results = self.judge_c(READ_SETTINGS_C)
+        self.assertEqual(results[0]["verdict"], "unsupported_language")
+        self.assertNotIn("leaked", results[0]["user_output"])
+
+    @override_settings(JUDGE_PROCESS_LANGUAGES=["c"])
+    def test_needs_a_jail(self):
+        self.assertIsNone(judge.get_runner("c"))
+
+    def test_runner_refuses_without_a_jail(self):
+        runners.WORKER_CONFIG["jail_command"] = ()
+        prepared = runners.prepare("c", READ_SETTINGS_C, self.root)
+        self.assertEqual(prepared["error"], runners.NOT_JAILED)
+        self.assertEqual(os.listdir(self.root), [])
+        result = runners.run_case("c", self.root, "", "blocked", time_limit_ms=1000)
+        self.assertEqual(result["verdict"], "error")
+
+    def jailed(self, *languages):
+        # settings that switch languages on, with TEST_JAIL as the jail
+        jail = os.path.join(self.root, "jail.sh")
+        with open(jail, "w") as f:
+            f.write(TEST_JAIL)
+        os.chmod(jail, 0o755)
+        return override_settings(JUDGE_PROCESS_LANGUAGES=list(languages), JUDGE_JAIL_COMMAND=[jail, "{dir}"],
+                                 JUDGE_ARTIFACT_DIR=os.path.join(self.root, "artifacts"))
+
+    @skipUnless(shutil.which("gcc") and can_jail(), "needs gcc and mount namespaces")
+    def test_jailed_program_cannot_read_the_server(self):
+        with self.jailed("c"):
+            status, results = self.judge_c(READ_SETTINGS_C)
+        self.assertEqual(status, "passed", results[0]["user_output"])
+
+    @skipUnless(shutil.which("g++") and can_jail(), "needs g++ and mount namespaces")
+    def test_compiled_once_and_reused(self):
+        code = "#include <iostream>\nint main() { long a, b; std::cin >> a >> b; std::cout << a + b << std::endl; }\n"
+        cases = [("1 2", "3"), ("20 22", "42"), ("-5 5", "0")]
+        with self.jailed("cpp"):
+            status, results = judge.judge_tests(code, cases, "cpp", {"time_limit_ms": 5000})
+            self.assertEqual(status, "passed", results)
+            artifacts = os.listdir(settings.JUDGE_ARTIFACT_DIR)
+            prepared = runners.prepare("cpp", code, settings.JUDGE_ARTIFACT_DIR)
+        self.assertEqual(len(artifacts), 1)
+        self.assertEqual(os.path.basename(prepared["artifact"]), artifacts[0])
+
+    @skipUnless(shutil.which("gcc") and can_jail(), "needs gcc and mount namespaces")
+    def test_compile_error_is_reported_for_every_test(self):
+        with self.jailed("c"):
+            status, results = self.judge_c("int main(void) { return x; }", [("", ""), ("", "")])
+        self.assertEqual(status, "error")
+        self.assertEqual([result["verdict"] for result in results], ["compile_error", "compile_error"])
+        self.assertIn("x", results[0]["user_output"])
+
+    @skipUnless(shutil.which("gcc") and can_jail(), "needs gcc and mount namespaces")
+    def test_crash_and_wrong_answer(self):
+        code = '#include <stdio.h>\nint main(void) { int n; scanf("%d", &n); if (n < 0) return 3; printf("%d\\n", n); }\n'
+        with self.jailed("c"):
+            status, results = self.judge_c(code, [("1", "1"), ("2", "3"), ("-1", "-1")])
+        self.assertEqual([result["verdict"] for result in results], ["passed", "wrong_answer", "error"])
+
+    @skipUnless(can_jail(), "needs mount namespaces")
+    def test_interpreted_languages(self):
+        programs = {
+            "javascript": "const n = require('fs').readFileSync(0, 'utf8').trim(); console.log(n * 2);",
+            "ruby": "puts gets.to_i * 2",
+        }
+        for language, code in programs.items():
+            with self.subTest(language):
+                if not all(reachable_in_jail(tool) for tool in runners.RUNNERS[language].toolchain):
+                    self.skipTest(f"{language} is not installed where TEST_JAIL can see it")
+                with self.jailed(language):
+                    status, results = judge.judge_tests(code, [("4", "8"), ("21", "42")], language,
+                                                        {"time_limit_ms": 5000})
+                self.assertEqual(status, "passed", results)
+
+
+# ---------- SUBINTERPRETERS ----------
+
+@override_settings(JUDGE_PYTHON_BACKEND="interpreters")
+class InterpreterBackendTests(SimpleTestCase):
+    def setUp(self):
+        for patch in [mock.patch.object(subinterpreters, "SUPPORTED", True),
+                      mock.patch.object(judge, "_interpreters_allowed", False)]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_web_processes_use_the_process_pool(self):
+        self.assertEqual(judge.python_backend(), "processes")
+
+    @override_settings(JUDGE_INTERPRETER_MEMORY_MB=512)
+    def test_judge_worker_caps_its_memory_first(self):
+        with mock.patch.object(subinterpreters, "limit_memory") as limit_memory:
+            judge.allow_interpreters()
+        limit_memory.assert_called_once_with(512)
+        self.assertEqual(judge.python_backend(), "interpreters")
+
+    def test_memory_cap_stops_an_allocation(self):
+        script = (
+            "from my_app import subinterpreters\n"
+            "subinterpreters.limit_memory(256)\n"
+            "try:\n"
+            "    bytearray(512 * 1024 * 1024)\n"
+            "except MemoryError:\n"
+            "    print('capped')\n"
+        )
+        done = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=60)
+        self.assertEqual(done.stdout.strip(), "capped", done.stderr)
+
+
+@skipUnless(subinterpreters.SUPPORTED, "needs Python 3.13+")
+class InterpreterPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = subinterpreters.InterpreterPool(
+            2, initializer=runners.init_worker, initargs=({"fork_per_job": False, "monitor_limits": True},),
+        )
+        self.addCleanup(self.pool.join)
+        self.addCleanup(self.pool.terminate)
+
+    def run_case(self, code, test_input, expected, **limits):
+        return self.pool.apply_async(runners.run_case, ("python", code, test_input, expected), limits).get(30)
+
+    def test_runs_tests_in_this_process(self):
+        self.assertEqual(self.pool.apply_async(os.getpid).get(10), os.getpid())
+        result = self.run_case("print(int(input()) * 2)", "21", "42", time_limit_ms=1000)
+        self.assertEqual(result["verdict"], "passed", result["output"])
+
+    def test_time_limit_is_monitored(self):
+        result = self.run_case("while True:\n    pass", "", None, time_limit_ms=200)
+        self.assertEqual(result["verdict"], "time_limit_exceeded")
+        # the interpreter is still usable afterwards
+        self.assertEqual(self.run_case("print(1)", "", "1", time_limit_ms=1000)["verdict"], "passed")
+
+    def test_callbacks_report_results(self):
+        done = threading.Event()
+        results = []
+        self.pool.apply_async(runners.run_case, ("python", "print(2)", "", "2"), {"time_limit_ms": 1000},
+                              callback=lambda result: (results.append(result), done.set()))
+        self.assertTrue(done.wait(30))
+        self.assertEqual(results[0]["verdict"], "passed")
+
+
+# ---------- CHECKERS ----------
+
+def check(spec, expected, output, chunk_size=7, test_input=""):
+    # feeds output in pieces, as the sandbox does while the program prints
+    checker = checkers.make_checker(spec, test_input, expected)
+    pieces = [output[i:i + chunk_size] for i in range(0, len(output), chunk_size)]
+    return all(checker.feed(piece) for piece in pieces) and checker.finish()
+
+
+class CheckerTests(SimpleTestCase):
+    def test_exact(self):
+        self.assertTrue(check(None, "1 2\n3", "\n 1 2\n3  \n"))
+        self.assertTrue(check(("exact", None), "", "  \n"))
+        for output in ["1 2 3", "1  2\n3", "1 2\n", "1 2\n34", "1 2\n3\n4"]:
+            with self.subTest(output):
+                self.assertFalse(check(None, "1 2\n3", output))
+
+    def test_tokens(self):
+        self.assertTrue(check(("tokens", None), "10 20\n30", "10\n20   30\n", chunk_size=1))
+        self.assertFalse(check(("tokens", None), "10 20", "10 2 0", chunk_size=1))
+        self.assertFalse(check(("tokens", None), "10 20", "10 20 30"))
+        self.assertFalse(check(("tokens", None), "10 20", "10"))
+
+    def test_float(self):
+        self.assertTrue(check(("float", 1e-3), "0.5 x 1000", "0.5004 x 1000.9"))
+        self.assertFalse(check(("float", 1e-3), "0.5 x", "0.51 x"))
+        self.assertFalse(check(("float", 1e-3), "0.5 x", "0.5 y"))
+
+    def test_unordered_lines(self):
+        spec = ("unordered_lines", None)
+        self.assertTrue(check(spec, "a\nb\nb\n", "b\n\n  a \nb"))
+        self.assertFalse(check(spec, "a\nb\nb", "a\nb"))
+        self.assertFalse(check(spec, "a\nb", "a\nb\nb"))
+        long_line = "x" * 100
+        self.assertTrue(check(spec, f"{long_line}\ny", f"y\n{long_line}"))
+        self.assertFalse(check(spec, f"{long_line}\ny", f"y\n{long_line}x"))
+
+    def test_custom(self):
+        spec = ("custom", "def check(input, expected, output):\n    return int(output) == 2 * int(input)")
+        self.assertTrue(check(spec, "", "84\n", test_input="42"))
+        self.assertFalse(check(spec, "", "85\n", test_input="42"))
+
+        failing = checkers.make_checker(("custom", "def check(i, e, o):\n    return 1 / 0"), "", "")
+        self.assertFalse(failing.finish())
+        self.assertIn("ZeroDivisionError", failing.error)
+
+    def test_bad_specs(self):
+        for spec in [("custom", "x = 1"), ("custom", "def check(:"), ("nope", None)]:
+            with self.subTest(spec):
+                with self.assertRaises(checkers.CheckerError):
+                    checkers.make_checker(spec, "", "1")
+
+    def test_no_expected_output_only_runs(self):
+        self.assertIsNone(checkers.make_checker(None, "", None))
+
+
+# ---------- STORED TESTS ----------
+
+class StoredTestTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def stored(self, text):
+        name = test_store.write_blob(self.root, text)
+        return test_store.StoredFile(f"{self.root}/{name}", len(text.encode()))
+
+    def test_iter_lines_across_chunks(self):
+        text = "ab\r\ncd\n\nxyzé" * 3
+        data = self.stored(text)
+        self.assertEqual(list(test_store.iter_lines(data)), text.splitlines())
+        self.assertEqual("".join(test_store.iter_text(data, chunk_size=3)), text)
+
+    def test_checkers_read_stored_expected_output(self):
+        text = "\n".join(f"{i} {i * i}" for i in range(50000))
+        expected = self.stored(text)
+        self.assertGreater(expected.size, test_store.STREAM_CHUNK)
+        for spec in [None, ("tokens", None), ("unordered_lines", None), ("float", 1e-6)]:
+            with self.subTest(spec):
+                self.assertTrue(check(spec, expected, text + "\n", chunk_size=4096))
+                self.assertFalse(check(spec, expected, text.replace("49999", "4999"), chunk_size=4096))
+                self.assertFalse(check(spec, expected, text[:-1], chunk_size=4096))
+
+    def test_exact_checker_whitespace(self):
+        expected = self.stored("1 2\n3")
+        self.assertTrue(check(None, expected, "  1 2\n3\n\n"))
+        self.assertFalse(check(None, expected, "1  2\n3"))
+        self.assertFalse(check(None, expected, "1 2\n3 4"))
+        self.assertFalse(check(None, self.stored("1 2"), "1 2\n3"))
+
+    def test_python_reads_stored_input(self):
+        test_input = self.stored("\n".join(map(str, range(30000))) + "\n")
+        expected = self.stored(str(sum(range(30000))))
+        result = runners.run_case(
+            "python", "n = 0\nwhile True:\n    line = input()\n    if not line:\n        break\n"
+                      "    n += int(line)\nprint(n)", test_input, expected, time_limit_ms=5000,
+        )
+        self.assertEqual(result["verdict"], "passed", result["output"])
+
+
+# ---------- RESULT CACHE ----------
+
+@override_settings(JUDGE_POOL_SIZE=0)
+class ResultCacheTests(SimpleTestCase):
+    cases = [("", "1")]
+
+    def setUp(self):
+        caches["judge"].clear()
+
+    def judge(self, code, **limits):
+        return judge.judge_tests(code, self.cases, "python", {"time_limit_ms": 100, **limits})
+
+    def cached(self, code, **limits):
+        key = judge.result_cache_key(code, "python", judge.tests_fingerprint(self.cases),
+                                     {"time_limit_ms": 100, **limits})
+        return caches["judge"].get(key)
+
+    def test_passed_run_is_cached(self):
+        self.assertEqual(self.judge("print(1)")[0], "passed")
+        self.assertEqual(self.cached("print(1)")[0], "passed")
+
+    def test_clock_time_limit_is_not_cached(self):
+        code = "while True:\n    pass"
+        self.assertEqual(self.judge(code)[0], "time_limit_exceeded")
+        self.assertIsNone(self.cached(code))
+
+    def test_line_budget_is_cached(self):
+        code = "while True:\n    pass"
+        self.assertEqual(self.judge(code, line_budget=1000)[0], "time_limit_exceeded")
+        self.assertEqual(self.cached(code, line_budget=1000)[0], "time_limit_exceeded")
+
+
+# ---------- STREAMED RESULTS ----------
+
+def sleep_and_return(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+class FairQueueTests(SimpleTestCase):
+    def job(self, share, weight=1):
+        return type("Job", (), {"share": share, "weight": weight, "queued_at": time.monotonic()})()
+
+    def drain(self, queue):
+        return "".join(queue.popleft().share for _ in range(len(queue)))
+
+    def test_shares_take_turns_by_weight(self):
+        queue = scheduler._FairQueue()
+        for _ in range(4):
+            queue.append(self.job("a", 2))
+            queue.append(self.job("b", 1))
+        self.assertEqual(len(queue), 8)
+        self.assertEqual(self.drain(queue), "aabaabbb")
+
+    def test_fifo_within_a_share(self):
+        queue = scheduler._FairQueue()
+        jobs = [self.job("a") for _ in range(3)]
+        for job in jobs:
+            queue.append(job)
+        self.assertEqual([queue.popleft() for _ in jobs], jobs)
+
+    def test_idle_share_keeps_no_credit(self):
+        queue = scheduler._FairQueue()
+        queue.append(self.job("a", 3))
+        queue.popleft()  # "a" drains with credit left over
+        queue.append(self.job("b"))
+        queue.append(self.job("b"))
+        queue.append(self.job("a", 3))
+        self.assertEqual(self.drain(queue), "bab")
+
+    def test_remove(self):
+        queue = scheduler._FairQueue()
+        keep, cancelled = self.job("a"), self.job("b")
+        queue.append(keep)
+        queue.append(cancelled)
+        queue.remove(cancelled)
+        self.assertEqual(queue.depth_by_share(), {"a": 1})
+        self.assertIs(queue.popleft(), keep)
+        self.assertEqual(len(queue), 0)
+
+
+class CompletionOrderTests(SimpleTestCase):
+    def test_jobs_are_taken_as_they_finish(self):
+        with ThreadPool(3) as pool:
+            lanes = scheduler.LaneScheduler(pool, 3, {})
+            completions = scheduler.Completions(lanes)
+            pending = {
+                lanes.submit("graded", sleep_and_return, (seconds,), timeout=5, on_done=completions.add): seconds
+                for seconds in (0.3, 0.1, 0.2)
+            }
+            finished = []
+            while pending:
+                job = completions.next(pending)
+                finished.append(pending.pop(job))
+                self.assertEqual(job.get(), finished[-1])
+        self.assertEqual(finished, [0.1, 0.2, 0.3])
+
+    def test_overdue_job_times_out(self):
+        with ThreadPool(1) as pool:
+            lanes = scheduler.LaneScheduler(pool, 1, {})
+            completions = scheduler.Completions(lanes)
+            job = lanes.submit("graded", sleep_and_return, (0.5,), timeout=0.1, on_done=completions.add)
+            with self.assertRaises(multiprocessing.TimeoutError):
+                completions.next([job])
+
+
+@override_settings(JUDGE_POOL_SIZE=4, JUDGE_MAX_PARALLEL_TESTS=3)
+class ParallelTestsTests(SimpleTestCase):
+    # a thread pool stands in for the judge processes, so run_case can be watched
+    def test_tests_of_a_submission_run_side_by_side(self):
+        lock = threading.Lock()
+        running, most = [0], [0]
+
+        def run_case(language, artifact, test_input, expected_output, checker, **limits):
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            time.sleep(0.1)
+            with lock:
+                running[0] -= 1
+            return sandbox.make_result("passed" if test_input != "3" else "wrong_answer", test_input, 0.1, 0.1, None)
+
+        caches["judge"].clear()
+        with ThreadPool(4) as pool, \
+                mock.patch.object(judge, "get_scheduler", return_value=scheduler.LaneScheduler(pool, 4, {})), \
+                mock.patch.object(runners, "run_case", run_case):
+            status, results = judge.judge_tests("print(input())", [(str(n), str(n)) for n in range(6)])
+
+        self.assertEqual(most[0], 3)  # JUDGE_MAX_PARALLEL_TESTS, not the whole suite at once
+        self.assertEqual(status, "failed")
+        self.assertEqual([result["verdict"] for result in results], ["passed"] * 3 + ["wrong_answer"] + ["passed"] * 2)
+
+
+@override_settings(JUDGE_POOL_SIZE=0, JUDGE_ASYNC_SUBMISSIONS=False)
+class SubmitStreamTests(TestCase):
+    def setUp(self):
+        caches["judge"].clear()
+        self.user = User.objects.create_user("student")
+        classroom = Classroom.objects.create(name="Class", mentor=self.user)
+        self.challenge = Challenge.objects.create(title="Echo", classroom=classroom, description="-", points=10)
+        self.challenge.set_tests([{"input": "1", "output": "1"}, {"input": "2", "output": "2"}])
+        Profile.objects.get_or_create(user=self.user)
+        UserStats.objects.get_or_create(user=self.user)
+
+    def test_submit_streams_results_then_verdict(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("challenge_submit", args=[self.challenge.slug]),
+                                    {"code": "print(input())"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        events = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        self.assertEqual([event["event"] for event in events], ["start", "test", "test", "done"])
+        self.assertEqual(sorted(event["index"] for event in events[1:3]), [0, 1])
+        done = events[-1]
+        submission = Submission.objects.get(id=done["submission_id"])
+        self.assertEqual((done["status"], submission.status), ("passed", "passed"))
+        self.assertEqual(done["points_awarded"], submission.points_awarded)
+
+    def test_slot_is_held_until_an_abandoned_submission_is_saved(self):
+        caches["admission"].clear()
+        admission._controllers.clear()
+        self.addCleanup(admission._controllers.clear)
+        save_judged = judge.save_judged
+        in_flight = []
+
+        def saving(*args):
+            in_flight.append(admission.get_controller().counters.get("in_flight", 10))
+            return save_judged(*args)
+
+        self.client.force_login(self.user)
+        with mock.patch.object(judge, "save_judged", saving):
+            response = self.client.post(reverse("challenge_submit", args=[self.challenge.slug]),
+                                        {"code": "print(input())"})
+            next(iter(response.streaming_content))
+            response.close()  # the editor went away
+        self.assertEqual(in_flight, [1])
+        self.assertEqual(admission.get_controller().counters.get("in_flight", 10), 0)
+        self.assertEqual(Submission.objects.get().status, "passed")
+
+    def test_worker_leaves_a_submission_judged_in_the_request_alone(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("challenge_submit", args=[self.challenge.slug]),
+                                    {"code": "print(input())"})
+        stream = iter(response.streaming_content)
+        next(stream)  # "start": the submission exists and is being judged
+        submission = Submission.objects.get()
+        self.assertEqual(submission.status, "judging")
+
+        output = io.StringIO()
+        call_command("judge_worker", once=True, stdout=output)
+        self.assertNotIn(f"#{submission.id}", output.getvalue())
+
+        list(stream)
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, "passed")
+        self.assertEqual(UserStats.objects.get(user=self.user).attempts, 1)
+
+
+# ---------- SUBMISSION QUEUE ----------
+
+@override_settings(JUDGE_ASYNC_SUBMISSIONS=True)
+class AsyncSubmitTests(TestCase):
+    def setUp(self):
+        caches["judge"].clear()
+        judge._claim_turns.clear()
+        self.user = User.objects.create_user("student")
+        classroom = Classroom.objects.create(name="Class", mentor=self.user)
+        self.challenge = Challenge.objects.create(title="Echo", classroom=classroom, description="-", points=10)
+        self.challenge.set_tests([{"input": "1", "output": "1"}])
+        Profile.objects.get_or_create(user=self.user)
+        UserStats.objects.get_or_create(user=self.user)
+        self.client.force_login(self.user)
+
+    def test_submit_queues_and_the_worker_judges(self):
+        response = self.client.post(reverse("challenge_submit", args=[self.challenge.slug]),
+                                    {"code": "print(input())"})
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()["status_url"]
+        self.assertEqual(self.client.get(status_url).json()["status"], "pending")
+        self.assertFalse(self.client.get(status_url).json()["done"])
+
+        call_command("judge_worker", once=True, stdout=io.StringIO())
+        status = self.client.get(status_url).json()
+        self.assertEqual((status["status"], status["done"], status["points_awarded"]), ("passed", True, 10))
+        self.assertEqual(len(status["results"]), 1)
+
+    def test_status_is_only_shown_to_its_owner(self):
+        response = self.client.post(reverse("challenge_submit", args=[self.challenge.slug]),
+                                    {"code": "print(input())"})
+        self.client.force_login(User.objects.create_user("other"))
+        self.assertEqual(self.client.get(response.json()["status_url"]).status_code, 404)
+
+    @override_settings(JUDGE_MAX_PER_USER=1)
+    def test_a_full_queue_answers_429(self):
+        url = reverse("challenge_submit", args=[self.challenge.slug])
+        self.assertEqual(self.client.post(url, {"code": "print(1)"}).status_code, 202)
+        response = self.client.post(url, {"code": "print(2)"})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(Submission.objects.count(), 1)
+
+
+# ---------- TEST STATISTICS ----------
+
+class TestStatisticsTests(TestCase):
+    def setUp(self):
+        caches["judge"].clear()
+        judge.flush_test_stats()
+        self.user = User.objects.create_user("student")
+        classroom = Classroom.objects.create(name="Class", mentor=self.user)
+        self.challenge = Challenge.objects.create(title="Halve", classroom=classroom, description="-", fail_fast=False)
+        self.challenge.set_tests([{"input": "4", "output": "2"}, {"input": "0", "output": "0"}])
+        Profile.objects.get_or_create(user=self.user)
+        UserStats.objects.get_or_create(user=self.user)
+
+    def submit(self, code):
+        submission = Submission.objects.create(user=self.user, challenge=self.challenge, code=code, status="judging")
+        judge.judge_submission(submission)
+        judge.flush_test_stats()
+        return submission
+
+    def counts(self):
+        return [(test.runs, test.failures) for test in self.challenge.test_cases.order_by("position")]
+
+    def test_runtime_errors_count_as_failures(self):
+        self.submit("n = int(input())\nprint(n // (n // 2))")  # 0 // 0 raises
+        self.assertEqual(self.counts(), [(1, 0), (1, 1)])
+
+    def test_fail_fast_runs_the_most_failed_tests_first(self):
+        cases = [("1", "1"), ("2", "2"), ("3", "3")]
+        with override_settings(JUDGE_POOL_SIZE=0):
+            events = judge.iter_judge_tests("print(input())", cases, fail_fast=True, failure_rates=[0.1, 0.9, 0.5])
+            order = [event["index"] for event in events if event["event"] == "test"]
+        self.assertEqual(order, [1, 2, 0])
+
+    def test_failures_move_a_test_to_the_front(self):
+        self.challenge.fail_fast = True
+        self.challenge.save()
+        for _ in range(3):
+            caches["judge"].clear()
+            self.submit("n = int(input())\nprint(n // (n // 2))")
+        first, second = self.challenge.test_cases.order_by("position")
+        self.assertGreater(second.failure_rate, first.failure_rate)
+        with override_settings(JUDGE_POOL_SIZE=0):
+            events = judge.iter_judge_challenge(self.challenge, "print(int(input()) // 2)", fail_fast=True)
+            order = [event["index"] for event in events if event["event"] == "test"]
+        self.assertEqual(order, [1, 0])
+
+    def test_cached_results_are_not_counted_again(self):
+        code = "print(int(input()) // 2)"
+        self.submit(code)
+        self.assertEqual(self.submit(code).status, "passed")  # answered from the result cache
+        self.assertEqual(self.counts(), [(1, 0), (1, 0)])
+
+
+# ---------- ADMISSION ----------
+
+class SharedAdmissionTests(SimpleTestCase):
+    def setUp(self):
+        caches["admission"].clear()
+
+    def controller(self, max_in_flight=1, max_queued=0, max_per_user=1):
+        # controllers sharing the cache stand in for separate web processes
+        counters = admission.SharedCounters(caches["admission"], 60)
+        return admission.AdmissionController(max_in_flight, max_queued, max_per_user, 0.2, counters)
+
+    def test_limits_hold_across_processes(self):
+        first, second = self.controller(max_in_flight=2), self.controller(max_in_flight=2)
+        slot = first.admit(1)
+        with self.assertRaisesRegex(admission.JudgeBusy, "already have code running"):
+            second.admit(1)
+        second.admit(2)
+        with self.assertRaisesRegex(admission.JudgeBusy, "busy"):
+            first.admit(3)
+
+        slot.release()
+        first.admit(3).release()
+        self.assertEqual(second.counters.get("in_flight", 10), 1)
+
+    def test_a_slot_never_given_back_expires_despite_traffic(self):
+        counters = admission.SharedCounters(caches["admission"], 1)
+        counters.take("in_flight", 2)  # its process was killed
+        deadline = time.monotonic() + 1.2
+        while time.monotonic() < deadline:
+            counters.give_back(counters.take("in_flight", 2))
+            time.sleep(0.05)
+        self.assertEqual(counters.get("in_flight", 2), 0)
+
+    def test_waits_for_a_slot_another_process_gives_back(self):
+        first, second = self.controller(max_queued=1), self.controller(max_queued=1)
+        slot = first.admit(1)
+        threading.Timer(0.05, slot.release).start()
+        second.admit(2).release()
+        self.assertEqual(first.counters.get("in_flight", 10), 0)
+        self.assertEqual(first.counters.get("queued", 10), 0)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def setUp(self):
+        caches["admission"].clear()
+        counters = admission.SharedCounters(caches["admission"], 60)
+        self.controller = admission.AdmissionController(1, 2, 0, 1.0, counters)
+
+    def test_waiting_requests_get_in_in_order(self):
+        slot = self.controller.admit(1)
+        admitted = []
+
+        def wait(user):
+            with self.controller.admit(user):
+                admitted.append(user)
+
+        threads = []
+        for user in (2, 3):
+            threads.append(threading.Thread(target=wait, args=(user,)))
+            threads[-1].start()
+            while self.controller.counters.get("queued", 10) < len(threads):
+                time.sleep(0.01)
+        with self.assertRaisesRegex(admission.JudgeBusy, "busy"):
+            self.controller.admit(4)  # the queue is full
+
+        slot.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted, [2, 3])
+        self.assertEqual(self.controller.counters.get("in_flight", 10), 0)
+
+    def test_wait_times_out(self):
+        self.controller.queue_timeout = 0.1
+        with self.controller.admit(1):
+            with self.assertRaises(admission.JudgeBusy) as busy:
+                self.controller.admit(2)
+        self.assertGreaterEqual(busy.exception.retry_after, 1)
+        self.assertEqual(self.controller.counters.get("queued", 10), 0)
+        self.assertEqual(self.controller.counters.get("user:2", 10), 0)
+        self.controller.admit(2).release()
+
+    def test_release_is_idempotent(self):
+        slot = self.controller.admit(1)
+        slot.release()
+        slot.release()
+        self.assertEqual(self.controller.counters.get("in_flight", 10), 0)
+        self.assertEqual(self.controller.counters.get("user:1", 10), 0)
+
+    def test_classrooms_take_turns(self):
+        self.controller.max_queued = self.controller.max_queued_per_classroom = 4
+        slot = self.controller.admit(0)
+        admitted = []
+
+        def wait(user, classroom):
+            with self.controller.admit(user, (classroom, 1)):
+                admitted.append(user)
+
+        threads = []
+        for user, classroom in [(1, "large"), (2, "large"), (3, "large"), (4, "small")]:
+            threads.append(threading.Thread(target=wait, args=(user, classroom)))
+            threads[-1].start()
+            while self.controller.counters.get("queued", 10) < len(threads):
+                time.sleep(0.01)
+
+        slot.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted, [1, 4, 2, 3])
+
+    def test_one_classroom_cannot_fill_the_queue(self):
+        self.controller.max_queued, self.controller.max_queued_per_classroom = 3, 1
+        self.controller.queue_timeout = 0.5
+        with self.controller.admit(0):
+            waiting = threading.Thread(target=lambda: self.controller.admit(1, ("large", 1)).release())
+            waiting.start()
+            while self.controller.counters.get("queued", 10) < 1:
+                time.sleep(0.01)
+            with self.assertRaisesRegex(admission.JudgeBusy, "Your class"):
+                self.controller.admit(2, ("large", 1))
+            small = threading.Thread(target=lambda: self.controller.admit(3, ("small", 1)).release())
+            small.start()
+            while self.controller.counters.get("queued", 10) < 2:
+                time.sleep(0.01)
+        waiting.join()
+        small.join()
+        self.assertEqual(self.controller.counters.get("queued", 10), 0)
+        self.assertEqual(self.controller.counters.get("queued:large", 10), 0)
+
+
+class ClaimOrderTests(TestCase):
+    def setUp(self):
+        judge._claim_turns.clear()
+
+    def test_classrooms_take_turns(self):
+        mentor = User.objects.create_user("mentor")
+        student = User.objects.create_user("student")
+        challenges = {}
+        for name, weight in [("large", 1), ("small", 1), ("heavy", 2)]:
+            classroom = Classroom.objects.create(name=name, mentor=mentor, judge_weight=weight)
+            challenges[name] = Challenge.objects.create(title=name, classroom=classroom, description="-")
+        for name in ["large"] * 3 + ["heavy"] * 3 + ["small"]:
+            Submission.objects.create(user=student, challenge=challenges[name], code="print(1)", status="pending")
+
+        claimed = []
+        while (submission := judge.claim_next_submission()) is not None:
+            claimed.append(submission.challenge.title)
+        # "heavy" has twice the share, so it takes two for every one of the others
+        self.assertEqual(claimed, ["large", "heavy", "small", "heavy", "large", "heavy", "large"])
+
+@override_settings(JUDGE_MAX_IN_FLIGHT=1, JUDGE_MAX_QUEUED=0, JUDGE_INTERACTIVE_MAX_IN_FLIGHT=1,
+                   JUDGE_INTERACTIVE_MAX_QUEUED=0, JUDGE_ASYNC_SUBMISSIONS=False)
+class InteractiveAdmissionTests(TestCase):
+    def setUp(self):
+        caches["admission"].clear()
+        admission._controllers.clear()
+        self.addCleanup(admission._controllers.clear)
+        mentor = User.objects.create_user("mentor")
+        classroom = Classroom.objects.create(name="Class", mentor=mentor)
+        self.challenge = Challenge.objects.create(title="Echo", classroom=classroom, description="-")
+        self.user = User.objects.create_user("student")
+        self.client.force_login(self.user)
+
+    def test_runs_get_in_while_submissions_are_full(self):
+        with admission.get_controller("graded").admit(self.user.id + 1):
+            response = self.client.post(reverse("challenge_submit", args=[self.challenge.slug]), {"code": "print(1)"})
+            self.assertEqual(response.status_code, 429)
+            response = self.client.post(reverse("run_tests", args=[self.challenge.slug]), {"code": "print(1)"})
+            self.assertEqual(response.status_code, 200)
+
+    def test_submissions_get_in_while_runs_are_full(self):
+        with admission.get_controller("interactive").admit(self.user.id + 1):
+            response = self.client.post(reverse("run_tests", args=[self.challenge.slug]), {"code": "print(1)"})
+            self.assertEqual(response.status_code, 429)
+            response = self.client.post(reverse("challenge_submit", args=[self.challenge.slug]), {"code": "print(1)"})
+            self.assertEqual(response.status_code, 200)
+            list(response.streaming_content)
+
+
+class RunTestsLoginTests(TestCase):
+    def test_anonymous_runs_are_refused(self):
+        mentor = User.objects.create_user("mentor")
+        classroom = Classroom.objects.create(name="Class", mentor=mentor)
+        challenge = Challenge.objects.create(title="Echo", classroom=classroom, description="-")
+        for name in ["run_tests", "run_tests_stream"]:
+            with self.subTest(name):
+                response = self.client.post(reverse(name, args=[challenge.slug]), {"code": "print(1)"})
+                self.assertEqual(response.status_code, 403)
+
+
+# ---------- POINTS ----------
+
+class ParallelPointsTests(TransactionTestCase):
+    # Passing submissions of one user judged at the same time must pay the
+    # challenge's points exactly once (see judge.save_judged).
+    def test_each_user_is_paid_once(self):
+        mentor = User.objects.create_user("mentor")
+        classroom = Classroom.objects.create(name="Class", mentor=mentor)
+        challenge = Challenge.objects.create(title="Echo", classroom=classroom, description="-", points=25)
+        users = [User.objects.create_user(f"student{i}") for i in range(4)]
+        for user in users:
+            Profile.objects.get_or_create(user=user)
+            UserStats.objects.get_or_create(user=user)
+        submissions = [
+            Submission.objects.create(user=user, challenge=challenge, code="print(1)", status="judging")
+            for _ in range(6)
+            for user in users
+        ]
+
+        def save(submission):
+            try:
+                for attempt in range(50):
+                    try:
+                        return judge.save_judged(submission, "passed", [])
+                    except OperationalError:  # sqlite: the database is locked
+                        time.sleep(0.01 * (attempt + 1))
+                raise AssertionError(f"submission {submission.id} could not be saved")
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(8) as executor:
+            paid = list(executor.map(save, submissions))
+
+        self.assertEqual(sum(paid), challenge.points * len(users))
+        for user in users:
+            with self.subTest(user.username):
+                holders = Submission.objects.filter(user=user, challenge=challenge, points_awarded__gt=0)
+                self.assertEqual(holders.count(), 1)
+                self.assertEqual(Profile.objects.get(user=user).points, challenge.points)
+                stats = UserStats.objects.get(user=user)
+                self.assertEqual((stats.points, stats.solved_count), (challenge.points, 1))
+                progress = ChallengeProgress.objects.get(user=user, challenge=challenge)
+                self.assertEqual(progress.points_submission_id, holders.get().id)
+
+
+class ApiPointsTests(TestCase):
+    # The JSON API judges and pays through judge.save_judged like the editor,
+    # so solving a challenge through both is still paid once.
+    def setUp(self):
+        caches["judge"].clear()
+        self.user = User.objects.create_user("student")
+        classroom = Classroom.objects.create(name="Class", mentor=self.user)
+        self.challenge = Challenge.objects.create(title="Echo", classroom=classroom, description="-", points=10)
+        self.challenge.set_tests([{"input": "1", "output": "1"}])
+        Profile.objects.get_or_create(user=self.user)
+        UserStats.objects.get_or_create(user=self.user)
+
+    def test_api_then_editor_pays_once(self):
+        request = RequestFactory().post("/", json.dumps({"code": "print(input())"}), content_type="application/json")
+        request.user = self.user
+        body = json.loads(api_views.submit_challenge_api(request, self.challenge.slug).content)["submission"]
+        self.assertEqual((body["status"], body["points_awarded"]), ("passed", 10))
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("challenge_submit", args=[self.challenge.slug]),
+                                    {"code": "print(input())"})
+        done = json.loads(b"".join(response.streaming_content).splitlines()[-1])
+        self.assertEqual((done["status"], done["points_awarded"], done["attempt_number"]), ("passed", 0, 2))
+
+        self.assertEqual(Profile.objects.get(user=self.user).points, 10)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.points, stats.solved_count, stats.attempts), (10, 1, 2))
+        progress = ChallengeProgress.objects.get(user=self.user, challenge=self.challenge)
+        self.assertEqual(progress.points_submission_id, body["id"])
+
+
+# ---------- LEADERBOARD ----------
+
+class LeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        mentor = User.objects.create_user("mentor")
+        cls.classroom = Classroom.objects.create(name="Class", mentor=mentor)
+        Profile.objects.get_or_create(user=mentor)
+        # (points, solved) per user; ties fall back to solved, then username
+        cls.users = {}
+        for name, points, solved, member in [
+            ("dana", 50, 3, True), ("bob", 30, 2, False), ("amy", 30, 2, True),
+            ("carl", 30, 5, False), ("eve", 10, 1, True), ("finn", 0, 0, True),
+        ]:
+            user = User.objects.create_user(name)
+            Profile.objects.update_or_create(user=user, defaults={"points": points})
+            UserStats.objects.update_or_create(user=user, defaults={"solved_count": solved})
+            if member:
+                ClassroomMembership.objects.create(user=user, classroom=cls.classroom)
+            cls.users[name] = user
+
+    def names(self, entries):
+        return [User.objects.get(pk=entry.user_id).username for entry in entries]
+
+    def test_top(self):
+        self.assertEqual(self.names(leaderboard.top(leaderboard.GLOBAL, 4)), ["dana", "carl", "amy", "bob"])
+        self.assertEqual(
+            [entry.rank for entry in leaderboard.top(self.classroom.id, 10)], [1, 2, 3, 4],
+        )
+        self.assertEqual(self.names(leaderboard.top(self.classroom.id, 10)), ["dana", "amy", "eve", "finn"])
+
+    def test_rank_matches_order(self):
+        for entry in leaderboard.top(leaderboard.GLOBAL, 100):
+            self.assertEqual(leaderboard.rank(leaderboard.GLOBAL, entry.user_id), entry.rank)
+        self.assertEqual(leaderboard.rank(self.classroom.id, self.users["eve"].id), 3)
+        self.assertIsNone(leaderboard.rank(self.classroom.id, self.users["bob"].id))
+
+    def test_neighbors(self):
+        entries = leaderboard.neighbors(leaderboard.GLOBAL, self.users["amy"].id, 1)
+        self.assertEqual(self.names(entries), ["carl", "amy", "bob"])
+        self.assertEqual([entry.rank for entry in entries], [2, 3, 4])
+        self.assertEqual(self.names(leaderboard.neighbors(leaderboard.GLOBAL, self.users["dana"].id, 1)),
+                         ["dana", "carl"])
+        self.assertEqual(leaderboard.neighbors(self.classroom.id, self.users["bob"].id), [])
+
+    def test_points_change_is_ranked_at_once(self):
+        Profile.objects.filter(user=self.users["finn"]).update(points=F("points") + 100)
+        self.assertEqual(leaderboard.rank(leaderboard.GLOBAL, self.users["finn"].id), 1)
+
+
+# ---------- BADGES ----------
+
+class BadgeEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("student")
+        self.classroom = Classroom.objects.create(name="Class", mentor=self.user)
+        self.challenges = [
+            Challenge.objects.create(title=f"C{n}", classroom=self.classroom, description="-") for n in range(3)
+        ]
+        self.first = Badge.objects.create(name="First", description="-", requirement_type=Badge.FIRST_SOLVE)
+        self.two = Badge.objects.create(name="Two", description="-", requirement_type=Badge.CHALLENGE_COUNT, value=2)
+        self.complete = Badge.objects.create(name="Done", description="-",
+                                             requirement_type=Badge.CLASSROOM_COMPLETE, value=self.classroom.id)
+
+    def solve(self, challenge, user=None):
+        submission = Submission.objects.create(user=user or self.user, challenge=challenge, code="-", status="passed")
+        return badges.record_solve(submission)
+
+    def test_badges_are_earned_as_solves_come_in(self):
+        self.assertEqual(self.solve(self.challenges[0]), [self.first])
+        self.assertEqual(self.solve(self.challenges[1]), [self.two])
+        self.assertEqual(self.solve(self.challenges[2]), [self.complete])
+        self.assertEqual(SolveCount.objects.get(user=self.user).solved, 3)
+        self.assertEqual(UserBadge.objects.filter(user=self.user).count(), 3)
+
+    def test_query_count_does_not_grow_with_solves_or_badges(self):
+        def solve_new():
+            challenge = Challenge.objects.create(title="-", classroom=self.classroom, description="-")
+            with CaptureQueriesContext(connection) as queries:
+                earned = self.solve(challenge)
+            return earned, len(queries)
+
+        self.complete.delete()
+        solve_new()
+        earned, few = solve_new()
+        self.assertEqual(earned, [self.two])
+
+        for n in range(20):
+            solve_new()
+            Badge.objects.create(name=f"N{n}", description="-", requirement_type=Badge.CHALLENGE_COUNT, value=100 + n)
+        many_solves = Badge.objects.create(name="23", description="-", requirement_type=Badge.CHALLENGE_COUNT, value=23)
+        earned, many = solve_new()
+        self.assertEqual(earned, [many_solves])
+        self.assertEqual(many, few)
+
+    def test_refresh_revokes_badges_no_longer_earned(self):
+        self.solve(self.challenges[0])
+        self.solve(self.challenges[1])
+        Submission.objects.filter(challenge=self.challenges[1]).update(status="failed")
+        self.assertEqual(badges.refresh_users([self.user.id]), (0, 1))
+        self.assertEqual(list(UserBadge.objects.filter(user=self.user).values_list("badge", flat=True)),
+                         [self.first.id])
+        self.assertEqual(SolveCount.objects.get(user=self.user).solved, 1)
+
+
+# ---------- USER STATS ----------
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("student")
+        Profile.objects.get_or_create(user=self.user)
+        UserStats.objects.get_or_create(user=self.user)
+        self.classroom = Classroom.objects.create(name="Class", mentor=self.user)
+        self.tag = Tag.objects.create(name="loops")
+
+    def judged(self, status, difficulty="easy"):
+        challenge = Challenge.objects.create(title="-", classroom=self.classroom, description="-",
+                                             difficulty=difficulty)
+        challenge.tags.add(self.tag)
+        points = 10 if status == "passed" else 0
+        submission = Submission.objects.create(user=self.user, challenge=challenge, code="-", status=status,
+                                               points_awarded=points)
+        with CaptureQueriesContext(connection) as queries:
+            stats.record_judged(submission, status == "passed", points)
+        return len(queries)
+
+    def test_record_matches_a_rebuild(self):
+        for status, difficulty in [("passed", "easy"), ("passed", "hard"), ("wrong_answer", "easy")]:
+            self.judged(status, difficulty)
+        recorded = UserStats.objects.get(user=self.user)
+        stats.rebuild([self.user.id])
+        rebuilt = UserStats.objects.get(user=self.user)
+        for field in ["solved_count", "easy_solved", "hard_solved", "solved_by_tag", "points", "attempts",
+                      "last_solved_at"]:
+            self.assertEqual(getattr(recorded, field), getattr(rebuilt, field), field)
+        self.assertEqual((rebuilt.solved_count, rebuilt.solved_by_tag), (2, {str(self.tag.id): 2}))
+
+    def test_query_count_does_not_grow_with_history(self):
+        first = self.judged("passed")
+        for _ in range(20):
+            self.judged("passed")
+            self.judged("wrong_answer")
+        self.assertEqual(self.judged("passed"), first)
+
+    def test_profile_query_count_does_not_grow_with_history(self):
+        self.client.force_login(self.user)
+        self.judged("passed")
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse("profile"))
+        for _ in range(20):
+            self.judged("passed")
+            self.judged("wrong_answer")
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse("profile"))
+        self.assertEqual(response.context["solved_count"], 21)
+        self.assertEqual(len(many), len(few))
+
+
+# ---------- CHALLENGE PROGRESS ----------
+
+class ChallengeProgressTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("student")
+        Profile.objects.get_or_create(user=self.user)
+        self.classroom = Classroom.objects.create(name="Class", mentor=self.user)
+        ClassroomMembership.objects.create(user=self.user, classroom=self.classroom)
+
+    def add_challenge(self):
+        number = Challenge.objects.count() + 1
+        challenge = Challenge.objects.create(title=f"Challenge {number}", classroom=self.classroom, description="-")
+        challenge.tags.add(Tag.objects.get_or_create(name="loops")[0])
+        return challenge
+
+    def judged(self, challenge, status):
+        stats.record_progress(Submission.objects.create(user=self.user, challenge=challenge, code="-", status=status))
+
+    def test_progress_only_moves_forward(self):
+        challenge, untried = self.add_challenge(), self.add_challenge()
+        self.judged(challenge, "wrong_answer")
+        self.assertEqual(stats.challenge_statuses(self.user, [challenge])[challenge.id], "in_progress")
+        self.judged(challenge, "passed")
+        self.judged(challenge, "wrong_answer")
+        self.assertEqual(stats.challenge_statuses(self.user, [challenge, untried]),
+                         {challenge.id: "passed", untried.id: "not_started"})
+
+    def test_classroom_page_query_count_does_not_grow_with_challenges(self):
+        self.client.force_login(self.user)
+        url = reverse("classroom_detail", args=[self.classroom.slug])
+
+        def load():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            return response, len(queries)
+
+        self.judged(self.add_challenge(), "passed")
+        _, few = load()
+        for _ in range(30):
+            challenge = self.add_challenge()
+            self.judged(challenge, "passed")
+            self.judged(challenge, "wrong_answer")
+        self.add_challenge()
+        response, many = load()
+        self.assertEqual((response.context["completed_count"], response.context["progress_percent"]), (31, 97))
+        self.assertEqual(many, few)
+
+
+# ---------- REJUDGE QUEUE ----------
+
+@override_settings(JUDGE_POOL_SIZE=0)
+class IncrementalRejudgeTests(TestCase):
+    def setUp(self):
+        caches["judge"].clear()
+        self.user = User.objects.create_user("student")
+        classroom = Classroom.objects.create(name="Class", mentor=self.user)
+        self.challenge = Challenge.objects.create(title="Double", classroom=classroom, description="-", points=10,
+                                                  fail_fast=False)
+        self.tests = [{"input": "1", "output": "2"}, {"input": "2", "output": "4"}]
+        self.challenge.set_tests(self.tests)
+        Profile.objects.get_or_create(user=self.user)
+        UserStats.objects.get_or_create(user=self.user)
+        # right for small numbers only
+        self.submission = Submission.objects.create(
+            user=self.user, challenge=self.challenge, code="n = int(input())\nprint(n * 2 if n < 10 else 0)",
+            status="judging",
+        )
+        judge.judge_submission(self.submission)
+
+    def test_unchanged_tests_run_nothing(self):
+        stats = rejudge.rejudge_challenge(self.challenge)
+        self.assertEqual((stats["unchanged"], stats["tests_run"]), (1, 0))
+
+    def test_only_new_tests_run(self):
+        self.challenge.set_tests(self.tests + [{"input": "3", "output": "6"}])
+        stats = rejudge.rejudge_challenge(self.challenge)
+        self.assertEqual((stats["rejudged"], stats["tests_run"]), (1, 1))
+        self.submission.refresh_from_db()
+        self.assertEqual((self.submission.status, len(self.submission.results)), ("passed", 3))
+
+    def test_a_failing_new_test_takes_the_points_back(self):
+        self.challenge.set_tests(self.tests + [{"input": "50", "output": "100"}])
+        stats = rejudge.rejudge_challenge(self.challenge)
+        self.assertEqual((stats["no_longer_passing"], stats["tests_run"], stats["points_change"]), (1, 1, -10))
+        self.assertEqual(Profile.objects.get(user=self.user).points, 0)
+        self.assertEqual(UserStats.objects.get(user=self.user).solved_count, 0)
+
+    def test_full_rejudge_runs_every_test(self):
+        stats = rejudge.rejudge_challenge(self.challenge, full=True)
+        self.assertEqual(stats["tests_run"], 2)
+
+
+@override_settings(JUDGE_POOL_SIZE=0)
+class RejudgeQueueTests(TestCase):
+    def setUp(self):
+        caches["judge"].clear()
+        self.user = User.objects.create_user("student")
+        classroom = Classroom.objects.create(name="Class", mentor=self.user)
+        self.challenge = Challenge.objects.create(title="Echo", classroom=classroom, description="-")
+        self.challenge.set_tests([{"input": "1", "output": "1"}])
+        self.submission = Submission.objects.create(
+            user=self.user, challenge=self.challenge, code="print(input())", status="failed",
+        )
+
+    def test_admin_action_only_queues(self):
+        from .admin import ChallengeAdmin
+        from django.contrib.admin.sites import site
+
+        admin = ChallengeAdmin(Challenge, site)
+        admin.message_user = lambda *args, **kwargs: None
+        request = type("Request", (), {"user": self.user})()
+        admin.rejudge_submissions(request, Challenge.objects.all())
+
+        self.assertEqual(RejudgeRequest.objects.get().status, "pending")
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.status, "failed")
+
+    def test_worker_runs_queued_rejudges_and_submissions(self):
+        rejudge.enqueue([self.challenge])
+        queued = Submission.objects.create(
+            user=self.user, challenge=self.challenge, code="print(2)", status="pending",
+        )
+        call_command("judge_worker", once=True, stdout=io.StringIO())
+
+        request = RejudgeRequest.objects.get()
+        self.assertEqual(request.status, "done", request.summary)
+        self.submission.refresh_from_db()
+        queued.refresh_from_db()
+        self.assertEqual(self.submission.status, "passed")
+        self.assertEqual(queued.status, "failed")
+
+    def test_failed_submission_is_logged(self):
+        with mock.patch.object(rejudge, "_judge_again", side_effect=RuntimeError("boom")):
+            with self.assertLogs("my_app.rejudge", "ERROR") as logs:
+                stats = rejudge.rejudge_challenge(self.challenge)
+        self.assertEqual(stats["errors"], 1)
+        self.assertIn(f"#{self.submission.id}", logs.output[0])
+        self.assertIn("RuntimeError: boom", logs.output[0])
+
+    def test_stale_request_is_requeued(self):
+        request = rejudge.enqueue([self.challenge])[0]
+        self.assertEqual(rejudge.claim_next_request().id, request.id)
+        self.assertIsNone(rejudge.claim_next_request())
+        RejudgeRequest.objects.filter(id=request.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(rejudge.requeue_stale_requests(timedelta(minutes=5)), 1)
+        self.assertEqual(rejudge.claim_next_request().id, request.id)
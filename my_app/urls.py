@@ -21,8 +21,14 @@ urlpatterns = [
     # submit code
     path("challenge/<slug:challenge_slug>/submit/",views.challenge_submit,name="challenge_submit",),
 
+    # poll a queued submission
+    path("challenge/<slug:challenge_slug>/submissions/<int:submission_id>/status/",views.submission_status,name="submission_status",),
+
     # run tests
     path("challenge/<slug:challenge_slug>/run-tests/",views.run_tests_view,name="run_tests",),
+    path("challenge/<slug:challenge_slug>/run-tests/stream/",views.run_tests_stream,name="run_tests_stream",),
+
+    path("judge/metrics/", views.judge_metrics, name="judge_metrics"),
 
     path("leaderboard/", views.leaderboard_page, name="leaderboard"),
     path("leaderboard/classroom/<int:classroom_id>/",views.leaderboard_page,name="classroom_leaderboard",),
@@ -33,6 +39,7 @@ urlpatterns = [
     path("classrooms/", views.classrooms_page, name="classrooms_page"),
     path("mentor/classrooms/create/",views.mentor_create_classroom,name="mentor_create_classroom",),
     path("mentor/classrooms/<slug:classroom_slug>/challenges/create/", views.mentor_create_challenge,name="mentor_create_challenge",),
+    path("mentor/classrooms/<slug:classroom_slug>/judge-weight/", views.mentor_set_judge_weight,name="mentor_set_judge_weight",),
     path("classroom/<slug:slug>/", views.classroom_detail, name="classroom_detail"),
     path("classroom/<slug:slug>/join/", views.join_classroom, name="join_classroom"),
     path("classroom/<slug:slug>/leave/", views.leave_classroom, name="leave_classroom"),
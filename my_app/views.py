@@ -1,6 +1,6 @@
 from django.core.cache import cache
 from django.shortcuts import render, redirect, get_object_or_404
-from . import models
+from . import admission, models, judge, leaderboard, stats
 from .models import (
     Classroom,
     ClassroomMembership,
@@ -9,19 +9,21 @@ from .models import (
     Profile,
     Submission,
     Comment,
-    check_user_badges,
-    User
+    User,
+    UserStats,
 )
 from django.contrib import messages
 from django.db.models import Count, Q, Sum, F, Value, IntegerField
 from .decorators import staff_or_superuser_required
 from django.contrib.auth import login as auth_login, logout as auth_logout
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 from datetime import timedelta
 from django.views import View
 from django.core.paginator import Paginator
+import os
 import json
 import traceback
 from django.conf import settings
@@ -90,22 +92,10 @@ def dashboard(request):
     if not request.user.is_authenticated:
         return render(request, "not_found.html")
 
-    total_solved = (
-        Submission.objects.filter(
-            user=request.user,
-            status="passed",
-        )
-        .values("challenge")
-        .distinct()
-        .count()
-    )
-
-    # total points from passed submissions
-    total_points = (
-        Submission.objects.filter(user=request.user, status="passed")
-        .aggregate(Sum("points_awarded"))["points_awarded__sum"]
-        or 0
-    )
+    # solved challenges and points, kept up to date by the judge (stats.py)
+    user_stats = stats.for_user(request.user)
+    total_solved = user_stats.solved_count
+    total_points = user_stats.points
 
     # classrooms the user joined
     my_classrooms = (
@@ -124,7 +114,7 @@ def dashboard(request):
         .order_by("-created_at")[:5]
     )
 
-    global_rank = None
+    global_rank = leaderboard.rank(leaderboard.GLOBAL, request.user.id)
 
     context = {
         "user": request.user,
@@ -149,22 +139,10 @@ def profile_page(request, username=None):
             username=username,
         )
 
-    # 2) Total points
-    total_points_data = (
-        Submission.objects
-        .filter(user=profile_user, status="passed")
-        .aggregate(total=Sum("challenge__points"))
-    )
-    total_points = total_points_data["total"] or 0
-
-    # 3) Challenges solved
-    solved_count = (
-        Submission.objects
-        .filter(user=profile_user, status="passed")
-        .values("challenge_id")
-        .distinct()
-        .count()
-    )
+    # 2) Total points and 3) challenges solved (see stats.py)
+    user_stats = stats.for_user(profile_user)
+    total_points = user_stats.points
+    solved_count = user_stats.solved_count
 
     # 4) Recent submissions
     recent_submissions = (
@@ -178,23 +156,22 @@ def profile_page(request, username=None):
     profile = profile_user.profile
     badges = profile_user.badges.all()
 
-    # 6) Skills (based on tags of passed submissions)
+    # 6) Skills (challenges solved per tag)
     skills = []
-    tag_stats = (
-        Submission.objects
-        .filter(user=profile_user, status="passed", challenge__tags__isnull=False)
-        .values("challenge__tags__id", "challenge__tags__name")
-        .annotate(solved_count=Count("id"))
-        .order_by("-solved_count")
+    tag_names = dict(Tag.objects.filter(id__in=user_stats.solved_by_tag).values_list("id", "name"))
+    tag_stats = sorted(
+        ((count, tag_names[int(tag_id)]) for tag_id, count in user_stats.solved_by_tag.items()
+         if int(tag_id) in tag_names and count),
+        key=lambda row: -row[0],
     )
 
-    max_count = tag_stats[0]["solved_count"] if tag_stats else 0
-    for row in tag_stats[:6]:
-        percentage = int(row["solved_count"] / max_count * 100) if max_count else 0
+    max_count = tag_stats[0][0] if tag_stats else 0
+    for count, name in tag_stats[:6]:
+        percentage = int(count / max_count * 100) if max_count else 0
         skills.append({
-            "name": row["challenge__tags__name"],
+            "name": name,
             "percentage": percentage,
-            "solved_count": row["solved_count"],
+            "solved_count": count,
         })
 
     context = {
@@ -365,12 +342,43 @@ def mentor_create_classroom(request):
         name=name,
         description=description,
         mentor=request.user,
+        judge_weight=posted_judge_weight(request) or 1,
     )
 
     messages.success(request, "Classroom created successfully.")
     return redirect("classrooms_page")
 
 
+def posted_judge_weight(request):
+    # mentors pick 1..JUDGE_MAX_CLASSROOM_WEIGHT, anything more is for the admin
+    try:
+        weight = int(request.POST.get("judge_weight", ""))
+    except ValueError:
+        return None
+    return min(max(weight, 1), settings.JUDGE_MAX_CLASSROOM_WEIGHT)
+
+
+@login_required
+@require_POST
+def mentor_set_judge_weight(request, classroom_slug):
+    classroom = get_object_or_404(Classroom, slug=classroom_slug)
+
+    if classroom.mentor != request.user and not request.user.is_superuser:
+        messages.error(request, "You are not allowed to change this classroom.")
+        return redirect("classroom_detail", classroom.slug)
+
+    weight = posted_judge_weight(request)
+    if weight is None:
+        messages.error(request, "Judge priority must be a number.")
+        return redirect("classroom_detail", classroom.slug)
+
+    classroom.judge_weight = weight
+    classroom.save(update_fields=["judge_weight", "updated_at"])
+
+    messages.success(request, "Judge priority updated.")
+    return redirect("classroom_detail", classroom.slug)
+
+
 def classrooms_page(request):
     if not request.user.is_authenticated:
         return render(request, "not_found.html")
@@ -379,10 +387,7 @@ def classrooms_page(request):
         user=request.user
     ).count()
 
-    total_completed_challenges = Submission.objects.filter(
-        user=request.user,
-        status='passed'
-    ).values("challenge").distinct().count()
+    total_completed_challenges = stats.for_user(request.user).solved_count
 
     # ---------- Mentor view ----------
     if request.user.is_staff:
@@ -420,6 +425,7 @@ def classrooms_page(request):
             "mentor_avg_completion": mentor_avg_completion,
             "joined_classrooms_count": joined_classrooms_count,
             "total_completed_challenges": total_completed_challenges,
+            "max_judge_weight": settings.JUDGE_MAX_CLASSROOM_WEIGHT,
         }
 
     # ---------- Student view ----------
@@ -454,18 +460,19 @@ def classroom_detail(request, slug=None):
         classroom=classroom,
     ).exists()
 
-    challenges = classroom.challenges.all().prefetch_related("tags", "submissions")
+    challenges = list(classroom.challenges.all().prefetch_related("tags"))
+    statuses = stats.challenge_statuses(request.user, challenges)
 
     challenge_entries = []
     completed_count = 0
 
     for ch in challenges:
-        status = get_user_challenge_status(request.user, ch)
+        status = statuses[ch.id]
         challenge_entries.append({"challenge": ch, "status": status})
         if status == "passed":
             completed_count += 1
 
-    total_challenges = challenges.count()
+    total_challenges = len(challenges)
 
     progress_percent = 0
     if total_challenges:
@@ -480,6 +487,7 @@ def classroom_detail(request, slug=None):
         "challenge_entries": challenge_entries,
         "completed_count": completed_count,
         "progress_percent": progress_percent,
+        "max_judge_weight": settings.JUDGE_MAX_CLASSROOM_WEIGHT,
     }
     return render(request, "classroom_details.html", context)
 
@@ -525,19 +533,6 @@ def leave_classroom(request, slug):
 
 # ------------ CHALLENGES ------------
 
-def get_user_challenge_status(user, challenge):
-    qs = challenge.submissions.filter(user=user)
-
-    if not qs.exists():
-        return "not_started"
-
-    if qs.filter(status="passed").exists():
-        return "passed"
-
-    # has submissions but none passed
-    return "in_progress"
-
-
 def challenge_list(request):
     if not request.user.is_authenticated:
         return redirect("login")
@@ -624,34 +619,60 @@ def leaderboard_page(request):
             created_at__gte=now - timedelta(days=30)
         )
 
-    profiles = profiles.annotate(
-        total_points=F("points"),
-        solved_count=Count(
+    if selected_time == "all":
+        # all-time counts are kept per user (stats.py)
+        solved_count = Coalesce(F("user__stats__solved_count"), Value(0))
+    else:
+        solved_count = Count(
             "user__submissions",
             filter=Q(user__submissions__in=solved_submissions),
             distinct=True,
-        ),
+        )
+
+    profiles = profiles.annotate(
+        total_points=F("points"),
+        solved_count=solved_count,
         badges_count=Count("user__userbadge", distinct=True),
         streak=Value(0, output_field=IntegerField()),
     )
 
-    if selected_sort == "challenges":
-        profiles = profiles.order_by("-solved_count", "-points", "user__username")
-    elif selected_sort == "streak":
-        profiles = profiles.order_by("-streak", "-points", "user__username")
-    else:
-        profiles = profiles.order_by("-points", "-solved_count", "user__username")
-
-    leaderboard = list(profiles)
-
     user_rank = None
     user_points = 0
 
-    for idx, p in enumerate(leaderboard, start=1):
-        if p.user_id == request.user.id:
-            user_rank = idx
-            user_points = p.points
-            break
+    if selected_time == "all" and selected_sort not in ("challenges", "streak"):
+        # all-time points: ranked in the database (leaderboard.py), only the rows
+        # shown are loaded
+        scope = leaderboard.GLOBAL if selected_classroom == "all" else classroom_id
+        entries = leaderboard.top(scope, settings.LEADERBOARD_SIZE)
+        user_rank = leaderboard.rank(scope, request.user.id)
+        if user_rank and user_rank > len(entries):
+            shown = len(entries)
+            entries += [entry for entry in leaderboard.neighbors(scope, request.user.id) if entry.rank > shown]
+        rows = profiles.in_bulk([entry.user_id for entry in entries], field_name="user_id")
+        board = []
+        for i, entry in enumerate(entries):
+            profile = rows.get(entry.user_id)
+            if profile is None:
+                continue
+            profile.rank = entry.rank
+            profile.gap_before = i > 0 and entry.rank > entries[i - 1].rank + 1
+            board.append(profile)
+            if entry.user_id == request.user.id:
+                user_points = entry.points
+    else:
+        if selected_sort == "challenges":
+            profiles = profiles.order_by("-solved_count", "-points", "user__username")
+        elif selected_sort == "streak":
+            profiles = profiles.order_by("-streak", "-points", "user__username")
+        else:
+            profiles = profiles.order_by("-points", "-solved_count", "user__username")
+
+        board = list(profiles)
+        for idx, p in enumerate(board, start=1):
+            p.rank = idx
+            if p.user_id == request.user.id:
+                user_rank = idx
+                user_points = p.points
 
     week_start = now - timedelta(days=7)
     user_points_week = Submission.objects.filter(
@@ -661,7 +682,7 @@ def leaderboard_page(request):
     ).count()
 
     context = {
-        "leaderboard": leaderboard,
+        "leaderboard": board,
         "classrooms": classrooms,
         "selected_time": selected_time,
         "selected_classroom": (
@@ -733,7 +754,7 @@ class ChallengeDetailView(View):
         last_submission = submissions.first()
         editor_code = last_submission.code if last_submission else ""
 
-        challenge_status = get_user_challenge_status(request.user, challenge)
+        challenge_status = stats.challenge_statuses(request.user, [challenge])[challenge.id]
 
         comments_qs = challenge.comments.all().order_by("-created_at")
 
@@ -748,123 +769,143 @@ class ChallengeDetailView(View):
             "comments": page_obj,
             "page_obj": page_obj,
             "challenge_status": challenge_status,
+            "languages": judge.available_languages(),
+            "editor_language": last_submission.language if last_submission else "python",
         }
         return render(request, "challenge_details.html", context)
 
 
+def posted_language(request):
+    language = request.POST.get("language", "python")
+    valid_languages = {choice[0] for choice in Submission.LANGUAGE_CHOICES}
+    if language not in valid_languages:
+        language = "python"
+    return language
+
+
+def busy_response(busy):
+    response = JsonResponse({"error": str(busy), "retry_after": busy.retry_after}, status=429)
+    response["Retry-After"] = str(busy.retry_after)
+    return response
+
+
+def ndjson_response(slot, events):
+    # one JSON line per judge event, sent as soon as it happens; the
+    # admission slot is held until the last one is out
+    response = StreamingHttpResponse(
+        admission.HoldingIterator(slot, (json.dumps(event) + "\n" for event in events)),
+        content_type="application/x-ndjson",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # tell nginx not to hold the stream back
+    return response
+
+
 @require_POST
 def challenge_submit(request, challenge_slug):
     if not request.user.is_authenticated:
         return JsonResponse({"error": "Not authenticated"}, status=403)
 
-    challenge = get_object_or_404(Challenge, slug=challenge_slug)
+    challenge = get_object_or_404(Challenge.objects.select_related("classroom"), slug=challenge_slug)
 
     user_code = (request.POST.get("code") or "").strip()
-    language = request.POST.get("language", "python")
+    language = posted_language(request)
 
     if not user_code:
         return JsonResponse({"error": "Code is required"}, status=400)
 
-    valid_languages = {choice[0] for choice in Submission.LANGUAGE_CHOICES}
-    if language not in valid_languages:
-        language = "python"
-
-    tests = challenge.hidden_tests or []
-
-    previous_attempts = Submission.objects.filter(
-        user=request.user,
-        challenge=challenge,
-    ).count()
-    attempt_number = previous_attempts + 1
-
-    submission = Submission.objects.create(
-        user=request.user,
-        challenge=challenge,
-        code=user_code,
-        language=language,
-        status="pending",
-        attempt_number=attempt_number,
-    )
+    def create_submission(status):
+        # "pending" queues it for judge_worker; one judged in the request is
+        # "judging" from the start, so a worker never claims it too
+        previous_attempts = Submission.objects.filter(
+            user=request.user,
+            challenge=challenge,
+        ).count()
+        attempt_number = previous_attempts + 1
 
-    results = []
-
-    if not tests:
-        # No hidden tests configured — just check the code runs without error
-        ok, output = run_python_code(user_code, "")
-        all_passed = ok
-        results = [{
-            "input": "",
-            "expected": "(no hidden tests)",
-            "user_output": output if ok else output,
-            "passed": ok,
-        }]
-    else:
-        all_passed = True
-        for test in tests:
-            test_input = test.get("input", "")
-            expected_output = (test.get("output", "") or "").strip()
+        return Submission.objects.create(
+            user=request.user,
+            challenge=challenge,
+            code=user_code,
+            language=language,
+            status=status,
+            attempt_number=attempt_number,
+        )
 
-            ok, actual_output = run_python_code(user_code, test_input)
-            actual_output = (actual_output or "").strip()
+    # admitted before the submission exists, so a 429 leaves nothing behind
+    if settings.JUDGE_ASYNC_SUBMISSIONS:
+        try:
+            admission.check_queue(request.user, challenge.classroom_id)
+        except admission.JudgeBusy as busy:
+            return busy_response(busy)
+
+        # judged later by the judge_worker command; the editor polls submission_status
+        submission = create_submission("pending")
+        return JsonResponse({
+            "status": submission.status,
+            "results": [],
+            "submission_id": submission.id,
+            "attempt_number": submission.attempt_number,
+            "points_awarded": 0,
+            "status_url": reverse("submission_status", args=[challenge.slug, submission.id]),
+        }, status=202)
 
-            passed = ok and (actual_output == expected_output)
+    try:
+        slot = admission.admit(request, judge.classroom_share(challenge))
+    except admission.JudgeBusy as busy:
+        return busy_response(busy)
+
+    # Judged in the request and streamed like run_tests_stream; the "done"
+    # line carries the saved verdict (see judge.iter_judge_submission).
+    def events():
+        judging = judge.iter_judge_submission(create_submission("judging"))
+        try:
+            for event in judging:
+                yield event
+        finally:
+            # the verdict is saved even if the editor stopped reading
+            for _ in judging:
+                pass
 
-            results.append({
-                "input": test_input,
-                "expected": expected_output,
-                "user_output": actual_output,
-                "passed": passed,
-            })
+    return ndjson_response(slot, events())
 
-            if not passed:
-                all_passed = False
 
-    submission.status = "passed" if all_passed else "failed"
-    submission.save(update_fields=["status"])
+def submission_status(request, challenge_slug, submission_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Not authenticated"}, status=403)
 
-    points_awarded = award_points_for_submission(submission)
-    if submission.status == "passed":
-        check_user_badges(request.user)
+    submission = get_object_or_404(
+        Submission,
+        id=submission_id,
+        challenge__slug=challenge_slug,
+        user=request.user,
+    )
 
     return JsonResponse({
         "status": submission.status,
-        "results": results,
+        "done": submission.status not in ("pending", "judging"),
+        "results": submission.results,
         "submission_id": submission.id,
         "attempt_number": submission.attempt_number,
-        "points_awarded": points_awarded,
+        "points_awarded": submission.points_awarded,
     })
 
 
 @require_POST
 def run_tests_view(request, challenge_slug):
-    challenge = get_object_or_404(Challenge, slug=challenge_slug)
-    user_code = (request.POST.get("code") or "").strip()
-    tests = challenge.hidden_tests or []
-
-    results = []
-    all_passed = True
-
-    for test in tests:
-        test_input = test.get("input", "")
-        expected = (test.get("output", "") or "").strip()
-
-        ok, output = run_python_code(user_code, test_input)
-        output = (output or "").strip()
-
-        passed = ok and (output == expected)
-        if not passed:
-            all_passed = False
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Not authenticated"}, status=403)
 
-        results.append(
-            {
-                "input": test_input,
-                "expected": expected,
-                "user_output": output,
-                "passed": passed,
-            }
-        )
+    challenge = get_object_or_404(Challenge.objects.select_related("classroom"), slug=challenge_slug)
+    user_code = (request.POST.get("code") or "").strip()
+    language = posted_language(request)
 
-    status = "passed" if all_passed else "failed"
+    try:
+        slot = admission.admit(request, judge.classroom_share(challenge), lane="interactive")
+    except admission.JudgeBusy as busy:
+        return busy_response(busy)
+    with slot:
+        status, results = judge.judge_challenge(challenge, user_code, language, lane="interactive")
 
     return JsonResponse(
         {
@@ -874,90 +915,42 @@ def run_tests_view(request, challenge_slug):
     )
 
 
-def run_python_code(user_code: str, test_input: str):
-    import builtins
-
-    input_lines = test_input.splitlines()
-    pointer = 0
-
-    def fake_input(prompt=None):
-        nonlocal pointer
-        if pointer < len(input_lines):
-            value = input_lines[pointer]
-            pointer += 1
-            return value
-        return ""
-
-    output_lines = []
-
-    def fake_print(*args, sep=" ", end="\n", **kwargs):
-        text = sep.join(str(a) for a in args)
-        output_lines.append(text)
-
-    # Expose all safe builtins so student code can use list, dict, map, etc.
-    safe_builtins = {
-        k: getattr(builtins, k)
-        for k in dir(builtins)
-        if not k.startswith("_")
-        and k not in ("open", "exec", "eval", "compile", "__import__", "breakpoint", "exit", "quit")
-    }
-    safe_builtins["input"] = fake_input
-    safe_builtins["print"] = fake_print
+@require_POST
+def run_tests_stream(request, challenge_slug):
+    # Same as run_tests_view, but each test's result is sent as one NDJSON
+    # line the moment it is judged (see judge.iter_judge_tests).
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Not authenticated"}, status=403)
 
-    env = {"__builtins__": safe_builtins}
+    challenge = get_object_or_404(Challenge.objects.select_related("classroom"), slug=challenge_slug)
+    user_code = (request.POST.get("code") or "").strip()
+    language = posted_language(request)
 
     try:
-        exec(user_code, env)
-    except Exception as e:
-        return False, f"__ERROR__ {type(e).__name__}: {e}"
-
-    return True, "\n".join(output_lines)
-
+        slot = admission.admit(request, judge.classroom_share(challenge), lane="interactive")
+    except admission.JudgeBusy as busy:
+        return busy_response(busy)
 
-def award_points_for_submission(submission):
-    # 1) Only passed submissions can get points
-    if submission.status != "passed":
-        if submission.points_awarded != 0:
-            submission.points_awarded = 0
-            submission.save(update_fields=["points_awarded"])
-        return 0
+    events = judge.iter_judge_challenge(challenge, user_code, language, lane="interactive")
+    return ndjson_response(slot, events)
 
-    # 2) Check if this user already got points for THIS challenge
-    from .models import Submission, Profile
 
-    already_rewarded = Submission.objects.filter(
-        user=submission.user,
-        challenge=submission.challenge,
-        status="passed",
-        points_awarded__gt=0,
-    ).exclude(id=submission.id).exists()
-
-    if already_rewarded:
-        if submission.points_awarded != 0:
-            submission.points_awarded = 0
-            submission.save(update_fields=["points_awarded"])
-        return 0
-
-    # 3) First time solving this challenge successfully → award points
-    challenge_points = submission.challenge.points
-
-    submission.points_awarded = challenge_points
-    submission.save(update_fields=["points_awarded"])
-
-    profile, _ = Profile.objects.get_or_create(user=submission.user)
-    profile.points = (profile.points or 0) + challenge_points
-    profile.save(update_fields=["points"])
-
-    return challenge_points
+@staff_or_superuser_required
+def judge_metrics(request):
+    # Queue depth and wait times per judge lane. Every web process has its
+    # own pool and lanes: this is the one that answered.
+    return JsonResponse({"pid": os.getpid(), "schedulers": judge.scheduler_metrics()})
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
+        UserStats.objects.create(user=instance)
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, "profile"):
-        instance.profile.save()
+        # not points: this copy may be stale, points only move by F() increments
+        instance.profile.save(update_fields=["level", "role"])